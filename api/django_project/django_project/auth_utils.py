@@ -1,13 +1,88 @@
-import json
 from functools import wraps
 
 import jwt
-import requests
 from django.contrib.auth import authenticate
 from django.http import JsonResponse
-from jwt import algorithms
+from pydantic import BaseModel
+from rest_framework_jwt.authentication import JSONWebTokenAuthentication
+
+from django_project.jwks import JWKSKeyStore
+from django_project.settings import (
+    AUTH0_DOMAIN,
+    AUTH0_IDENTIFIER,
+    AUTH0_JWKS_FETCH_TIMEOUT_SECONDS,
+    AUTH0_JWKS_MIN_REFETCH_SECONDS,
+    AUTH0_JWKS_TTL_SECONDS,
+)
+from rest_api.repositories.utils import resolve_user_identity
+
+jwks_key_store = JWKSKeyStore(
+    jwks_url=AUTH0_DOMAIN + ".well-known/jwks.json",
+    ttl=AUTH0_JWKS_TTL_SECONDS,
+    min_refetch_interval=AUTH0_JWKS_MIN_REFETCH_SECONDS,
+    fetch_timeout=AUTH0_JWKS_FETCH_TIMEOUT_SECONDS,
+)
+
+
+class AuthContext(BaseModel):
+    token: str
+    claims: dict
+    scopes: tuple[str, ...]
+    org_id: str | None
+    user_id: int | None
+    patient_id: int | None
+    staff_id: int | None
+    practice_id: int | None
+
+    class Config:
+        frozen = True
+
+
+def build_auth_context(token: str, claims: dict, user_id: int | None) -> AuthContext:
+    org_id = claims.get("org_id", None)
+    patient_id, staff_id, practice_id = resolve_user_identity(
+        user_id=user_id, org_id=org_id
+    )
+    return AuthContext(
+        token=token,
+        claims=claims,
+        scopes=tuple(claims.get("scope", "").split()),
+        org_id=org_id,
+        user_id=user_id,
+        patient_id=patient_id,
+        staff_id=staff_id,
+        practice_id=practice_id,
+    )
+
+
+class AuthContextJSONWebTokenAuthentication(JSONWebTokenAuthentication):
+    """Verifies the bearer token once and exposes an AuthContext as request.auth"""
+
+    def authenticate_credentials(self, payload):
+        self.payload = payload
+        return super().authenticate_credentials(payload)
 
-from django_project.settings import AUTH0_DOMAIN, AUTH0_IDENTIFIER
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is None:
+            return None
+        user, token = result
+        return user, build_auth_context(token, self.payload, user.id)
+
+
+def get_auth_context(request) -> AuthContext:
+    auth = getattr(request, "auth", None)
+    if isinstance(auth, AuthContext):
+        return auth
+
+    context = getattr(request, "_auth_context", None)
+    if context is None:
+        token = get_token_auth_header(request)
+        context = build_auth_context(
+            token, jwt_decode_token(token), getattr(request.user, "id", None)
+        )
+        request._auth_context = context
+    return context
 
 
 def jwt_get_username_from_payload_handler(payload):
@@ -18,15 +93,7 @@ def jwt_get_username_from_payload_handler(payload):
 
 def jwt_decode_token(token):
     header = jwt.get_unverified_header(token)
-    jwks = requests.get(AUTH0_DOMAIN + ".well-known/jwks.json").json()
-    public_key = None
-    for jwk in jwks["keys"]:
-        if jwk["kid"] == header["kid"]:
-            public_key = algorithms.RSAAlgorithm.from_jwk(json.dumps(jwk))
-
-    if public_key is None:
-        raise Exception("Public key not found.")
-
+    public_key = jwks_key_store.get_key(header["kid"])
     return jwt.decode(
         token,
         public_key,
@@ -54,10 +121,8 @@ def requires_scopes(required_scopes: list[str]):
     def require_scope(f):
         @wraps(f)
         def decorated(*args, **kwargs):
-            token = get_token_auth_header(args[1])
-            decoded = jwt_decode_token(token)
-            if decoded.get("scope"):
-                token_scopes = decoded["scope"].split()
+            token_scopes = get_auth_context(args[1]).scopes
+            if token_scopes:
                 scope_checks = [scope in token_scopes for scope in required_scopes]
                 if all(scope_checks):
                     return f(*args, **kwargs)
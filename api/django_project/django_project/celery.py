@@ -6,10 +6,19 @@ from pathlib import Path
 
 import django
 from celery import Celery, bootsteps
-from celery.signals import beat_init, worker_process_init, worker_ready, worker_shutdown
+from celery.signals import (
+    beat_init,
+    task_postrun,
+    task_prerun,
+    worker_process_init,
+    worker_ready,
+    worker_shutdown,
+)
 from celery_singleton import Singleton
 from opentelemetry.instrumentation.celery import CeleryInstrumentor
 
+from rest_api.utils.identity_map import begin_identity_map, end_identity_map
+
 # File for validating worker readiness
 READINESS_FILE = Path("/tmp/celery_ready")
 HEARTBEAT_FILE = Path("/tmp/celery_worker_heartbeat")
@@ -43,6 +52,9 @@ class LivenessProbe(bootsteps.StartStopStep):
 
 @worker_ready.connect
 def worker_ready_task(**_):
+    from rest_api.tasks import warm_identity_cache
+
+    warm_identity_cache.delay()
     READINESS_FILE.touch()
 
 
@@ -61,6 +73,21 @@ def beat_ready(**_):
     READINESS_FILE.touch()
 
 
+identity_map_tokens = {}
+
+
+@task_prerun.connect
+def begin_task_identity_map(task_id=None, **_):
+    identity_map_tokens[task_id] = begin_identity_map()
+
+
+@task_postrun.connect
+def end_task_identity_map(task_id=None, **_):
+    token = identity_map_tokens.pop(task_id, None)
+    if token is not None:
+        end_identity_map(token)
+
+
 app = Celery("rest_api", include=["rest_api"])
 app.steps["worker"].add(LivenessProbe)
 app.config_from_object("django.conf:settings", namespace="CELERY")
@@ -0,0 +1,108 @@
+import json
+import threading
+import time
+from typing import Any, Callable
+
+import requests
+from jwt import algorithms
+
+
+class JWKSKeyNotFound(Exception):
+    pass
+
+
+class JWKSKeyStore:
+    """In-process cache of JWKS public keys indexed by kid.
+
+    Keys are served from memory until `ttl` expires, after which the next
+    lookup returns the cached key and refreshes the set in a background
+    thread. A kid that is not cached triggers a synchronous refetch, but no
+    more often than `min_refetch_interval` so a flood of forged kids cannot
+    hammer the identity provider. Failed or slow fetches keep the previous
+    key set in place.
+    """
+
+    def __init__(
+        self,
+        jwks_url: str,
+        ttl: float = 60 * 10,
+        min_refetch_interval: float = 30,
+        fetch_timeout: float = 2,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.jwks_url = jwks_url
+        self.ttl = ttl
+        self.min_refetch_interval = min_refetch_interval
+        self.fetch_timeout = fetch_timeout
+        self.clock = clock
+        self.keys: dict[str, Any] = {}
+        self.fetched_at: float | None = None
+        self.last_attempt_at: float | None = None
+        self.fetch_count = 0
+        self._lock = threading.Lock()
+        self._refreshing = threading.Event()
+
+    def get_key(self, kid: str) -> Any:
+        key = self.keys.get(kid)
+        if key is not None:
+            if self._is_stale():
+                self._refresh_in_background()
+            return key
+
+        with self._lock:
+            key = self.keys.get(kid)
+            if key is None and self._can_refetch():
+                self._fetch()
+                key = self.keys.get(kid)
+
+        if key is None:
+            raise JWKSKeyNotFound("Public key not found.")
+        return key
+
+    def clear(self) -> None:
+        with self._lock:
+            self.keys = {}
+            self.fetched_at = None
+            self.last_attempt_at = None
+
+    def _is_stale(self) -> bool:
+        return self.fetched_at is None or self.clock() - self.fetched_at >= self.ttl
+
+    def _can_refetch(self) -> bool:
+        return (
+            self.last_attempt_at is None
+            or self.clock() - self.last_attempt_at >= self.min_refetch_interval
+        )
+
+    def _refresh_in_background(self) -> None:
+        if self._refreshing.is_set():
+            return
+        self._refreshing.set()
+        threading.Thread(target=self._background_refresh, daemon=True).start()
+
+    def _background_refresh(self) -> None:
+        try:
+            with self._lock:
+                if self._is_stale() and self._can_refetch():
+                    self._fetch()
+        finally:
+            self._refreshing.clear()
+
+    def _fetch(self) -> None:
+        self.last_attempt_at = self.clock()
+        self.fetch_count += 1
+        try:
+            response = requests.get(self.jwks_url, timeout=self.fetch_timeout)
+            response.raise_for_status()
+            jwks = response.json()
+        except (requests.RequestException, ValueError):
+            return
+
+        keys = {}
+        for jwk in jwks.get("keys", []):
+            if "kid" not in jwk:
+                continue
+            keys[jwk["kid"]] = algorithms.RSAAlgorithm.from_jwk(json.dumps(jwk))
+
+        self.keys = keys
+        self.fetched_at = self.clock()
@@ -0,0 +1,100 @@
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt import algorithms
+
+
+class LocalJWKSServer:
+    """Stand-in for the Auth0 JWKS endpoint, served from a local thread."""
+
+    def __init__(self, latency: float = 0):
+        self.latency = latency
+        self.request_count = 0
+        self.private_keys: dict[str, rsa.RSAPrivateKey] = {}
+        self.rotate()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def issuer(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/"
+
+    @property
+    def jwks_url(self) -> str:
+        return self.issuer + ".well-known/jwks.json"
+
+    @property
+    def current_kid(self) -> str:
+        return list(self.private_keys.keys())[-1]
+
+    def rotate(self, keep_previous: bool = False) -> str:
+        kid = str(uuid.uuid4())
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        if not keep_previous:
+            self.private_keys = {}
+        self.private_keys[kid] = key
+        return kid
+
+    def jwks(self) -> dict:
+        keys = []
+        for kid, key in self.private_keys.items():
+            jwk = json.loads(algorithms.RSAAlgorithm.to_jwk(key.public_key()))
+            jwk.update({"kid": kid, "use": "sig", "alg": "RS256"})
+            keys.append(jwk)
+        return {"keys": keys}
+
+    def mint_token(self, audience: str, claims: dict | None = None) -> str:
+        payload = {
+            "sub": "auth0|test-user",
+            "aud": audience,
+            "iss": self.issuer,
+            "iat": int(time.time()),
+            "exp": int(time.time()) + 60 * 60,
+            **(claims or {}),
+        }
+        return jwt.encode(
+            payload,
+            self.private_keys[self.current_kid],
+            algorithm="RS256",
+            headers={"kid": self.current_kid},
+        )
+
+    def start(self) -> "LocalJWKSServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stand_in.request_count += 1
+                if stand_in.latency:
+                    time.sleep(stand_in.latency)
+                body = json.dumps(stand_in.jwks()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
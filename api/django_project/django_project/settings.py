@@ -60,6 +60,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.RemoteUserMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "rest_api.utils.identity_map.IdentityMapMiddleware",
 ]
 
 AUTHENTICATION_BACKENDS = [
@@ -166,6 +167,84 @@ CELERY_TIMEZONE = "UTC"
 CELERY_TASK_TRACK_STARTED = True
 CELERYD_HIJACK_ROOT_LOGGER = False
 
+# Buffered detail page views: repeated views by a user within a window collapse
+# into one viewed log row, flushed in bulk every VIEW_TRACKING_FLUSH_SECONDS
+VIEW_TRACKING_WINDOW_SECONDS = int(os.environ.get("VIEW_TRACKING_WINDOW_SECONDS", 300))
+VIEW_TRACKING_FLUSH_SECONDS = int(os.environ.get("VIEW_TRACKING_FLUSH_SECONDS", 30))
+# Views are written VIEW_TRACKING_FLUSH_BATCH_SIZE at a time, and a chunk that
+# fails VIEW_TRACKING_MAX_ATTEMPTS flushes in a row is set aside in Redis
+VIEW_TRACKING_FLUSH_BATCH_SIZE = int(
+    os.environ.get("VIEW_TRACKING_FLUSH_BATCH_SIZE", 1000)
+)
+VIEW_TRACKING_MAX_ATTEMPTS = int(os.environ.get("VIEW_TRACKING_MAX_ATTEMPTS", 5))
+
+# Debounced Elasticsearch sync: a document is re-indexed once it has had no
+# writes for INDEX_SYNC_DEBOUNCE_SECONDS, or has waited INDEX_SYNC_MAX_DELAY_SECONDS
+INDEX_SYNC_DEBOUNCE_SECONDS = float(os.environ.get("INDEX_SYNC_DEBOUNCE_SECONDS", 2))
+INDEX_SYNC_MAX_DELAY_SECONDS = float(os.environ.get("INDEX_SYNC_MAX_DELAY_SECONDS", 30))
+INDEX_SYNC_FLUSH_SECONDS = float(os.environ.get("INDEX_SYNC_FLUSH_SECONDS", 2))
+
+# Index rebuilds split the table into id ranges of ELASTIC_REINDEX_CHUNK_SIZE
+# rows, indexed by at most ELASTIC_REINDEX_CONCURRENCY tasks at a time
+ELASTIC_REINDEX_CHUNK_SIZE = int(os.environ.get("ELASTIC_REINDEX_CHUNK_SIZE", 2500))
+ELASTIC_REINDEX_CONCURRENCY = int(os.environ.get("ELASTIC_REINDEX_CONCURRENCY", 4))
+# Within a chunk rows are hydrated ELASTIC_REINDEX_BATCH_SIZE at a time and
+# streamed to Elasticsearch in bulk requests of at most ELASTIC_BULK_CHUNK_SIZE
+# documents or ELASTIC_BULK_MAX_BYTES bytes. Rejected (429) requests are retried
+# with backoff up to ELASTIC_BULK_MAX_RETRIES times
+ELASTIC_REINDEX_BATCH_SIZE = int(os.environ.get("ELASTIC_REINDEX_BATCH_SIZE", 500))
+ELASTIC_BULK_CHUNK_SIZE = int(os.environ.get("ELASTIC_BULK_CHUNK_SIZE", 500))
+ELASTIC_BULK_MAX_BYTES = int(os.environ.get("ELASTIC_BULK_MAX_BYTES", 10 * 1024 * 1024))
+ELASTIC_BULK_MAX_RETRIES = int(os.environ.get("ELASTIC_BULK_MAX_RETRIES", 3))
+
+# Side effects recorded in the outbox are drained in batches of
+# OUTBOX_BATCH_SIZE rows after each commit, and every OUTBOX_DRAIN_SECONDS for
+# rows a crashed process never handed over. Failed rows are retried after
+# OUTBOX_BACKOFF_SECONDS, doubling up to OUTBOX_MAX_BACKOFF_SECONDS, and kept
+# for inspection after OUTBOX_MAX_ATTEMPTS. A drain leases its rows for
+# OUTBOX_LEASE_SECONDS, after which a drain that died is retried by another
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", 500))
+OUTBOX_DRAIN_SECONDS = float(os.environ.get("OUTBOX_DRAIN_SECONDS", 5))
+OUTBOX_BACKOFF_SECONDS = float(os.environ.get("OUTBOX_BACKOFF_SECONDS", 5))
+OUTBOX_MAX_BACKOFF_SECONDS = float(os.environ.get("OUTBOX_MAX_BACKOFF_SECONDS", 3600))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", 10))
+OUTBOX_LEASE_SECONDS = float(os.environ.get("OUTBOX_LEASE_SECONDS", 300))
+
+# Changes to a patient, staff member or user are copied into the documents that
+# embed them with one update_by_query per INDEX_PROPAGATION_BATCH_SIZE documents
+INDEX_PROPAGATION_BATCH_SIZE = int(os.environ.get("INDEX_PROPAGATION_BATCH_SIZE", 1000))
+
+# Every DELTA_REINDEX_SECONDS each index upserts the documents written since its
+# watermark, looking DELTA_REINDEX_OVERLAP_SECONDS further back for transactions
+# that committed late, and removes the ones deleted since. Tombstones of deleted
+# rows are kept for INDEX_TOMBSTONE_RETENTION_DAYS
+DELTA_REINDEX_SECONDS = float(os.environ.get("DELTA_REINDEX_SECONDS", 60))
+DELTA_REINDEX_OVERLAP_SECONDS = float(
+    os.environ.get("DELTA_REINDEX_OVERLAP_SECONDS", 300)
+)
+INDEX_TOMBSTONE_RETENTION_DAYS = int(
+    os.environ.get("INDEX_TOMBSTONE_RETENTION_DAYS", 7)
+)
+
+CELERY_BEAT_SCHEDULE = {
+    "flush_viewed_logs": {
+        "task": "rest_api.tasks.view_tracking.flush_viewed_logs",
+        "schedule": VIEW_TRACKING_FLUSH_SECONDS,
+    },
+    "flush_index_sync": {
+        "task": "rest_api.tasks.elastic.flush_index_sync",
+        "schedule": INDEX_SYNC_FLUSH_SECONDS,
+    },
+    "drain_outbox": {
+        "task": "rest_api.tasks.outbox.drain_outbox",
+        "schedule": OUTBOX_DRAIN_SECONDS,
+    },
+    "delta_reindex": {
+        "task": "rest_api.tasks.elastic.delta_reindex",
+        "schedule": DELTA_REINDEX_SECONDS,
+    },
+}
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
@@ -182,10 +261,45 @@ CACHES = {
     }
 }
 
+ELASTIC_READ_PATH_ENABLED = literal_eval(
+    os.environ.get("ELASTIC_READ_PATH_ENABLED", "False")
+)
+
+IDENTITY_CACHE_TTL_SECONDS = int(os.environ.get("IDENTITY_CACHE_TTL_SECONDS", 60 * 60))
+IDENTITY_CACHE_LOCAL_TTL_SECONDS = int(
+    os.environ.get("IDENTITY_CACHE_LOCAL_TTL_SECONDS", 30)
+)
+IDENTITY_CACHE_LOCAL_MAX_SIZE = int(
+    os.environ.get("IDENTITY_CACHE_LOCAL_MAX_SIZE", 10000)
+)
+
+# Two-tier schema cache (rest_api.utils.schema_cache). The in-process tier is
+# not invalidated across workers, so its TTL bounds cross-process staleness
+SCHEMA_CACHE_TTL_SECONDS = int(os.environ.get("SCHEMA_CACHE_TTL_SECONDS", 60 * 60))
+SCHEMA_CACHE_LOCAL_TTL_SECONDS = float(
+    os.environ.get("SCHEMA_CACHE_LOCAL_TTL_SECONDS", 5)
+)
+SCHEMA_CACHE_LOCAL_MAX_SIZE = int(os.environ.get("SCHEMA_CACHE_LOCAL_MAX_SIZE", 10000))
+SCHEMA_CACHE_LOCK_TIMEOUT_SECONDS = int(
+    os.environ.get("SCHEMA_CACHE_LOCK_TIMEOUT_SECONDS", 10)
+)
+SCHEMA_CACHE_LOCK_WAIT_SECONDS = float(
+    os.environ.get("SCHEMA_CACHE_LOCK_WAIT_SECONDS", 0.2)
+)
+SCHEMA_CACHE_EARLY_EXPIRY_BETA = float(
+    os.environ.get("SCHEMA_CACHE_EARLY_EXPIRY_BETA", 1.0)
+)
+
+# Recompute cached aggregates in the background after a dependency write
+# (rest_api.signals) instead of leaving them to the next read
+CACHE_DEPENDENCY_RECOMPUTE = literal_eval(
+    os.environ.get("CACHE_DEPENDENCY_RECOMPUTE", "False")
+)
+
 REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_jwt.authentication.JSONWebTokenAuthentication",
+        "django_project.auth_utils.AuthContextJSONWebTokenAuthentication",
         "rest_framework.authentication.SessionAuthentication",
         "rest_framework.authentication.BasicAuthentication",
     ),
@@ -214,6 +328,13 @@ AUTH0_M2M_CLIENT_ID = os.environ.get("AUTH0_M2M_CLIENT_ID", "")
 AUTH0_M2M_CLIENT_SECRET = os.environ.get("AUTH0_M2M_CLIENT_SECRET", "")
 AUTH0_STAFF_ROLE_ID = os.environ.get("AUTH0_STAFF_ROLE_ID", "")
 AUTH0_PATIENT_ROLE_ID = os.environ.get("AUTH0_PATIENT_ROLE_ID", "")
+AUTH0_JWKS_TTL_SECONDS = int(os.environ.get("AUTH0_JWKS_TTL_SECONDS", 60 * 10))
+AUTH0_JWKS_MIN_REFETCH_SECONDS = int(
+    os.environ.get("AUTH0_JWKS_MIN_REFETCH_SECONDS", 30)
+)
+AUTH0_JWKS_FETCH_TIMEOUT_SECONDS = float(
+    os.environ.get("AUTH0_JWKS_FETCH_TIMEOUT_SECONDS", 2)
+)
 
 JWT_AUTH = {
     "JWT_PAYLOAD_GET_USERNAME_HANDLER": "django_project.auth_utils.jwt_get_username_from_payload_handler",
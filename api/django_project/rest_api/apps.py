@@ -1,6 +1,25 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class RestApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "rest_api"
+
+    def ready(self):
+        from rest_api.signals import (
+            connect_cache_dependencies,
+            connect_index_tombstones,
+            connect_user_stamps,
+        )
+
+        connect_cache_dependencies()
+        connect_index_tombstones()
+        connect_user_stamps()
+        checks.register(check_permission_filters, checks.Tags.urls)
+
+
+def check_permission_filters(app_configs=None, **kwargs):
+    from rest_api.repositories.permissions import permission_filter_errors
+
+    return permission_filter_errors()
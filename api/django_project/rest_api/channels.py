@@ -7,6 +7,10 @@ class AvailabilityConsumer(JsonWebsocketConsumer):
         message = event["message"]
         self.send_json(message)
 
+    def batch(self, event):
+        for inner in event["events"]:
+            self.dispatch(inner)
+
     def connect(self):
         super().connect()
         practiceID = self.scope.get("url_route").get("kwargs").get("practiceID")
@@ -0,0 +1,25 @@
+from celery import shared_task
+from celery_singleton import Singleton
+
+from rest_api.factory.repo import GpBaseInjector
+
+
+@shared_task(base=Singleton)
+def backfill_patient_coordinates_event(patient_id: int):
+    from rest_api.repositories.patient import PatientRepo
+
+    GpBaseInjector.get(PatientRepo).backfill_coordinates(patient_id)
+
+
+@shared_task(base=Singleton)
+def backfill_practice_coordinates_event(practice_id: int):
+    from rest_api.repositories.practice import PracticeRepo
+
+    GpBaseInjector.get(PracticeRepo).backfill_coordinates(practice_id)
+
+
+@shared_task(base=Singleton)
+def backfill_pharmacy_coordinates_event(pharmacy_id: int):
+    from rest_api.repositories.prescription import PrescriptionRepo
+
+    GpBaseInjector.get(PrescriptionRepo).backfill_pharmacy_coordinates(pharmacy_id)
@@ -0,0 +1,53 @@
+from celery import shared_task
+from django.db import transaction
+
+from rest_api.factory.repo import GpBaseInjector
+from rest_api.services.index_propagation import EMBEDDINGS
+
+
+def propagate_after_commit(entity: str, id: int) -> None:
+    transaction.on_commit(lambda: propagate_entity_event.delay(entity, id))
+
+
+def propagate(entity: str, id: int) -> int:
+    """Copy the current state of a patient, staff member or user into every
+    document embedding it, and return how many documents changed. A user's
+    patient and staff profiles show the user's name too, so they are
+    re-indexed and propagated along with it"""
+    from rest_api.models.patient import PatientModel
+    from rest_api.models.staff import StaffModel
+    from rest_api.repositories.patient import PatientRepo
+    from rest_api.repositories.staff import StaffRepo
+    from rest_api.repositories.user import UserRepo
+
+    repos = {"patient": PatientRepo, "staff": StaffRepo, "user": UserRepo}
+    documents = GpBaseInjector.get(repos[entity]).load_documents([id])
+    if not documents:
+        return 0
+    updated = 0
+    for embedding in EMBEDDINGS[entity]:
+        ids = sorted(set(embedding.documents(id)))
+        if ids:
+            updated += GpBaseInjector.get(embedding.index).update_embedded(
+                ids, embedding.paths, documents[0]
+            )
+
+    if entity == "user":
+        for profile, model in [("patient", PatientModel), ("staff", StaffModel)]:
+            repo = GpBaseInjector.get(repos[profile])
+            profile_ids = list(
+                model.objects.filter(user_id=id).values_list("id", flat=True)
+            )
+            if profile_ids:
+                repo.es_instance.bulk_index_docs(repo.load_documents(profile_ids))
+            for profile_id in profile_ids:
+                updated += propagate(profile, profile_id)
+    return updated
+
+
+@shared_task
+def propagate_entity_event(entity: str, id: int) -> int:
+    # Not a singleton, which would drop a run enqueued while another is
+    # going, and that one may have read the state before the new change.
+    # Each run reads the state as of its start, so repeats are harmless
+    return propagate(entity, id)
@@ -0,0 +1,107 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from elastic_transport import (
+    ApiResponseMeta,
+    HeadApiResponse,
+    HttpHeaders,
+    ObjectApiResponse,
+)
+from elasticsearch import Elasticsearch
+
+from rest_api.factory.repo import GpBaseInjector
+from rest_api.repositories.appointment import AppointmentRepo
+from rest_api.repositories.patient import PatientRepo
+from rest_api.repositories.practice import PracticeRepo
+from rest_api.repositories.prescription import PrescriptionRepo
+from rest_api.repositories.staff import StaffRepo
+
+AUTOCOMPLETE_REPOS = {
+    "patient": PatientRepo,
+    "staff": StaffRepo,
+    "practice": PracticeRepo,
+    "appointment": AppointmentRepo,
+    "prescription": PrescriptionRepo,
+}
+
+
+class SimulatedElasticsearch(Elasticsearch):
+    """Client answering every request itself after a fixed round trip, with
+    an existing index and no hits"""
+
+    latency = 0.0
+
+    def perform_request(self, method, path, **kwargs):
+        time.sleep(self.latency)
+        meta = ApiResponseMeta(
+            status=200,
+            http_version="1.1",
+            headers=HttpHeaders(),
+            duration=self.latency,
+            node=None,
+        )
+        if method == "HEAD":
+            return HeadApiResponse(meta=meta)
+        return ObjectApiResponse(body={"hits": {"hits": []}}, meta=meta)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the latency of the autocomplete endpoints' searches with an "
+        "index existence check before every search, as reads used to do, and "
+        "without one. Searches go to the configured cluster, or with "
+        "--dry-run to a simulated one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--index",
+            choices=sorted(AUTOCOMPLETE_REPOS),
+            nargs="+",
+            default=sorted(AUTOCOMPLETE_REPOS),
+        )
+        parser.add_argument("--searches", type=int, default=200)
+        parser.add_argument("--term", default="jo")
+        parser.add_argument("--practice-id", type=int, default=1)
+        parser.add_argument("--dry-run", action="store_true")
+        parser.add_argument("--latency-ms", type=float, default=2)
+
+    def handle(self, *args, **options) -> None:
+        SimulatedElasticsearch.latency = options["latency_ms"] / 1000
+        for name in options["index"]:
+            repo = GpBaseInjector.get(AUTOCOMPLETE_REPOS[name])
+            service = repo.es_instance
+            if options["dry_run"]:
+                service.es = SimulatedElasticsearch("http://dry-run:9200")
+
+            def search():
+                if name in ("patient", "staff"):
+                    return repo.autocomplete_search(
+                        options["term"], options["practice_id"]
+                    )
+                return repo.autocomplete_search(options["term"])
+
+            def checked_search():
+                service.check_index_exists()
+                return search()
+
+            self.stdout.write(name)
+            for label, run in [
+                ("existence check per search", checked_search),
+                ("search only", search),
+            ]:
+                run()
+                timings = []
+                for _ in range(options["searches"]):
+                    started = time.perf_counter()
+                    run()
+                    timings.append((time.perf_counter() - started) * 1000)
+                timings.sort()
+                p95 = timings[int(len(timings) * 0.95) - 1]
+                self.stdout.write(
+                    f"  {label}: p50 {statistics.median(timings):.2f} ms, "
+                    f"p95 {p95:.2f} ms"
+                )
+
+        self.stdout.write(self.style.SUCCESS("Autocomplete benchmark complete"))
@@ -0,0 +1,124 @@
+import time
+
+from django.core.management.base import BaseCommand
+from elastic_transport import ApiResponseMeta, HttpHeaders, ObjectApiResponse
+from elasticsearch import Elasticsearch
+
+from django_project import settings
+from rest_api.factory.repo import GpBaseInjector
+from rest_api.services.elastic import ElasticSearchService
+from rest_api.tasks.elastic import REINDEX_REPOS
+
+
+class SimulatedElasticsearch(Elasticsearch):
+    """Client answering every request itself after a fixed round trip, plus
+    the cost of a refresh when one is asked for"""
+
+    latency = 0.0
+    refresh_cost = 0.0
+    requests = 0
+
+    def wait(self, refresh=None) -> None:
+        SimulatedElasticsearch.requests += 1
+        time.sleep(self.latency + (self.refresh_cost if refresh else 0))
+
+    def exists(self, **kwargs):
+        self.wait()
+        return False
+
+    def index(self, *, refresh=None, **kwargs):
+        self.wait(refresh)
+        return {"result": "created"}
+
+    def bulk(self, *, operations, refresh=None, **kwargs):
+        self.wait(refresh)
+        # Index actions are a header line and a source line
+        items = [{"index": {"status": 201}} for _ in range(len(operations) // 2)]
+        meta = ApiResponseMeta(
+            status=200,
+            http_version="1.1",
+            headers=HttpHeaders(),
+            duration=0.0,
+            node=None,
+        )
+        return ObjectApiResponse(body={"errors": False, "items": items}, meta=meta)
+
+
+def add_per_document(service: ElasticSearchService, doc) -> None:
+    """The write path before the outbox: an existence check, then an index
+    request forcing a refresh"""
+    if not service.es.exists(index=service.write_name, id=doc.id):
+        service.es.index(
+            index=service.write_name, id=doc.id, document=doc.dict(), refresh=True
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure single document index writes in writes/sec: one request and "
+        "refresh per document, against the outbox consumer's one bulk request "
+        "per OUTBOX_BATCH_SIZE rows. Writes go to a throwaway index, or with "
+        "--dry-run to a simulated cluster."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--index", choices=sorted(REINDEX_REPOS), default="appointment"
+        )
+        parser.add_argument("--docs", type=int, default=1000)
+        parser.add_argument("--dry-run", action="store_true")
+        parser.add_argument("--latency-ms", type=float, default=2)
+        parser.add_argument("--refresh-ms", type=float, default=20)
+
+    def handle(self, *args, **options) -> None:
+        repo = GpBaseInjector.get(REINDEX_REPOS[options["index"]])
+        service = repo.es_instance
+        ids = list(
+            repo.reindex_queryset()
+            .order_by("id")
+            .values_list("id", flat=True)[: options["docs"]]
+        )
+        docs = list(repo.load_documents(ids))
+        self.stdout.write(f"{options['index']}: {len(docs)} documents")
+        if not docs:
+            return
+
+        if options["dry_run"]:
+            SimulatedElasticsearch.latency = options["latency_ms"] / 1000
+            SimulatedElasticsearch.refresh_cost = options["refresh_ms"] / 1000
+            service.es = SimulatedElasticsearch("http://dry-run:9200")
+            service.check_index_exists = lambda: True
+
+        def per_document():
+            for doc in docs:
+                add_per_document(service, doc)
+
+        def outbox_batches():
+            size = settings.OUTBOX_BATCH_SIZE
+            for start in range(0, len(docs), size):
+                end = start + size
+                service.bulk_index_docs(docs[start:end])
+
+        paths = [
+            ("per document, refresh=true", per_document),
+            ("outbox batches", outbox_batches),
+        ]
+        for label, write in paths:
+            SimulatedElasticsearch.requests = 0
+            if not options["dry_run"]:
+                service.begin_migration()
+            try:
+                started = time.perf_counter()
+                write()
+                elapsed = time.perf_counter() - started
+            finally:
+                if not options["dry_run"]:
+                    # Drop the throwaway index and keep the live one
+                    service.handle_migration_exception()
+
+            line = f"  {label}: {len(docs) / elapsed:.0f} writes/s"
+            if options["dry_run"]:
+                line += f", {SimulatedElasticsearch.requests} requests"
+            self.stdout.write(line)
+
+        self.stdout.write(self.style.SUCCESS("Index write benchmark complete"))
@@ -0,0 +1,62 @@
+import json
+import time
+
+import jwt
+import requests
+from django.core.management.base import BaseCommand
+from jwt import algorithms
+
+from django_project.jwks import JWKSKeyStore
+from django_project.jwks_testing import LocalJWKSServer
+
+
+class Command(BaseCommand):
+    help = "Compare token verification throughput with and without the JWKS cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.05,
+            help="Simulated JWKS endpoint latency in seconds",
+        )
+
+    def handle(self, *args, **options) -> None:
+        with LocalJWKSServer(latency=options["latency"]) as server:
+            token = server.mint_token(audience="benchmark")
+            store = JWKSKeyStore(jwks_url=server.jwks_url)
+
+            def uncached():
+                header = jwt.get_unverified_header(token)
+                jwks = requests.get(server.jwks_url).json()
+                public_key = None
+                for jwk in jwks["keys"]:
+                    if jwk["kid"] == header["kid"]:
+                        public_key = algorithms.RSAAlgorithm.from_jwk(json.dumps(jwk))
+                return self.decode(token, public_key, server.issuer)
+
+            def cached():
+                header = jwt.get_unverified_header(token)
+                public_key = store.get_key(header["kid"])
+                return self.decode(token, public_key, server.issuer)
+
+            for name, func in [("before", uncached), ("after", cached)]:
+                started = time.perf_counter()
+                for _ in range(options["requests"]):
+                    func()
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{name}: {options['requests'] / elapsed:.1f} requests/sec"
+                )
+
+        self.stdout.write(self.style.SUCCESS("JWKS benchmark complete"))
+
+    def decode(self, token: str, public_key, issuer: str) -> dict:
+        return jwt.decode(
+            token,
+            public_key,
+            audience="benchmark",
+            issuer=issuer,
+            algorithms=["RS256"],
+        )
@@ -0,0 +1,110 @@
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from faker import Faker
+
+from rest_api.factory.repo import TestGpBaseInjector
+from rest_api.models.appointment import (
+    AppointmentAssignLogModel,
+    AppointmentCommentModel,
+    AppointmentModel,
+    AppointmentStateLogModel,
+    AppointmentViewedLogModel,
+)
+from rest_api.repositories.appointment import AppointmentRepo
+from rest_api.repositories.patient import PatientRepo
+from rest_api.repositories.practice import PracticeRepo
+from rest_api.repositories.user import UserRepo
+from rest_api.schemas.appointment import AppointmentSummarySchema
+from rest_api.serializers.appointment import AppointmentSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare appointment list page latency and payload size for full and "
+        "summary rows as item history grows. Runs in a rolled back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--page-size", type=int, default=50)
+        parser.add_argument("--history", type=int, nargs="+", default=[0, 10, 50, 200])
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options) -> None:
+        faker = TestGpBaseInjector.get(Faker)
+        user_repo = TestGpBaseInjector.get(UserRepo)
+        patient_repo = TestGpBaseInjector.get(PatientRepo)
+        practice_repo = TestGpBaseInjector.get(PracticeRepo)
+        appointment_repo = TestGpBaseInjector.get(AppointmentRepo)
+
+        with transaction.atomic():
+            admin = user_repo.create(faker.get_user())
+            practice = practice_repo.create(
+                data=faker.get_practice(admin.id), skip_gmaps=True
+            )
+            user = User.objects.create(username="benchmark.patient")
+            patient = patient_repo.create(
+                faker.get_patient(user.id, faker.get_user()), test_data=True
+            )
+
+            for history in options["history"]:
+                appointments = AppointmentModel.objects.bulk_create(
+                    [
+                        AppointmentModel(
+                            **faker.get_appointment(patient.id, practice.id).dict(
+                                include={"symptoms", "symptom_category", "state"}
+                            ),
+                            symptoms_duration_seconds=60,
+                            patient_id=patient.id,
+                            practice_id=practice.id,
+                        )
+                        for _ in range(options["page_size"])
+                    ]
+                )
+                self.add_history(appointments, admin.id, history)
+                ids = [a.id for a in appointments]
+
+                for name, expand, fields in [
+                    ("full", None, None),
+                    ("summary", set(), set(AppointmentSummarySchema.__fields__)),
+                ]:
+                    started = time.perf_counter()
+                    for _ in range(options["repeat"]):
+                        rows = appointment_repo.get_many(ids, expand=expand)
+                        data = AppointmentSerializer(rows, many=True, fields=fields)
+                        payload = json.dumps(data.data, default=str)
+                    elapsed = (time.perf_counter() - started) / options["repeat"]
+                    self.stdout.write(
+                        f"history={history} {name}: {elapsed * 1000:.1f} ms/page, "
+                        f"{len(payload) / 1024:.1f} KiB"
+                    )
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS("List payload benchmark complete"))
+
+    def add_history(
+        self, appointments: list[AppointmentModel], user_id: int, count: int
+    ) -> None:
+        for model, fields in [
+            (
+                AppointmentStateLogModel,
+                {"to_state": "submitted", "triggered_by_id": user_id},
+            ),
+            (AppointmentCommentModel, {"user_id": user_id, "comment": "benchmark"}),
+            (AppointmentViewedLogModel, {"viewed_by_id": user_id}),
+            (
+                AppointmentAssignLogModel,
+                {"to_user_id": user_id, "triggered_by_id": user_id},
+            ),
+        ]:
+            model.objects.bulk_create(
+                [
+                    model(appointment=a, **fields)
+                    for a in appointments
+                    for _ in range(count)
+                ]
+            )
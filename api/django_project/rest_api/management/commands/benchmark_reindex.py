@@ -0,0 +1,116 @@
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import get_context
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from elastic_transport import ApiResponseMeta, HttpHeaders, ObjectApiResponse
+from elasticsearch import Elasticsearch
+
+from rest_api.factory.repo import GpBaseInjector
+from rest_api.tasks.elastic import REINDEX_REPOS
+from rest_api.utils.elastic_migration import chunk_id_ranges
+from rest_api.utils.identity_map import identity_map_scope
+
+
+class DryRunElasticsearch(Elasticsearch):
+    """Client answering bulk requests itself, so documents are hydrated and
+    serialized exactly as in a real rebuild but never sent"""
+
+    largest_request = 0
+
+    def bulk(self, *, operations, **kwargs):
+        DryRunElasticsearch.largest_request = max(
+            DryRunElasticsearch.largest_request, sum(map(len, operations))
+        )
+        # Create actions are a header line and a source line
+        items = [{"create": {"status": 201}} for _ in range(len(operations) // 2)]
+        meta = ApiResponseMeta(
+            status=200,
+            http_version="1.1",
+            headers=HttpHeaders(),
+            duration=0.0,
+            node=None,
+        )
+        return ObjectApiResponse(body={"errors": False, "items": items}, meta=meta)
+
+
+def index_chunk(
+    name: str, dry_run: bool, bounds: tuple[int, int]
+) -> tuple[int, int, int]:
+    """Index one chunk, returning the documents indexed, the worker's peak
+    RSS in KiB and its largest bulk request in bytes"""
+    repo = GpBaseInjector.get(REINDEX_REPOS[name])
+    if dry_run:
+        repo.es_instance.es = DryRunElasticsearch("http://dry-run:9200")
+    # Chunk tasks run inside the identity map task_prerun opens
+    with identity_map_scope():
+        indexed = repo.reindex_range(*bounds)
+    return (
+        indexed,
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        DryRunElasticsearch.largest_request,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure index rebuild throughput in docs/sec and peak worker RSS "
+        "against worker count, per index. Chunks are indexed by a pool of "
+        "worker processes, as the reindex chunk tasks are. With --dry-run "
+        "documents are hydrated and serialized but not sent to Elasticsearch. "
+        "Peak RSS should stay the same as --chunk-size and the table grow."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--index", choices=sorted(REINDEX_REPOS), nargs="+", default=["appointment"]
+        )
+        parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+        parser.add_argument("--chunk-size", type=int, default=2500)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options) -> None:
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.stdout.write(f"baseline RSS: {baseline / 1024:.1f} MiB")
+
+        for name in options["index"]:
+            repo = GpBaseInjector.get(REINDEX_REPOS[name])
+            ranges = chunk_id_ranges(repo.reindex_queryset(), options["chunk_size"])
+            self.stdout.write(
+                f"{name}: {len(ranges)} chunks of {options['chunk_size']}"
+            )
+            if not ranges:
+                continue
+
+            for workers in options["workers"]:
+                # Children open their own connections after the fork
+                connections.close_all()
+                if not options["dry_run"]:
+                    repo.es_instance.begin_migration()
+                started = time.perf_counter()
+                with ProcessPoolExecutor(
+                    workers, mp_context=get_context("fork")
+                ) as pool:
+                    results = list(
+                        pool.map(partial(index_chunk, name, options["dry_run"]), ranges)
+                    )
+                elapsed = time.perf_counter() - started
+                if not options["dry_run"]:
+                    repo.es_instance.end_migration()
+
+                indexed = sum(result[0] for result in results)
+                peak_rss = max((result[1] for result in results), default=baseline)
+                line = (
+                    f"  workers={workers}: {indexed} docs in {elapsed:.2f} s, "
+                    f"{indexed / elapsed:.0f} docs/s, "
+                    f"peak worker RSS {peak_rss / 1024:.1f} MiB"
+                )
+                if options["dry_run"]:
+                    largest = max((result[2] for result in results), default=0)
+                    line += f", largest bulk request {largest / 1024:.0f} KiB"
+                self.stdout.write(line)
+
+        self.stdout.write(self.style.SUCCESS("Reindex benchmark complete"))
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("rest_api", "0031_outboxmodel"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="patientmodel",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="staffmodel",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.CreateModel(
+            name="IndexTombstoneModel",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("index_name", models.CharField(max_length=100)),
+                ("document_id", models.BigIntegerField()),
+                ("deleted_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["index_name", "deleted_at"],
+                        name="rest_api_in_index_n_55f2e3_idx",
+                    )
+                ],
+            },
+        ),
+    ]
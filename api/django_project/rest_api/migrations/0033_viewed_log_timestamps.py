@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("rest_api", "0032_index_delta_sync"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="appointmentviewedlogmodel",
+            name="created_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name="prescriptionviewedlogmodel",
+            name="created_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
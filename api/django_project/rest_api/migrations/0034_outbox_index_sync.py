@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("rest_api", "0033_viewed_log_timestamps"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="outboxmodel",
+            name="kind",
+            field=models.CharField(
+                choices=[
+                    ("index", "Index"),
+                    ("index_sync", "Index Sync"),
+                    ("websocket", "Websocket"),
+                    ("email", "Email"),
+                ],
+                max_length=16,
+            ),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("rest_api", "0034_outbox_index_sync"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserStampModel",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stamp",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -5,6 +5,9 @@ from .appointment import (  # noqa: F401
 )
 from .booking import BookingInviteModel, BookingModel  # noqa: F401
 from .feature_flags import PracticeFeatureFlagModel  # noqa: F401
+from .geocode import GeocodeModel  # noqa: F401
+from .index_tombstone import IndexTombstoneModel  # noqa: F401
+from .outbox import OutboxModel  # noqa: F401
 from .patient import PatientDocumentModel, PatientModel  # noqa: F401
 from .patient_practice import PatientPracticeModel  # noqa: F401
 from .practice import PracticeModel  # noqa: F401
@@ -27,3 +30,4 @@ from .prescription import (  # noqa: F401
 )
 from .review import ReviewModel  # noqa: F401
 from .staff import StaffModel  # noqa: F401
+from .user_stamp import UserStampModel  # noqa: F401
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import User
 from django.db import models
+from django.utils import timezone
 
 from rest_api.models.patient import PatientModel
 from rest_api.models.practice import PracticeModel
@@ -106,7 +107,8 @@ class CommonCommentModel(models.Model):
 
 
 class CommonViewedLogModel(models.Model):
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Set from the buffered view when views are flushed in bulk
+    created_at = models.DateTimeField(default=timezone.now)
     viewed_by = models.ForeignKey(
         User,
         on_delete=models.DO_NOTHING,
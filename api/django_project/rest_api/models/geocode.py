@@ -0,0 +1,9 @@
+from django.db import models
+
+
+class GeocodeModel(models.Model):
+    fingerprint = models.CharField(max_length=40, unique=True)
+    address = models.TextField()
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
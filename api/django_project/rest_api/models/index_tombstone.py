@@ -0,0 +1,13 @@
+from django.db import models
+
+
+class IndexTombstoneModel(models.Model):
+    """A row deleted from a table behind a search index, for the delta
+    reindex to remove its document"""
+
+    index_name = models.CharField(max_length=100)
+    document_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["index_name", "deleted_at"])]
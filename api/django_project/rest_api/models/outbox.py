@@ -0,0 +1,19 @@
+from django.db import models
+from django.utils import timezone
+
+
+class OutboxModel(models.Model):
+    class Kind(models.TextChoices):
+        INDEX = "index"
+        INDEX_SYNC = "index_sync"
+        WEBSOCKET = "websocket"
+        EMAIL = "email"
+
+    kind = models.CharField(max_length=16, choices=Kind.choices)
+    # Index name for index rows, practice id for websocket rows
+    target = models.CharField(max_length=255, blank=True, default="")
+    payload = models.JSONField(default=dict)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now, db_index=True)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
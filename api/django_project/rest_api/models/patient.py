@@ -10,6 +10,7 @@ class PatientModel(AddressModel):
     date_of_birth = models.DateField()
     gender = models.CharField(max_length=10)
     health_care_number = models.CharField(max_length=20, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
 
 class PatientDocumentModel(models.Model):
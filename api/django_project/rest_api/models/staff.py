@@ -9,3 +9,4 @@ class StaffModel(models.Model):
     practice = models.ForeignKey(PracticeModel, on_delete=models.CASCADE, null=True)
     job_title = models.CharField(max_length=100, blank=True)
     bio = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
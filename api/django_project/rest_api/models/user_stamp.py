@@ -0,0 +1,12 @@
+from django.contrib.auth.models import User
+from django.db import models
+
+
+class UserStampModel(models.Model):
+    """When the fields of a user behind the search index were last written,
+    for the delta reindex. auth.User has no write timestamp of its own"""
+
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name="stamp"
+    )
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
@@ -1,9 +1,12 @@
 import uuid
+from collections import defaultdict
 from datetime import datetime
 
 from django.contrib.auth import get_user_model
 from django.db import transaction
+from django.db.models import QuerySet
 from django.db.transaction import atomic
+from django.utils import timezone
 from injector import inject
 
 from rest_api.models.appointment import (
@@ -18,7 +21,10 @@ from rest_api.models.patient import PatientDocumentModel
 from rest_api.repositories.common import CommonModelRepo
 from rest_api.repositories.patient import PatientRepo
 from rest_api.repositories.user import UserRepo
-from rest_api.repositories.utils import convert_patient_id_to_user_id
+from rest_api.repositories.utils import (
+    convert_patient_id_to_user_id,
+    flush_buffered_views,
+)
 from rest_api.schemas.appointment import (
     AppointmentAssignSchema,
     AppointmentCommentSchema,
@@ -30,9 +36,9 @@ from rest_api.schemas.appointment import (
 from rest_api.schemas.common import StateSchema
 from rest_api.services.elastic_indexes.appointment import AppointmentIndex
 from rest_api.services.geo import GeoPyService
-from rest_api.services.notification import NotificationService
+from rest_api.services.outbox import Outbox
 from rest_api.services.s3 import ObjectStorageService
-from rest_api.utils.elastic_migration import ElasticMigration
+from rest_api.services.view_tracking import ViewTracker
 
 User = get_user_model()
 
@@ -40,11 +46,22 @@ User = get_user_model()
 class AppointmentRepo(CommonModelRepo[AppointmentSchema]):
 
     elastic_service: AppointmentIndex
+    delta_lookups = (
+        "updated_at",
+        "patient__updated_at",
+        "assigned_to__updated_at",
+        "appointmentcommentmodel__updated_at",
+        "appointmentstatelogmodel__created_at",
+        "appointmentassignlogmodel__created_at",
+        "appointmentviewedlogmodel__created_at",
+        "appointmentdocumentmodel__updated_at",
+    )
     geo_service: GeoPyService
     storage_service: ObjectStorageService
-    notification_service: NotificationService
+    outbox: Outbox
     patient_repo: PatientRepo
     user_repo: UserRepo
+    view_tracker: ViewTracker
 
     states: list[StateSchema] = [
         StateSchema(
@@ -86,28 +103,51 @@ class AppointmentRepo(CommonModelRepo[AppointmentSchema]):
         elastic_service: AppointmentIndex,
         geo_service: GeoPyService,
         storage_service: ObjectStorageService,
-        notification_service: NotificationService,
+        outbox: Outbox,
         patient_repo: PatientRepo,
         user_repo: UserRepo,
+        view_tracker: ViewTracker,
     ):
         super(AppointmentRepo, self).__init__(es_instance=elastic_service)
         self.elastic_service = elastic_service
         self.geo_service = geo_service
         self.storage_service = storage_service
-        self.notification_service = notification_service
+        self.outbox = outbox
         self.patient_repo = patient_repo
         self.user_repo = user_repo
+        self.view_tracker = view_tracker
 
     def get(self, id: int) -> AppointmentSchema:
-        appointment = AppointmentModel.objects.get(
-            id=id,
-        )
-        doc_q = AppointmentDocumentModel.objects.filter(appointment_id=id).order_by(
-            "-created_at"
+        result = self.get_many([id])
+        if not result:
+            raise AppointmentModel.DoesNotExist(f"Appointment {id} does not exist")
+        return result[0]
+
+    def get_many(
+        self, ids: list[int], expand: set[str] | None = None
+    ) -> list[AppointmentSchema]:
+        """
+        Hydrate appointments with a fixed number of queries, in the order given.
+        `expand` limits the nested collections loaded, the rest are left as None.
+        """
+        if not ids:
+            return []
+
+        def wants(field: str) -> bool:
+            return expand is None or field in expand
+
+        appointments = AppointmentModel.objects.in_bulk(ids)
+
+        docs: dict[int, list[PatientDocumentSchema]] = defaultdict(list)
+        doc_q = (
+            AppointmentDocumentModel.objects.filter(appointment_id__in=ids)
+            .select_related("document")
+            .order_by("-created_at")
+            if wants("documents")
+            else []
         )
-        docs: list[PatientDocumentSchema] = []
         for doc in doc_q:
-            docs.append(
+            docs[doc.appointment_id].append(
                 PatientDocumentSchema(
                     id=doc.id,
                     download_url=doc.document.s3_url,
@@ -115,120 +155,161 @@ class AppointmentRepo(CommonModelRepo[AppointmentSchema]):
                 )
             )
 
-        logs_q = AppointmentStateLogModel.objects.filter(appointment_id=id).order_by(
-            "-created_at"
+        logs_q = list(
+            AppointmentStateLogModel.objects.filter(appointment_id__in=ids).order_by(
+                "-created_at"
+            )
+            if wants("logs")
+            else []
         )
-        logs: list[AppointmentStateLogSchema] = []
+        comments_q = list(
+            AppointmentCommentModel.objects.filter(appointment_id__in=ids).order_by(
+                "-created_at"
+            )
+            if wants("comments")
+            else []
+        )
+        assign_logs_q = list(
+            AppointmentAssignLogModel.objects.filter(appointment_id__in=ids).order_by(
+                "-created_at"
+            )
+            if wants("assign_history")
+            else []
+        )
+        viewed_history_q = list(
+            AppointmentViewedLogModel.objects.filter(appointment_id__in=ids).order_by(
+                "-created_at"
+            )
+            if wants("viewed_logs")
+            else []
+        )
+
+        user_ids: set[int | None] = set()
+        if wants("assigned_to"):
+            user_ids.update(a.assigned_to_id for a in appointments.values())
+        user_ids.update(log.triggered_by_id for log in logs_q)
+        user_ids.update(comm.user_id for comm in comments_q)
+        for log in assign_logs_q:
+            user_ids.update([log.from_user_id, log.to_user_id, log.triggered_by_id])
+        user_ids.update(item.viewed_by_id for item in viewed_history_q)
+        users = self.user_repo.get_many([i for i in user_ids if i is not None])
+        patients = (
+            self.patient_repo.get_many([a.patient_id for a in appointments.values()])
+            if wants("patient")
+            else {}
+        )
+
+        logs: dict[int, list[AppointmentStateLogSchema]] = defaultdict(list)
         for log in logs_q:
             if log.transition_away_at is not None:
                 diff_dates = (log.transition_away_at - log.created_at).total_seconds()
             else:
                 diff_dates = None
-            logs.append(
+            logs[log.appointment_id].append(
                 AppointmentStateLogSchema(
                     id=log.id,
-                    appointment_id=log.appointment.id,
+                    appointment_id=log.appointment_id,
                     created_at=log.created_at,
                     from_state=log.from_state,
                     to_state=log.to_state,
-                    triggered_by_id=log.triggered_by.id,
-                    triggered_by=self.user_repo.get(log.triggered_by.id),
+                    triggered_by_id=log.triggered_by_id,
+                    triggered_by=users[log.triggered_by_id],
                     transition_away_at=log.transition_away_at,
                     transition_delta=diff_dates,
                 )
             )
 
-        comments_q = AppointmentCommentModel.objects.filter(appointment_id=id).order_by(
-            "-created_at"
-        )
-        comments: list[AppointmentCommentSchema] = []
+        comments: dict[int, list[AppointmentCommentSchema]] = defaultdict(list)
         for comm in comments_q:
-            comments.append(
+            comments[comm.appointment_id].append(
                 AppointmentCommentSchema(
                     id=comm.id,
                     comment=comm.comment,
                     created_at=comm.created_at,
-                    appointment_id=comm.appointment.id,
+                    appointment_id=comm.appointment_id,
                     updated_at=comm.updated_at,
-                    user_id=comm.user.id,
-                    user=self.user_repo.get(comm.user.id),
+                    user_id=comm.user_id,
+                    user=users[comm.user_id],
                 )
             )
 
-        assign_logs_q = AppointmentAssignLogModel.objects.filter(
-            appointment_id=id
-        ).order_by("-created_at")
-        assign_logs: list[AppointmentAssignSchema] = []
+        assign_logs: dict[int, list[AppointmentAssignSchema]] = defaultdict(list)
         for log in assign_logs_q:
-            assign_logs.append(
+            assign_logs[log.appointment_id].append(
                 AppointmentAssignSchema(
                     id=log.id,
-                    appointment_id=log.appointment.id,
+                    appointment_id=log.appointment_id,
                     created_at=log.created_at,
-                    from_user=self.user_repo.get(log.from_user.id)
-                    if log.from_user
-                    else None,
-                    to_user=self.user_repo.get(log.to_user.id) if log.to_user else None,
-                    triggered_by=self.user_repo.get(log.triggered_by.id)
-                    if log.triggered_by
-                    else None,
+                    from_user=users.get(log.from_user_id),
+                    to_user=users.get(log.to_user_id),
+                    triggered_by=users.get(log.triggered_by_id),
                 )
             )
 
-        patient = self.patient_repo.get(appointment.patient.id)
-
-        if appointment.assigned_to:
-            assigned_to = self.user_repo.get(appointment.assigned_to.id)
-        else:
-            assigned_to = None
-
-        viewed_history_q = AppointmentViewedLogModel.objects.filter(
-            appointment_id=id
-        ).order_by("-created_at")
-        viewed_history: list[AppointmentViewedLogSchema] = []
-
+        viewed_history: dict[int, list[AppointmentViewedLogSchema]] = defaultdict(list)
         for item in viewed_history_q:
-            viewed_history.append(
+            viewed_history[item.appointment_id].append(
                 AppointmentViewedLogSchema(
                     id=item.id,
-                    appointment_id=item.appointment.id,
+                    appointment_id=item.appointment_id,
                     created_at=item.created_at,
-                    viewed_by=self.user_repo.get(item.viewed_by.id),
+                    viewed_by=users[item.viewed_by_id],
                 )
             )
 
-        return AppointmentSchema(
-            id=appointment.id,
-            created_at=appointment.created_at,
-            patient_id=appointment.patient.id,
-            practice_id=appointment.practice.id,
-            assigned_to_id=appointment.assigned_to.id
-            if appointment.assigned_to
-            else None,
-            priority=appointment.priority,
-            state=appointment.state,
-            symptom_category=appointment.symptom_category,
-            symptoms=appointment.symptoms,
-            documents=docs,
-            symptoms_duration_seconds=appointment.symptoms_duration_seconds,
-            updated_at=appointment.updated_at,
-            logs=logs,
-            comments=comments,
-            patient=patient,
-            assigned_to=assigned_to,
-            assign_history=assign_logs,
-            viewed_logs=viewed_history,
-        )
+        result: list[AppointmentSchema] = []
+        for id in ids:
+            appointment = appointments.get(id)
+            if appointment is None:
+                continue
+            result.append(
+                AppointmentSchema(
+                    id=appointment.id,
+                    created_at=appointment.created_at,
+                    patient_id=appointment.patient_id,
+                    practice_id=appointment.practice_id,
+                    assigned_to_id=appointment.assigned_to_id,
+                    priority=appointment.priority,
+                    state=appointment.state,
+                    symptom_category=appointment.symptom_category,
+                    symptoms=appointment.symptoms,
+                    documents=docs[id] if wants("documents") else None,
+                    symptoms_duration_seconds=appointment.symptoms_duration_seconds,
+                    updated_at=appointment.updated_at,
+                    logs=logs[id] if wants("logs") else None,
+                    comments=comments[id] if wants("comments") else None,
+                    patient=patients.get(appointment.patient_id),
+                    assigned_to=(
+                        users.get(appointment.assigned_to_id)
+                        if wants("assigned_to")
+                        else None
+                    ),
+                    assign_history=(
+                        assign_logs[id] if wants("assign_history") else None
+                    ),
+                    viewed_logs=(viewed_history[id] if wants("viewed_logs") else None),
+                )
+            )
+        return result
+
+    def load_documents(self, ids: list[int]) -> list[AppointmentSchema]:
+        return self.get_many(ids)
 
     def get_with_tracking(self, id: int, viewed_by: int) -> AppointmentSchema:
-        if viewed_by is not None:
-            AppointmentViewedLogModel.objects.create(
-                appointment_id=id, viewed_by_id=viewed_by
-            )
         result = self.get(id=id)
-        self.elastic_service.update(id=id, doc_data=result)
+        if viewed_by is not None:
+            self.view_tracker.record("appointment", id, viewed_by)
         return result
 
+    def flush_viewed_logs(self) -> int:
+        return flush_buffered_views(
+            self.view_tracker,
+            self.outbox,
+            "appointment",
+            AppointmentViewedLogModel,
+            self.elastic_service,
+        )
+
     @atomic
     def create(self, data: AppointmentSchema) -> AppointmentSchema:
         app = AppointmentModel.objects.create(
@@ -253,9 +334,7 @@ class AppointmentRepo(CommonModelRepo[AppointmentSchema]):
             patient_id=data.patient_id, practice_id=data.practice_id
         )
         result = self.get(app.id)
-        transaction.on_commit(
-            lambda: self.elastic_service.add(id=app.id, doc_data=result)
-        )
+        self.outbox.index(self.elastic_service, app.id)
         return result
 
     @atomic
@@ -285,12 +364,10 @@ class AppointmentRepo(CommonModelRepo[AppointmentSchema]):
             )
 
             patient_email = AppointmentModel.objects.get(id=id).patient.user.email
-            transaction.on_commit(
-                lambda: self.notification_service.send_email(
-                    to_emails=[patient_email],
-                    subject="Appointment State Change",
-                    text=f"Your appointment state has changed from {old_state} to {new_state}",
-                )
+            self.outbox.send_email(
+                to_emails=[patient_email],
+                subject="Appointment State Change",
+                text=f"Your appointment state has changed from {old_state} to {new_state}",
             )
 
         old_assigned_to = AppointmentModel.objects.get(id=id).assigned_to
@@ -332,12 +409,10 @@ class AppointmentRepo(CommonModelRepo[AppointmentSchema]):
             patient_id=data.patient_id,
             practice_id=data.practice_id,
             assigned_to_id=data.assigned_to_id,
+            updated_at=timezone.now(),
         )
-        result = self.get(id)
-        transaction.on_commit(
-            lambda: self.elastic_service.update(id=id, doc_data=result)
-        )
-        return result
+        self.outbox.sync(self.elastic_service, id)
+        return self.get(id)
 
     @atomic
     def delete(self, id: int):
@@ -346,7 +421,7 @@ class AppointmentRepo(CommonModelRepo[AppointmentSchema]):
         for doc in doc_q:
             self.delete_document(doc.id)
         app.delete()
-        transaction.on_commit(lambda: self.elastic_service.remove(id=id))
+        self.outbox.index(self.elastic_service, id)
 
     @atomic
     def create_upload_appointment_file(
@@ -362,10 +437,7 @@ class AppointmentRepo(CommonModelRepo[AppointmentSchema]):
             patient_id=app.patient_id,
             practice_id=app.practice_id,
         )
-        result = self.get(appointment_id)
-        transaction.on_commit(
-            lambda: self.elastic_service.update(id=appointment_id, doc_data=result)
-        )
+        self.outbox.sync(self.elastic_service, appointment_id)
         return upload_url
 
     @atomic
@@ -374,10 +446,7 @@ class AppointmentRepo(CommonModelRepo[AppointmentSchema]):
         doc = ver.document
         transaction.on_commit(lambda: self.storage_service.delete_object(doc.s3_url))
         doc.delete()
-        result = self.get(ver.id)
-        transaction.on_commit(
-            lambda: self.elastic_service.update(id=ver.id, doc_data=result)
-        )
+        self.outbox.sync(self.elastic_service, ver.appointment_id)
 
     def get_download_url(self, id: int) -> str:
         doc = AppointmentDocumentModel.objects.get(id=id)
@@ -430,30 +499,5 @@ class AppointmentRepo(CommonModelRepo[AppointmentSchema]):
         result_drop_duplicates = list({v.id: v for v in result}.values())
         return result_drop_duplicates
 
-    def recreate_index(self) -> None:
-        """
-        This method is used to recreate the index from the database.
-        TODO: Parrallelize this method with celery.
-
-        Beginning of celery task, create lock
-        Create array of chunks
-        Each chunk triggers a celery task to index the chunk
-        End of all tasks, trigger index refresh and removes lock
-
-        """
-        queryset = AppointmentModel.objects.all()
-        docs: list[AppointmentSchema] = []
-        chunk_size = 2500
-        with ElasticMigration(self.elastic_service):
-            for apt in queryset:
-                p = self.get(id=apt.id)
-                docs.append(p)
-                if len(docs) == chunk_size:
-                    self.elastic_service.bulk_add_docs(docs)
-                    docs = []
-
-    def update_index_by_patient_id(self, patient_id: int) -> None:
-        queryset = AppointmentModel.objects.filter(patient_id=patient_id)
-        for apt in queryset:
-            p = self.get(id=apt.id)
-            self.elastic_service.update(id=apt.id, doc_data=p)
+    def reindex_queryset(self) -> QuerySet:
+        return AppointmentModel.objects.all()
@@ -1,4 +1,4 @@
-from django.db import transaction
+from django.db.models import QuerySet
 from django.db.transaction import atomic
 from injector import inject
 
@@ -7,35 +7,54 @@ from rest_api.repositories.common import CommonModelRepo
 from rest_api.repositories.staff import StaffRepo
 from rest_api.schemas.availability import AvailableAppointmentSchema, TeamMemberSchema
 from rest_api.services.elastic_indexes.availability import AvailabilityIndex
-from rest_api.services.websocket import WebsocketEventTypes, WebsocketService
-from rest_api.utils.elastic_migration import ElasticMigration
+from rest_api.services.outbox import Outbox
+from rest_api.services.websocket import WebsocketEventTypes
 
 
 class AvailabilityRepo(CommonModelRepo[AvailableAppointmentSchema]):
 
     elastic_service: AvailabilityIndex
+    delta_lookups = (
+        "updated_at",
+        "team_member__updated_at",
+    )
     staff_repo: StaffRepo
-    websocket_service: WebsocketService
+    outbox: Outbox
 
     @inject
     def __init__(
         self,
         elastic_service: AvailabilityIndex,
         staff_repo: StaffRepo,
-        websocket_service: WebsocketService,
+        outbox: Outbox,
     ):
         super(AvailabilityRepo, self).__init__(es_instance=elastic_service)
         self.elastic_service = elastic_service
         self.staff_repo = staff_repo
-        self.websocket_service = websocket_service
+        self.outbox = outbox
 
     def get(self, id: int) -> AvailableAppointmentSchema:
-        avail = AvailableAppointmentModel.objects.get(id=id)
+        result = self.get_many([id])
+        if id not in result:
+            raise AvailableAppointmentModel.DoesNotExist(
+                f"Availability {id} does not exist"
+            )
+        return result[id]
+
+    def get_many(self, ids: list[int]) -> dict[int, AvailableAppointmentSchema]:
+        if not ids:
+            return {}
+        queryset = AvailableAppointmentModel.objects.filter(
+            id__in=set(ids)
+        ).select_related("team_member")
+        return {avail.id: self.to_schema(avail) for avail in queryset}
+
+    def to_schema(self, avail: AvailableAppointmentModel) -> AvailableAppointmentSchema:
         return AvailableAppointmentSchema(
             id=avail.id,
-            staff_id=avail.staff.id,
-            practice_id=avail.practice.id,
-            team_member_id=avail.team_member.id,
+            staff_id=avail.staff_id,
+            practice_id=avail.practice_id,
+            team_member_id=avail.team_member_id,
             start_time=avail.start_time,
             end_time=avail.end_time,
             schedule_release_time=avail.schedule_release_time,
@@ -63,16 +82,12 @@ class AvailabilityRepo(CommonModelRepo[AvailableAppointmentSchema]):
             schedule_release_time=data.schedule_release_time,
         )
         result = self.get(id=avail.id)
-        transaction.on_commit(
-            lambda: self.elastic_service.add(id=avail.id, doc_data=result)
-        )
+        self.outbox.index(self.elastic_service, avail.id)
 
-        transaction.on_commit(
-            lambda: self.websocket_service.send_message(
-                practice_id=data.practice_id,
-                message=result,
-                type_event=WebsocketEventTypes.UPDATE_AVAILABILITY,
-            )
+        self.outbox.send_message(
+            practice_id=data.practice_id,
+            message=result,
+            type_event=WebsocketEventTypes.UPDATE_AVAILABILITY,
         )
 
         return result
@@ -91,15 +106,11 @@ class AvailabilityRepo(CommonModelRepo[AvailableAppointmentSchema]):
         avail.save()
         result = self.get(id=id)
 
-        transaction.on_commit(
-            lambda: self.elastic_service.update(id=id, doc_data=result)
-        )
-        transaction.on_commit(
-            lambda: self.websocket_service.send_message(
-                practice_id=data.practice_id,
-                message=result,
-                type_event=WebsocketEventTypes.UPDATE_AVAILABILITY,
-            )
+        self.outbox.index(self.elastic_service, id)
+        self.outbox.send_message(
+            practice_id=data.practice_id,
+            message=result,
+            type_event=WebsocketEventTypes.UPDATE_AVAILABILITY,
         )
 
         return result
@@ -109,27 +120,19 @@ class AvailabilityRepo(CommonModelRepo[AvailableAppointmentSchema]):
         result = self.get(id=id)
         avail = AvailableAppointmentModel.objects.get(id=id)
         avail.delete()
-        transaction.on_commit(lambda: self.elastic_service.remove(id=id))
-        transaction.on_commit(
-            lambda: self.websocket_service.send_message(
-                practice_id=id,
-                message=result,
-                type_event=WebsocketEventTypes.UPDATE_AVAILABILITY,
-            )
+        self.outbox.index(self.elastic_service, id)
+        self.outbox.send_message(
+            practice_id=id,
+            message=result,
+            type_event=WebsocketEventTypes.UPDATE_AVAILABILITY,
         )
         return None
 
-    def recreate_index(self) -> None:
-        queryset = AvailableAppointmentModel.objects.all()
-        docs: list[AvailableAppointmentSchema] = []
-        chunk_size = 2500
-        with ElasticMigration(self.elastic_service):
-            for avail in queryset:
-                result = self.get(id=avail.id)
-                docs.append(result)
-                if len(docs) == chunk_size:
-                    self.elastic_service.bulk_add_docs(docs)
-                    docs = []
+    def reindex_queryset(self) -> QuerySet:
+        return AvailableAppointmentModel.objects.all()
+
+    def load_documents(self, ids: list[int]) -> list[AvailableAppointmentSchema]:
+        return list(self.get_many(ids).values())
 
     def search(
         self,
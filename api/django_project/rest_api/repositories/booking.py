@@ -1,6 +1,6 @@
 from datetime import timedelta
 
-from django.db import transaction
+from django.db.models import QuerySet
 from django.db.transaction import atomic
 from django.utils import timezone
 from ics import Calendar, Event
@@ -17,19 +17,23 @@ from rest_api.schemas.availability import AvailableAppointmentSchema
 from rest_api.schemas.booking import BookingInviteSchema, BookingSchema
 from rest_api.schemas.common import StateSchema
 from rest_api.services.elastic_indexes.booking import BookingIndex
-from rest_api.services.notification import NotificationService
-from rest_api.services.websocket import WebsocketEventTypes, WebsocketService
-from rest_api.utils.elastic_migration import ElasticMigration
+from rest_api.services.outbox import Outbox
+from rest_api.services.websocket import WebsocketEventTypes
 
 
 class BookingRepo(CommonModelRepo[BookingSchema]):
     elastic_service: BookingIndex
+    delta_lookups = (
+        "updated_at",
+        "appointment__updated_at",
+        "appointment__bookinginvitemodel__updated_at",
+        "available_appointment__updated_at",
+    )
     staff_repo: StaffRepo
     user_repo: UserRepo
-    websocket_service: WebsocketService
+    outbox: Outbox
     appointment_repo: AppointmentRepo
     availability_repo: AvailabilityRepo
-    notification_service: NotificationService
     practice_repo: PracticeRepo
 
     attendance_states: list[StateSchema] = [
@@ -45,55 +49,86 @@ class BookingRepo(CommonModelRepo[BookingSchema]):
         self,
         elastic_service: BookingIndex,
         staff_repo: StaffRepo,
-        websocket_service: WebsocketService,
+        outbox: Outbox,
         appointment_repo: AppointmentRepo,
         availability_repo: AvailabilityRepo,
         user_repo: UserRepo,
-        notification_service: NotificationService,
         practice_repo: PracticeRepo,
     ):
         super(BookingRepo, self).__init__(es_instance=elastic_service)
         self.elastic_service = elastic_service
         self.staff_repo = staff_repo
-        self.websocket_service = websocket_service
+        self.outbox = outbox
         self.appointment_repo = appointment_repo
         self.availability_repo = availability_repo
         self.user_repo = user_repo
-        self.notification_service = notification_service
         self.practice_repo = practice_repo
 
     def get(self, id: int) -> BookingSchema:
-        booking = BookingModel.objects.get(id=id)
-        invitation = (
-            BookingInviteModel.objects.filter(appointment_id=booking.appointment.id)
-            .order_by("-created_at")
-            .first()
-        )
-        return BookingSchema(
-            id=booking.id,
-            appointment_id=booking.appointment.id,
-            appointment=self.appointment_repo.get(booking.appointment.id),
-            attendance_status=booking.attendance_status,
-            available_appointment_id=booking.available_appointment.id,
-            available_appointment=self.availability_repo.get(
-                booking.available_appointment.id
-            ),
-            booked_by_id=booking.booked_by.id,
-            booked_by=self.user_repo.get(booking.booked_by.id),
-            created_at=booking.created_at,
-            updated_at=booking.updated_at,
-            invitation=BookingInviteSchema(
-                id=invitation.id,
-                appointment=self.appointment_repo.get(invitation.appointment.id),
-                appointment_id=invitation.appointment.id,
-                created_at=invitation.created_at,
-                practice_id=invitation.practice.id,
-                staff_id=invitation.staff.id,
-                staff=self.staff_repo.get(invitation.staff.id),
-                updated_at=invitation.updated_at,
-            ),
-            invitation_id=invitation.id if invitation else None,
+        result = self.get_many([id])
+        if not result:
+            raise BookingModel.DoesNotExist(f"Booking {id} does not exist")
+        return result[0]
+
+    def get_many(self, ids: list[int]) -> list[BookingSchema]:
+        """Hydrate bookings, loading each distinct nested object once per batch"""
+        if not ids:
+            return []
+        bookings = BookingModel.objects.in_bulk(ids)
+        appointment_ids = {b.appointment_id for b in bookings.values()}
+
+        invitations: dict[int, BookingInviteModel] = {}
+        invitations_q = BookingInviteModel.objects.filter(
+            appointment_id__in=appointment_ids
+        ).order_by("-created_at")
+        for invitation in invitations_q:
+            invitations.setdefault(invitation.appointment_id, invitation)
+
+        appointments = {
+            a.id: a for a in self.appointment_repo.get_many(list(appointment_ids))
+        }
+        availability = self.availability_repo.get_many(
+            [b.available_appointment_id for b in bookings.values()]
         )
+        users = self.user_repo.get_many([b.booked_by_id for b in bookings.values()])
+        staff = self.staff_repo.get_many([i.staff_id for i in invitations.values()])
+
+        result: list[BookingSchema] = []
+        for id in ids:
+            booking = bookings.get(id)
+            if booking is None:
+                continue
+            invitation = invitations.get(booking.appointment_id)
+            result.append(
+                BookingSchema(
+                    id=booking.id,
+                    appointment_id=booking.appointment_id,
+                    appointment=appointments[booking.appointment_id],
+                    attendance_status=booking.attendance_status,
+                    available_appointment_id=booking.available_appointment_id,
+                    available_appointment=availability[
+                        booking.available_appointment_id
+                    ],
+                    booked_by_id=booking.booked_by_id,
+                    booked_by=users[booking.booked_by_id],
+                    created_at=booking.created_at,
+                    updated_at=booking.updated_at,
+                    invitation=BookingInviteSchema(
+                        id=invitation.id,
+                        appointment=appointments[invitation.appointment_id],
+                        appointment_id=invitation.appointment_id,
+                        created_at=invitation.created_at,
+                        practice_id=invitation.practice_id,
+                        staff_id=invitation.staff_id,
+                        staff=staff[invitation.staff_id],
+                        updated_at=invitation.updated_at,
+                    )
+                    if invitation
+                    else None,
+                    invitation_id=invitation.id if invitation else None,
+                )
+            )
+        return result
 
     @atomic
     def create(self, data: BookingSchema) -> BookingSchema:
@@ -105,10 +140,8 @@ class BookingRepo(CommonModelRepo[BookingSchema]):
             invitation_id=data.invitation_id if data.invitation_id else None,
         )
         result = self.get(booking.id)
-        transaction.on_commit(
-            lambda: self.elastic_service.add(id=booking.id, doc_data=result)
-        )
-        return self.get(booking.id)
+        self.outbox.index(self.elastic_service, booking.id)
+        return result
 
     @atomic
     def update(self, id: int, data: BookingSchema) -> BookingSchema:
@@ -127,24 +160,18 @@ class BookingRepo(CommonModelRepo[BookingSchema]):
                 else ""
             )
             cancel_confirmation = f"Your appointment has been cancelled for {booking.available_appointment.start_time} - {booking.available_appointment.end_time} with {doctor_name}"
-            transaction.on_commit(
-                lambda: self.notification_service.send_email(
-                    to_emails=[
-                        patient_email,
-                    ],
-                    subject="Appointment Cancelled",
-                    text=cancel_confirmation,
-                )
+            self.outbox.send_email(
+                to_emails=[
+                    patient_email,
+                ],
+                subject="Appointment Cancelled",
+                text=cancel_confirmation,
             )
 
-            transaction.on_commit(
-                lambda: self.websocket_service.send_message(
-                    practice_id=booking.appointment.practice.id,
-                    type_event=WebsocketEventTypes.UPDATE_AVAILABILITY,
-                    message=self.availability_repo.get(
-                        booking.available_appointment.id
-                    ),
-                )
+            self.outbox.send_message(
+                practice_id=booking.appointment.practice.id,
+                type_event=WebsocketEventTypes.UPDATE_AVAILABILITY,
+                message=self.availability_repo.get(booking.available_appointment.id),
             )
 
             apt.state = "cancelled"
@@ -155,9 +182,7 @@ class BookingRepo(CommonModelRepo[BookingSchema]):
             id=apt.id, data=apt, triggered_by_id=data.booked_by_id
         )
         result = self.get(booking.id)
-        transaction.on_commit(
-            lambda: self.elastic_service.update(id=booking.id, doc_data=result)
-        )
+        self.outbox.index(self.elastic_service, booking.id)
 
         return result
 
@@ -165,7 +190,7 @@ class BookingRepo(CommonModelRepo[BookingSchema]):
     def delete(self, id: int) -> None:
         booking = BookingModel.objects.get(id=id)
         booking.delete()
-        transaction.on_commit(lambda: self.elastic_service.remove(id=id))
+        self.outbox.index(self.elastic_service, id)
 
     @atomic
     def create_invitation(
@@ -179,29 +204,21 @@ class BookingRepo(CommonModelRepo[BookingSchema]):
         )
         if apt.patient:
             link_to_book = f"https://gpbase.co.uk/book/{invitation.id}"
-            transaction.on_commit(
-                lambda: self.notification_service.send_email(
-                    to_emails=[
-                        apt.patient.email,
-                    ],
-                    subject="Booking Invitation",
-                    text=f"You have been invited to book an appointment. Link to book: {link_to_book}",
-                )
+            self.outbox.send_email(
+                to_emails=[
+                    apt.patient.email,
+                ],
+                subject="Booking Invitation",
+                text=f"You have been invited to book an appointment. Link to book: {link_to_book}",
             )
 
         return self.get_booking_invite(invitation.id)
 
-    def recreate_index(self) -> None:
-        queryset = BookingModel.objects.all()
-        docs: list[BookingSchema] = []
-        chunk_size = 2500
-        with ElasticMigration(self.elastic_service):
-            for booking in queryset:
-                result = self.get(id=booking.id)
-                docs.append(result)
-                if len(docs) >= chunk_size:
-                    self.elastic_service.bulk_add_docs(docs)
-                    docs = []
+    def reindex_queryset(self) -> QuerySet:
+        return BookingModel.objects.all()
+
+    def load_documents(self, ids: list[int]) -> list[BookingSchema]:
+        return self.get_many(ids)
 
     def search(
         self,
@@ -308,22 +325,18 @@ class BookingRepo(CommonModelRepo[BookingSchema]):
             )
 
             booking_confirmation = f"Your appointment has been booked for {formatted_start_date} - {formatted_end_date} with {doctor_name}"
-            transaction.on_commit(
-                lambda: self.notification_service.send_email(
-                    to_emails=[
-                        patient_email,
-                    ],
-                    subject="Appointment Booked",
-                    text=booking_confirmation,
-                    ics=ics_calendar,
-                )
+            self.outbox.send_email(
+                to_emails=[
+                    patient_email,
+                ],
+                subject="Appointment Booked",
+                text=booking_confirmation,
+                ics=ics_calendar,
             )
-            transaction.on_commit(
-                lambda: self.websocket_service.send_message(
-                    practice_id=apt.practice_id,
-                    type_event=WebsocketEventTypes.UPDATE_AVAILABILITY,
-                    message=avail,
-                )
+            self.outbox.send_message(
+                practice_id=apt.practice_id,
+                type_event=WebsocketEventTypes.UPDATE_AVAILABILITY,
+                message=avail,
             )
             return booking
         else:
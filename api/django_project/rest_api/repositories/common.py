@@ -1,9 +1,14 @@
 from abc import abstractmethod
-from typing import Generic, TypeVar
+from datetime import datetime
+from typing import Generic, Iterable, Iterator, TypeVar
 
+from django.db.models import QuerySet
 from pydantic import BaseModel
 
+from django_project import settings
 from rest_api.services.elastic import ElasticSearchService
+from rest_api.utils.elastic_migration import ElasticMigration, keyset_id_batches
+from rest_api.utils.identity_map import identity_map_scope
 
 PydanticType = TypeVar("PydanticType", bound=BaseModel)
 
@@ -11,6 +16,10 @@ PydanticType = TypeVar("PydanticType", bound=BaseModel)
 class CommonModelRepo(Generic[PydanticType]):
     pydantic_model: PydanticType
     es_instance: ElasticSearchService
+    # Timestamps, from the reindex_queryset model, of every row a document is
+    # built from. A document is picked up by the delta reindex when any of
+    # them moves past the watermark
+    delta_lookups: tuple[str, ...] = ("updated_at",)
 
     def __init__(
         self,
@@ -22,6 +31,76 @@ class CommonModelRepo(Generic[PydanticType]):
     def get(self, id: int) -> PydanticType:
         pass
 
+    def load_documents(self, ids: list[int]) -> Iterable[PydanticType]:
+        return [self.get(id) for id in ids]
+
+    def get_many_from_index(self, ids: list[int]) -> list[PydanticType]:
+        """Build documents from the search index, reading ids it lacks from the DB"""
+        found = self.es_instance.mget(ids)
+        missing = [id for id in ids if id not in found]
+        if missing:
+            found.update({doc.id: doc for doc in self.load_documents(missing)})
+        return [found[id] for id in ids if id in found]
+
+    @abstractmethod
+    def reindex_queryset(self) -> QuerySet:
+        """Rows that make up the search index"""
+        pass
+
+    def iter_documents(
+        self, first_id: int | None = None, last_id: int | None = None
+    ) -> Iterator[PydanticType]:
+        """Documents for the rows of the index, optionally only those with ids
+        in [first_id, last_id], hydrated settings.ELASTIC_REINDEX_BATCH_SIZE
+        rows at a time"""
+        for ids in keyset_id_batches(
+            self.reindex_queryset(),
+            settings.ELASTIC_REINDEX_BATCH_SIZE,
+            first_id=first_id,
+            last_id=last_id,
+        ):
+            yield from self.load_batch(ids)
+
+    def load_batch(self, ids: list[int]) -> list[PydanticType]:
+        """Documents for one batch of a rebuild, in an identity map of their
+        own. The task-wide map would keep every patient and user hydrated so
+        far until the rebuild ends"""
+        with identity_map_scope():
+            return list(self.load_documents(ids))
+
+    def reindex_range(self, first_id: int, last_id: int) -> int:
+        """Hydrate and bulk index the rows with ids in [first_id, last_id]"""
+        return self.es_instance.stream_add_docs(self.iter_documents(first_id, last_id))
+
+    def changed_ids(self, since: datetime) -> list[int]:
+        """Ids of the documents with a row written after since, one query per
+        lookup so no join multiplies the rows scanned"""
+        ids: set[int] = set()
+        for lookup in self.delta_lookups:
+            ids.update(
+                self.reindex_queryset()
+                .filter(**{f"{lookup}__gt": since})
+                .values_list("id", flat=True)
+            )
+        return sorted(ids)
+
+    def reindex_changed(self, since: datetime) -> int:
+        """Hydrate and upsert the documents changed after since"""
+        ids = self.changed_ids(since)
+        size = settings.ELASTIC_REINDEX_BATCH_SIZE
+        indexed = 0
+        for start in range(0, len(ids), size):
+            end = start + size
+            indexed += self.es_instance.bulk_index_docs(self.load_batch(ids[start:end]))
+        return indexed
+
+    def recreate_index(self) -> None:
+        """Rebuild the index in this process, streaming the whole table. The
+        recreate_*_index tasks split it into chunks run in parallel across
+        workers"""
+        with ElasticMigration(self.es_instance):
+            self.es_instance.stream_add_docs(self.iter_documents())
+
     @abstractmethod
     def create(self, data: PydanticType) -> PydanticType:
         pass
@@ -1,11 +1,19 @@
 import uuid
+from collections import defaultdict
 
 from django.contrib.auth.models import User
 from django.db import transaction
+from django.db.models import QuerySet
 from django.db.transaction import atomic
+from django.utils import timezone
 from injector import inject
 
-from rest_api.events.patient import update_patient_event
+from django_project import settings
+from rest_api.events.geocode import backfill_patient_coordinates_event
+from rest_api.events.propagation import (
+    propagate_after_commit,
+    propagate_entity_event,
+)
 from rest_api.models.patient import (
     PatientDocumentModel,
     PatientModel,
@@ -21,63 +29,111 @@ from rest_api.schemas.patient import (
 )
 from rest_api.services.auth0 import Auth0Service
 from rest_api.services.elastic_indexes.patient import PatientIndex
-from rest_api.services.geo import GeoPyService
+from rest_api.services.geocode import (
+    ADDRESS_FIELDS,
+    GeocodeCache,
+    address_components,
+)
+from rest_api.services.outbox import Outbox
 from rest_api.services.s3 import ObjectStorageService
-from rest_api.utils.elastic_migration import ElasticMigration
+from rest_api.utils.identity_cache import invalidate_user_identity
+from rest_api.utils.identity_map import load_many
+from rest_api.utils.schema_cache import SchemaCache, evict
 
 
 class PatientRepo(CommonModelRepo[PatientSchema]):
 
     elastic_service: PatientIndex
-    geo_service: GeoPyService
+    delta_lookups = (
+        "updated_at",
+        "patientdocumentmodel__uploaded_at",
+        "patientpracticemodel__created_at",
+    )
+    outbox: Outbox
+    geocode_cache: GeocodeCache
     storage_service: ObjectStorageService
     auth0_service: Auth0Service
+    cache: SchemaCache[PatientSchema] = SchemaCache(
+        "patient", PatientSchema, ttl=settings.SCHEMA_CACHE_TTL_SECONDS
+    )
 
     @inject
     def __init__(
         self,
         elastic_service: PatientIndex,
-        geo_service: GeoPyService,
+        outbox: Outbox,
+        geocode_cache: GeocodeCache,
         storage_service: ObjectStorageService,
         auth0_service: Auth0Service,
     ):
         super(PatientRepo, self).__init__(es_instance=elastic_service)
         self.elastic_service = elastic_service
-        self.geo_service = geo_service
+        self.outbox = outbox
+        self.geocode_cache = geocode_cache
         self.storage_service = storage_service
         self.auth0_service = auth0_service
 
     def get(self, id: int) -> PatientSchema:
-        patient = PatientModel.objects.get(id=id)
+        result = self.get_many([id])
+        if id not in result:
+            raise PatientModel.DoesNotExist(f"Patient {id} does not exist")
+        return result[id]
+
+    def get_many(self, ids: list[int]) -> dict[int, PatientSchema]:
+        return load_many(
+            "patient", ids, lambda missing: self.cache.get_many(missing, self.load_many)
+        )
 
-        docs_q = PatientVerificationModel.objects.filter(
-            patient_document__patient=patient
-        ).order_by("-patient_document__uploaded_at")
-        docs = []
+    def load_many(self, ids: list[int]) -> dict[int, PatientSchema]:
+        patients = PatientModel.objects.filter(id__in=ids).select_related("user")
+
+        docs: dict[int, list[PatientDocumentSchema]] = defaultdict(list)
+        docs_q = (
+            PatientVerificationModel.objects.filter(
+                patient_document__patient_id__in=ids
+            )
+            .select_related("patient_document")
+            .order_by("-patient_document__uploaded_at")
+        )
         for doc in docs_q:
-            result = PatientDocumentSchema(
-                download_url=doc.patient_document.s3_url,
-                is_id=doc.is_id,
-                is_proof_of_address=doc.is_proof_of_address,
-                state=doc.state,
-                uploaded_at=doc.patient_document.uploaded_at,
-                id=doc.id,
+            docs[doc.patient_document.patient_id].append(
+                PatientDocumentSchema(
+                    download_url=doc.patient_document.s3_url,
+                    is_id=doc.is_id,
+                    is_proof_of_address=doc.is_proof_of_address,
+                    state=doc.state,
+                    uploaded_at=doc.patient_document.uploaded_at,
+                    id=doc.id,
+                )
             )
-            docs.append(result)
 
+        practice_links: dict[int, list[PatientPracticeLinkSchema]] = defaultdict(list)
         practice_links_q = PatientPracticeModel.objects.filter(
-            patient=patient
+            patient_id__in=ids
         ).order_by("-created_at")
-        practice_links = []
         for link in practice_links_q:
-            link_result = PatientPracticeLinkSchema(
-                id=link.id,
-                patient_id=link.patient.id,
-                practice_id=link.practice.id,
-                created_at=link.created_at,
+            practice_links[link.patient_id].append(
+                PatientPracticeLinkSchema(
+                    id=link.id,
+                    patient_id=link.patient_id,
+                    practice_id=link.practice_id,
+                    created_at=link.created_at,
+                )
+            )
+
+        return {
+            patient.id: self.to_schema(
+                patient, docs[patient.id], practice_links[patient.id]
             )
-            practice_links.append(link_result)
+            for patient in patients
+        }
 
+    def to_schema(
+        self,
+        patient: PatientModel,
+        docs: list[PatientDocumentSchema],
+        practice_links: list[PatientPracticeLinkSchema],
+    ) -> PatientSchema:
         full_address: str = ", ".join(
             [
                 patient.address_line_1,
@@ -125,17 +181,12 @@ class PatientRepo(CommonModelRepo[PatientSchema]):
 
     @atomic
     def create(self, data: PatientSchema, test_data=False) -> PatientSchema:
+        geocode = False
         if not test_data:
-            lat, lng = self.geo_service.get_location_coordinates(
-                components={
-                    "country": data.country,
-                    "city": data.city,
-                    "state": data.state,
-                    "zip_code": data.zip_code,
-                    "address_line_1": data.address_line_1,
-                    "address_line_2": data.address_line_2,
-                }
-            )
+            coordinates = self.geocode_cache.lookup(address_components(data))
+            # A miss is geocoded by a task once the patient has committed
+            geocode = coordinates is None
+            lat, lng = coordinates or (None, None)
         else:
             lat = data.latitude or 0
             lng = data.longitude or 0
@@ -167,10 +218,14 @@ class PatientRepo(CommonModelRepo[PatientSchema]):
             health_care_number=data.health_care_number,
         )
 
+        evict("user", user.id)
         result = self.get(patient.id)
-        transaction.on_commit(
-            lambda: self.elastic_service.add(id=patient.id, doc_data=result)
-        )
+        self.outbox.index(self.elastic_service, patient.id)
+        invalidate_user_identity(user.id)
+        if geocode:
+            transaction.on_commit(
+                lambda: backfill_patient_coordinates_event.delay(patient.id)
+            )
         return result
 
     @atomic
@@ -208,15 +263,11 @@ class PatientRepo(CommonModelRepo[PatientSchema]):
 
     @atomic
     def update(self, id: int, data: PatientSchema) -> PatientSchema:
-        lat, lng = self.geo_service.get_location_coordinates(
-            components={
-                "country": data.country,
-                "city": data.city,
-                "state": data.state,
-                "zip_code": data.zip_code,
-                "address_line_1": data.address_line_1,
-                "address_line_2": data.address_line_2,
-            }
+        current = PatientModel.objects.values(
+            *ADDRESS_FIELDS, "latitude", "longitude"
+        ).get(id=id)
+        lat, lng, geocode = self.geocode_cache.coordinates_for_update(
+            current, address_components(data)
         )
 
         user = User.objects.get(id=data.user_id)
@@ -243,16 +294,33 @@ class PatientRepo(CommonModelRepo[PatientSchema]):
             date_of_birth=data.date_of_birth,
             gender=data.gender,
             health_care_number=data.health_care_number,
+            updated_at=timezone.now(),
         )
 
+        evict("patient", id)
+        evict("user", user.id)
         result = self.get(id)
-        transaction.on_commit(
-            lambda: self.elastic_service.update(id=id, doc_data=result)
-        )
-        transaction.on_commit(lambda: update_patient_event.delay(id))
+        self.outbox.index(self.elastic_service, id)
+        # Copies the patient and its user into the documents showing them
+        propagate_after_commit("user", user.id)
+        if geocode:
+            transaction.on_commit(lambda: backfill_patient_coordinates_event.delay(id))
 
         return result
 
+    def backfill_coordinates(self, id: int) -> None:
+        """Geocode an address that missed the geocode cache on create or
+        update. Runs outside a transaction so the HTTP call holds no locks"""
+        current = PatientModel.objects.values(*ADDRESS_FIELDS).get(id=id)
+        lat, lng = self.geocode_cache.resolve(address_components(current))
+        # Skip the write if the address was changed again in the meantime
+        if PatientModel.objects.filter(id=id, **current).update(
+            latitude=lat, longitude=lng, updated_at=timezone.now()
+        ):
+            evict("patient", id)
+            self.outbox.index(self.elastic_service, id)
+            propagate_entity_event.delay("patient", id)
+
     @atomic
     def delete(self, id: int):
         patient = PatientModel.objects.get(id=id)
@@ -261,8 +329,11 @@ class PatientRepo(CommonModelRepo[PatientSchema]):
         )
         for doc in docs_q:
             self.delete_document(doc.id)
+        user_id = patient.user_id
         patient.delete()
-        transaction.on_commit(lambda: self.elastic_service.remove(id=id))
+        evict("patient", id)
+        self.outbox.index(self.elastic_service, id)
+        invalidate_user_identity(user_id)
 
     def search(self, term: str, size: int = 10) -> list[PatientSchema]:
         if size > 50:
@@ -323,17 +394,11 @@ class PatientRepo(CommonModelRepo[PatientSchema]):
         result_drop_duplicates = list({v.id: v for v in result}.values())
         return result_drop_duplicates
 
-    def recreate_index(self) -> None:
-        queryset = PatientModel.objects.all()
-        docs: list[PatientSchema] = []
-        chunk_size = 2500
-        with ElasticMigration(self.elastic_service):
-            for patient in queryset:
-                result = self.get(id=patient.id)
-                docs.append(result)
-                if len(docs) == chunk_size:
-                    self.elastic_service.bulk_add_docs(docs)
-                    docs = []
+    def reindex_queryset(self) -> QuerySet:
+        return PatientModel.objects.all()
+
+    def load_documents(self, ids: list[int]) -> list[PatientSchema]:
+        return list(self.load_many(ids).values())
 
     @atomic
     def create_upload_id_card(self, patient_id: int, extension: str) -> str:
@@ -346,10 +411,8 @@ class PatientRepo(CommonModelRepo[PatientSchema]):
             is_proof_of_address=False,
             state="submitted",
         )
-        result = self.get(patient_id)
-        transaction.on_commit(
-            lambda: self.elastic_service.update(id=patient_id, doc_data=result)
-        )
+        evict("patient", patient_id)
+        self.outbox.index(self.elastic_service, patient_id)
         return upload_url
 
     @atomic
@@ -363,10 +426,8 @@ class PatientRepo(CommonModelRepo[PatientSchema]):
             is_proof_of_address=True,
             state="submitted",
         )
-        result = self.get(patient_id)
-        transaction.on_commit(
-            lambda: self.elastic_service.update(id=patient_id, doc_data=result)
-        )
+        evict("patient", patient_id)
+        self.outbox.index(self.elastic_service, patient_id)
         return upload_url
 
     @atomic
@@ -376,10 +437,8 @@ class PatientRepo(CommonModelRepo[PatientSchema]):
         patient_id = doc.patient.id
         self.storage_service.delete_object(doc.s3_url)
         doc.delete()
-        result = self.get(patient_id)
-        transaction.on_commit(
-            lambda: self.elastic_service.update(id=patient_id, doc_data=result)
-        )
+        evict("patient", patient_id)
+        self.outbox.index(self.elastic_service, patient_id)
 
     def get_download_url(self, id: int) -> str:
         doc = PatientDocumentModel.objects.get(id=id)
@@ -395,10 +454,9 @@ class PatientRepo(CommonModelRepo[PatientSchema]):
             PatientPracticeModel.objects.create(
                 practice_id=practice_id, patient_id=patient_id
             )
+            evict("patient", patient_id)
             result = self.get(patient_id)
-            transaction.on_commit(
-                lambda: self.elastic_service.update(id=id, doc_data=result)
-            )
+            self.outbox.index(self.elastic_service, patient_id)
             return result
         return None
 
@@ -1,26 +1,73 @@
-from rest_framework.permissions import SAFE_METHODS, BasePermission
+from functools import reduce
+from operator import and_
+
+from django.core import checks
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db.models import Model, Q, QuerySet
+from django.urls import URLResolver, get_resolver
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.permissions import AND, NOT, OR, SAFE_METHODS, BasePermission
 
 from rest_api.models.patient import PatientModel
 from rest_api.models.practice import PracticeModel
 from rest_api.models.staff import StaffModel
 from rest_api.utils.request_handler import get_request_meta_data
 
+DENY_ALL = Q(pk__in=[])
+
+
+def has_field(model: type[Model], name: str) -> bool:
+    try:
+        model._meta.get_field(name)
+        return True
+    except FieldDoesNotExist:
+        return False
+
+
+def parent_column(obj: Model, parent: str, column: str):
+    """A column of the row the object points at, from the parent if it was
+    already fetched and with a single column query otherwise"""
+    field = obj._meta.get_field(parent)
+    if field.is_cached(obj):
+        return getattr(getattr(obj, parent), column)
+    return (
+        field.related_model.objects.filter(pk=getattr(obj, field.attname))
+        .values_list(column, flat=True)
+        .first()
+    )
+
 
 class PatientPermissionReadWrite(BasePermission):
     def has_object_permission(self, request, view, obj):
         meta = get_request_meta_data(request=request)
 
-        if hasattr(obj, "patient"):
-            return obj.patient.id == meta.patient_id
+        if getattr(obj, "patient_id", None) is not None:
+            return obj.patient_id == meta.patient_id
 
-        if hasattr(obj, "appointment"):
-            return obj.appointment.patient.id == meta.patient_id
+        if getattr(obj, "appointment_id", None) is not None:
+            return parent_column(obj, "appointment", "patient_id") == meta.patient_id
 
         if hasattr(obj, "id") and isinstance(obj, PatientModel):
             return obj.id == meta.patient_id
 
         return False
 
+    def has_queryset_permission(self, request, view, model) -> Q:
+        meta = get_request_meta_data(request=request)
+        if meta.patient_id is None:
+            return DENY_ALL
+
+        if has_field(model, "patient"):
+            return Q(patient_id=meta.patient_id)
+
+        if has_field(model, "appointment"):
+            return Q(appointment__patient_id=meta.patient_id)
+
+        if issubclass(model, PatientModel):
+            return Q(id=meta.patient_id)
+
+        return DENY_ALL
+
     def has_permission(self, request, view):
         meta = get_request_meta_data(request=request)
         return meta.patient_id is not None
@@ -35,11 +82,11 @@ class PatientPermissionReadOnly(PatientPermissionReadWrite):
 class StaffPermission(BasePermission):
     def has_object_permission(self, request, view, obj):
         meta = get_request_meta_data(request=request)
-        if hasattr(obj, "practice"):
-            return meta.practice_id == obj.practice.id
+        if getattr(obj, "practice_id", None) is not None:
+            return meta.practice_id is not None and meta.practice_id == obj.practice_id
 
-        if hasattr(obj, "appointment"):
-            return meta.practice_id == obj.appointment.practice.id
+        if getattr(obj, "appointment_id", None) is not None:
+            return meta.practice_id == parent_column(obj, "appointment", "practice_id")
 
         if isinstance(obj, StaffModel):
             return obj.id == meta.staff_id
@@ -49,6 +96,116 @@ class StaffPermission(BasePermission):
 
         return False
 
+    def has_queryset_permission(self, request, view, model) -> Q:
+        meta = get_request_meta_data(request=request)
+        if meta.practice_id is None:
+            return DENY_ALL
+
+        if has_field(model, "practice"):
+            return Q(practice_id=meta.practice_id)
+
+        if has_field(model, "appointment"):
+            return Q(appointment__practice_id=meta.practice_id)
+
+        if issubclass(model, StaffModel):
+            return Q(id=meta.staff_id)
+
+        if issubclass(model, PracticeModel):
+            return Q(id=meta.practice_id)
+
+        return DENY_ALL
+
     def has_permission(self, request, view):
         meta = get_request_meta_data(request=request)
         return meta.staff_id is not None
+
+
+def get_queryset_permission(permission, request, view, model) -> Q:
+    """Translate a (possibly composed) permission into a single SQL filter.
+
+    Mirrors the object level semantics of DRF's OR/AND operands, so that a
+    whole queryset can be authorised at once instead of row by row.
+    """
+    if isinstance(permission, OR):
+        return get_queryset_permission(
+            permission.op1, request, view, model
+        ) | get_queryset_permission(permission.op2, request, view, model)
+
+    if isinstance(permission, AND):
+        return get_queryset_permission(
+            permission.op1, request, view, model
+        ) & get_queryset_permission(permission.op2, request, view, model)
+
+    if isinstance(permission, NOT):
+        raise ImproperlyConfigured(
+            f"{type(view).__name__} negates a permission, which "
+            "ObjectPermissionFilter can't express as a filter"
+        )
+
+    if not permission.has_permission(request, view):
+        return DENY_ALL
+
+    if hasattr(permission, "has_queryset_permission"):
+        return permission.has_queryset_permission(request, view, model)
+
+    return Q()
+
+
+def filter_permitted(request, view, queryset: QuerySet) -> QuerySet:
+    return queryset.filter(
+        reduce(
+            and_,
+            [
+                get_queryset_permission(permission, request, view, queryset.model)
+                for permission in view.get_permissions()
+            ],
+            Q(),
+        )
+    )
+
+
+class ObjectPermissionFilter(BaseFilterBackend):
+    def filter_queryset(self, request, queryset, view):
+        return filter_permitted(request, view, queryset)
+
+
+def negates(permission_class) -> bool:
+    """Whether a permission class composed with &, | and ~ contains a ~"""
+    if getattr(permission_class, "operator_class", None) is NOT:
+        return True
+    return any(
+        negates(getattr(permission_class, operand))
+        for operand in ("op1_class", "op2_class")
+        if hasattr(permission_class, operand)
+    )
+
+
+def iter_view_classes(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_view_classes(pattern.url_patterns)
+        elif hasattr(pattern.callback, "cls"):
+            yield pattern.callback.cls
+
+
+def permission_filter_errors(view_classes=None) -> list[checks.Error]:
+    """System check rejecting negated permissions on views filtered by
+    ObjectPermissionFilter, which can't express them in SQL"""
+    if view_classes is None:
+        view_classes = set(iter_view_classes(get_resolver().url_patterns))
+    errors = []
+    for view_class in view_classes:
+        if ObjectPermissionFilter not in getattr(view_class, "filter_backends", []):
+            continue
+        if any(negates(permission) for permission in view_class.permission_classes):
+            errors.append(
+                checks.Error(
+                    f"{view_class.__name__} negates a permission, which "
+                    "ObjectPermissionFilter can't express as a filter",
+                    hint="Drop ObjectPermissionFilter or the ~ from its "
+                    "permission_classes",
+                    obj=view_class,
+                    id="rest_api.E001",
+                )
+            )
+    return errors
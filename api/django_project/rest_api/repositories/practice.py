@@ -1,10 +1,13 @@
 from django.contrib.auth.models import User
 from django.db import transaction
+from django.db.models import QuerySet
 from django.db.transaction import atomic
+from django.utils import timezone
 from django.utils.text import slugify
 from injector import inject
 
 from django_project import settings
+from rest_api.events.geocode import backfill_practice_coordinates_event
 from rest_api.models.feature_flags import PracticeFeatureFlagModel
 from rest_api.models.practice import PracticeModel
 from rest_api.models.practice_items import (
@@ -18,6 +21,7 @@ from rest_api.models.practice_items import (
 from rest_api.models.staff import StaffModel
 from rest_api.repositories.common import CommonModelRepo
 from rest_api.repositories.staff import StaffRepo
+from rest_api.repositories.utils import resolve_org_practice, resolve_practice_slug
 from rest_api.schemas.common import FeatureFlagSchema, GeoPointSchema
 from rest_api.schemas.practice import (
     ContactOptionSchema,
@@ -28,31 +32,57 @@ from rest_api.schemas.practice import (
     TeamMemberSchema,
 )
 from rest_api.schemas.staff import StaffMemberSchema
-from rest_api.serializers.common import FeatureFlagSerializer
-from rest_api.serializers.practice import (
-    ContactOptionModelSerializer,
-    NoticeSerializer,
-    OpeningHourModelSerializer,
-    TeamMemberSerializer,
-)
 from rest_api.services.auth0 import Auth0Service
 from rest_api.services.elastic_indexes.practice import PracticeIndex
-from rest_api.services.geo import GeoPyService
+from rest_api.services.geocode import (
+    ADDRESS_FIELDS,
+    GeocodeCache,
+    address_components,
+)
+from rest_api.services.outbox import Outbox
 from rest_api.services.s3 import ObjectStorageService
-from rest_api.utils.caching_annotations import create_cache, invalidate_cache
-from rest_api.utils.elastic_migration import ElasticMigration
+from rest_api.utils.identity_cache import (
+    invalidate_org_identity,
+    invalidate_practice_slug_identity,
+)
+from rest_api.utils.response_cache import RenderedResponseCache
+from rest_api.utils.schema_cache import SchemaCache
 
 
 class PracticeRepo(CommonModelRepo[PracticeSummarySchema]):
 
     auth0_service: Auth0Service
     elastic_service: PracticeIndex
-    geo_service: GeoPyService
+    delta_lookups = (
+        "updated_at",
+        "rest_api_openinghourmodel_practices__updated_at",
+        "rest_api_openingtimeexceptionmodel_practices__updated_at",
+        "rest_api_contactoptionmodel_practices__updated_at",
+        "rest_api_noticemodel_practices__updated_at",
+        "rest_api_teammembermodel_practices__updated_at",
+        "rest_api_practicefeatureflagmodel_practices__updated_at",
+        "practiceorglinkmodel__updated_at",
+    )
+    outbox: Outbox
+    geocode_cache: GeocodeCache
     storage_service: ObjectStorageService
     staff_repo: StaffRepo
 
-    cache_prefix = "practice"
-
+    # Public practice pages are served pre-rendered, tagged with the practice
+    # id they show, or LIST_TAG for pages listing practices
+    LIST_TAG = "list"
+    responses = RenderedResponseCache("practice", ttl=60 * 60 * 24)
+    cache: SchemaCache[PracticeSummarySchema] = SchemaCache(
+        "practice",
+        PracticeSummarySchema,
+        ttl=60 * 60 * 24,
+        on_delete=lambda ids: PracticeRepo.responses.invalidate(
+            PracticeRepo.LIST_TAG, *[str(id) for id in ids]
+        ),
+    )
+
+    # Bump when the defaults below change, the rendered list is cached by it
+    FEATURE_FLAGS_VERSION = 1
     feature_flags = [
         FeatureFlagSchema(flag_id="appointment_request", flag_value=False),
         FeatureFlagSchema(flag_id="prescription_request", flag_value=False),
@@ -63,14 +93,16 @@ class PracticeRepo(CommonModelRepo[PracticeSummarySchema]):
         self,
         auth0_service: Auth0Service,
         elastic_service: PracticeIndex,
-        geo_service: GeoPyService,
+        outbox: Outbox,
+        geocode_cache: GeocodeCache,
         storage_service: ObjectStorageService,
         staff_repo: StaffRepo,
     ):
         super(PracticeRepo, self).__init__(es_instance=elastic_service)
         self.auth0_service = auth0_service
         self.elastic_service = elastic_service
-        self.geo_service = geo_service
+        self.outbox = outbox
+        self.geocode_cache = geocode_cache
         self.storage_service = storage_service
         self.staff_repo = staff_repo
 
@@ -81,63 +113,68 @@ class PracticeRepo(CommonModelRepo[PracticeSummarySchema]):
 
     def get_model_by_slug(self, slug: str) -> PracticeModel:
         return PracticeModel.objects.get(
-            slug=slug,
+            id=self.get_id_by_slug(slug),
         )
 
     def get_model_by_org_id(self, org_id: str) -> PracticeModel:
-        org_query = PracticeOrgLinkModel.objects.filter(org_id=org_id).first()
-        return org_query.practice
-
-    @create_cache(object_name=cache_prefix, pydantic_model=PracticeSummarySchema)
-    def get(self, id: int, **kwargs) -> PracticeSummarySchema:
-        practice = PracticeModel.objects.get(
-            id=id,
-        )
-        team_members_query = TeamMemberModel.objects.filter(practice=practice)
-        team_members: list[TeamMemberSchema] = list(
-            map(
-                lambda x: TeamMemberSchema(**TeamMemberSerializer(x).data),
-                team_members_query,
-            )
-        )
-        notices_query = NoticeModel.objects.filter(practice=practice)
-        notices: list[NoticeSchema] = list(
-            map(lambda x: NoticeSchema(**NoticeSerializer(x).data), notices_query)
-        )
-        contacts_query = ContactOptionModel.objects.filter(practice=practice)
-        contacts: list[ContactOptionSchema] = list(
-            map(
-                lambda x: ContactOptionSchema(**ContactOptionModelSerializer(x).data),
-                contacts_query,
-            )
-        )
-        hour_exceptions_query = OpeningTimeExceptionModel.objects.filter(
-            practice=practice
-        )
-        hours_exception: list[OpeningTimeExceptionSchema] = list(
-            map(
-                lambda x: x.__dict__,
-                hour_exceptions_query,
-            )
-        )
-        hours_query = OpeningHourModel.objects.filter(practice=practice)
-        hours: list[OpeningHourSchema] = list(
-            map(
-                lambda x: OpeningHourSchema(**OpeningHourModelSerializer(x).data),
-                hours_query,
-            )
+        return PracticeModel.objects.get(
+            id=self.get_id_by_org_id(org_id),
         )
 
-        flags_query = PracticeFeatureFlagModel.objects.filter(practice=practice)
-        flags: list[FeatureFlagSchema] = list(
-            map(
-                lambda x: FeatureFlagSchema(**FeatureFlagSerializer(x).data),
-                flags_query,
+    def get_id_by_slug(self, slug: str) -> int:
+        practice_id = resolve_practice_slug(slug)
+        if practice_id is None:
+            raise PracticeModel.DoesNotExist(f"Practice {slug} does not exist")
+        return practice_id
+
+    def get_id_by_org_id(self, org_id: str) -> int:
+        practice_id = resolve_org_practice(org_id)
+        if practice_id is None:
+            raise PracticeModel.DoesNotExist(
+                f"Practice for org {org_id} does not exist"
             )
+        return practice_id
+
+    def get(self, id: int, disabled_cache: bool = False) -> PracticeSummarySchema:
+        result = self.get_many([id], disabled_cache=disabled_cache)
+        if id not in result:
+            raise PracticeModel.DoesNotExist(f"Practice {id} does not exist")
+        return result[id]
+
+    def get_many(
+        self, ids: list[int], disabled_cache: bool = False
+    ) -> dict[int, PracticeSummarySchema]:
+        """Read practices through the cache with one MGET, loading misses in bulk"""
+        if disabled_cache:
+            return self.load_many(list(set(ids)))
+        return self.cache.get_many(ids, self.load_many)
+
+    def load_documents(self, ids: list[int]) -> list[PracticeSummarySchema]:
+        return list(self.get_many(ids).values())
+
+    def load_many(self, ids: list[int]) -> dict[int, PracticeSummarySchema]:
+        practices = PracticeModel.objects.filter(id__in=ids).prefetch_related(
+            "rest_api_teammembermodel_practice_related",
+            "rest_api_noticemodel_practice_related",
+            "rest_api_contactoptionmodel_practice_related",
+            "rest_api_openingtimeexceptionmodel_practice_related",
+            "rest_api_openinghourmodel_practice_related",
+            "rest_api_practicefeatureflagmodel_practice_related",
+            "practiceorglinkmodel",
         )
+        return {practice.id: self.to_schema(practice) for practice in practices}
+
+    def to_schema(self, practice: PracticeModel) -> PracticeSummarySchema:
+        def rows(schema, related_name: str) -> list:
+            return [
+                schema(**{f: getattr(row, f) for f in schema.__fields__})
+                for row in getattr(practice, related_name).all()
+            ]
 
-        org_query = PracticeOrgLinkModel.objects.filter(practice_id=practice.id)
-        org_id: str | None = org_query.first().org_id if org_query.exists() else None
+        try:
+            org_id: str | None = practice.practiceorglinkmodel.org_id
+        except PracticeOrgLinkModel.DoesNotExist:
+            org_id = None
 
         full_address: str = ", ".join(
             [
@@ -172,15 +209,26 @@ class PracticeRepo(CommonModelRepo[PracticeSummarySchema]):
             state=practice.state,
             zip_code=practice.zip_code,
             country=practice.country,
-            team_members=team_members,
-            notices=notices,
-            contact_options=contacts,
-            opening_hours=hours,
-            opening_time_exceptions=hours_exception,
+            team_members=rows(
+                TeamMemberSchema, "rest_api_teammembermodel_practice_related"
+            ),
+            notices=rows(NoticeSchema, "rest_api_noticemodel_practice_related"),
+            contact_options=rows(
+                ContactOptionSchema, "rest_api_contactoptionmodel_practice_related"
+            ),
+            opening_hours=rows(
+                OpeningHourSchema, "rest_api_openinghourmodel_practice_related"
+            ),
+            opening_time_exceptions=rows(
+                OpeningTimeExceptionSchema,
+                "rest_api_openingtimeexceptionmodel_practice_related",
+            ),
             created_at=practice.created_at,
             updated_at=practice.updated_at,
             geo_point=geo_point,
-            feature_flags=flags,
+            feature_flags=rows(
+                FeatureFlagSchema, "rest_api_practicefeatureflagmodel_practice_related"
+            ),
         )
 
     def check_if_org_exists(self, practice_id: int) -> bool:
@@ -194,10 +242,8 @@ class PracticeRepo(CommonModelRepo[PracticeSummarySchema]):
 
         org_id = self.auth0_service.add_org(org_name=practice.name, slug=practice.slug)
         PracticeOrgLinkModel.objects.create(practice_id=practice_id, org_id=org_id)
-        result = self.get(id=practice.id)
-        transaction.on_commit(
-            self.elastic_service.update(id=practice.id, doc_data=result)
-        )
+        invalidate_org_identity(org_id)
+        self.outbox.index(self.elastic_service, practice.id)
 
     def create_auth0_user(self, practice_id: int, email: str):
         if not self.check_if_org_exists(practice_id=practice_id):
@@ -210,10 +256,13 @@ class PracticeRepo(CommonModelRepo[PracticeSummarySchema]):
     def delete_org(self, practice_id: int):
         link = PracticeOrgLinkModel.objects.filter(practice_id=practice_id)
         if link.exists():
+            org_id = link.first().org_id
             if self.auth0_service is not None:
-                self.auth0_service.delete_org(id=link.first().org_id)
+                self.auth0_service.delete_org(id=org_id)
             else:
                 raise ValueError("Auth0 service not available")
+            invalidate_org_identity(org_id)
+            self.cache.invalidate(practice_id)
 
     def add_staff_user(self, user_id: str, practice_id: str) -> StaffModel:
         if StaffModel.objects.filter(user_id=user_id).count() == 0:
@@ -238,17 +287,12 @@ class PracticeRepo(CommonModelRepo[PracticeSummarySchema]):
     def create(
         self, data: PracticeSummarySchema, skip_gmaps=False
     ) -> PracticeSummarySchema:
+        geocode = False
         if not skip_gmaps:
-            lat, lng = self.geo_service.get_location_coordinates(
-                components={
-                    "country": data.country,
-                    "city": data.city,
-                    "state": data.state,
-                    "zip_code": data.zip_code,
-                    "address_line_1": data.address_line_1,
-                    "address_line_2": data.address_line_2,
-                }
-            )
+            coordinates = self.geocode_cache.lookup(address_components(data))
+            # A miss is geocoded by a task once the practice has committed
+            geocode = coordinates is None
+            lat, lng = coordinates or (None, None)
         else:
             lat = data.latitude or 0
             lng = data.longitude or 0
@@ -265,6 +309,11 @@ class PracticeRepo(CommonModelRepo[PracticeSummarySchema]):
             latitude=lat,
             longitude=lng,
         )
+        invalidate_practice_slug_identity(practice.slug)
+        if geocode:
+            transaction.on_commit(
+                lambda: backfill_practice_coordinates_event.delay(practice.id)
+            )
 
         if data.staff_id:
             data.staff_id = self.add_staff_user(
@@ -335,28 +384,23 @@ class PracticeRepo(CommonModelRepo[PracticeSummarySchema]):
             )
 
         result = self.get(id=practice.id)
-        transaction.on_commit(
-            lambda: self.elastic_service.add(id=practice.id, doc_data=result)
-        )
+        self.outbox.index(self.elastic_service, practice.id)
         return result
 
     @atomic
-    @invalidate_cache(object_name=cache_prefix)
     def update(self, id: int, data: PracticeSummarySchema) -> PracticeSummarySchema:
-        lat, lng = self.geo_service.get_location_coordinates(
-            components={
-                "country": data.country,
-                "city": data.city,
-                "state": data.state,
-                "zip_code": data.zip_code,
-                "address_line_1": data.address_line_1,
-                "address_line_2": data.address_line_2,
-            }
+        current = PracticeModel.objects.values(
+            *ADDRESS_FIELDS, "latitude", "longitude", "slug"
+        ).get(id=id)
+        lat, lng, geocode = self.geocode_cache.coordinates_for_update(
+            current, address_components(data)
         )
 
+        old_slug = current["slug"]
+        new_slug = slugify(data.name)
         PracticeModel.objects.filter(id=id).update(
             name=data.name,
-            slug=slugify(data.name),
+            slug=new_slug,
             address_line_1=data.address_line_1,
             address_line_2=data.address_line_2,
             city=data.city,
@@ -365,8 +409,11 @@ class PracticeRepo(CommonModelRepo[PracticeSummarySchema]):
             country=data.country,
             latitude=lat,
             longitude=lng,
+            updated_at=timezone.now(),
         )
 
+        if new_slug != old_slug:
+            invalidate_practice_slug_identity(old_slug, new_slug)
         practice = PracticeModel.objects.get(id=id)
 
         team_members_ids = list(map(lambda x: x.id, data.team_members))
@@ -495,18 +542,32 @@ class PracticeRepo(CommonModelRepo[PracticeSummarySchema]):
                 practice=practice, flag_id=flag.flag_id
             ).update(flag_value=flag.flag_value)
 
+        self.cache.invalidate(id)
         result = self.get(id=practice.id, disabled_cache=True)
-        transaction.on_commit(
-            lambda: self.elastic_service.update(id=practice.id, doc_data=result)
-        )
+        self.outbox.index(self.elastic_service, practice.id)
+        if geocode:
+            transaction.on_commit(lambda: backfill_practice_coordinates_event.delay(id))
         return result
 
+    def backfill_coordinates(self, id: int) -> None:
+        """Geocode an address that missed the geocode cache on create or
+        update. Runs outside a transaction so the HTTP call holds no locks"""
+        current = PracticeModel.objects.values(*ADDRESS_FIELDS).get(id=id)
+        lat, lng = self.geocode_cache.resolve(address_components(current))
+        # Skip the write if the address was changed again in the meantime
+        if PracticeModel.objects.filter(id=id, **current).update(
+            latitude=lat, longitude=lng, updated_at=timezone.now()
+        ):
+            self.cache.invalidate(id)
+            self.outbox.index(self.elastic_service, id)
+
     @atomic
-    @invalidate_cache(object_name=cache_prefix)
     def delete(self, id: int):
         practice = PracticeModel.objects.get(id=id)
         self.delete_org(practice_id=id)
-        transaction.on_commit(lambda: self.elastic_service.remove(id=id))
+        self.cache.invalidate(id)
+        self.outbox.index(self.elastic_service, id)
+        invalidate_practice_slug_identity(practice.slug)
         practice.delete()
 
     def search(self, term: str, size: int = 10) -> list[PracticeSummarySchema]:
@@ -557,14 +618,5 @@ class PracticeRepo(CommonModelRepo[PracticeSummarySchema]):
         result_drop_duplicates = list({v.id: v for v in result}.values())
         return result_drop_duplicates
 
-    def recreate_index(self) -> None:
-        queryset = PracticeModel.objects.all()
-        docs: list[PracticeSummarySchema] = []
-        chunk_size = 2500
-        with ElasticMigration(self.elastic_service):
-            for practice in queryset:
-                result = self.get(id=practice.id)
-                docs.append(result)
-                if len(docs) == chunk_size:
-                    self.elastic_service.bulk_add_docs(docs)
-                    docs = []
+    def reindex_queryset(self) -> QuerySet:
+        return PracticeModel.objects.all()
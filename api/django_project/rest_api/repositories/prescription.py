@@ -1,10 +1,14 @@
+from collections import defaultdict
 from datetime import datetime
 
 from django.contrib.auth import get_user_model
 from django.db import transaction
+from django.db.models import QuerySet
 from django.db.transaction import atomic
+from django.utils import timezone
 from injector import inject
 
+from rest_api.events.geocode import backfill_pharmacy_coordinates_event
 from rest_api.models.prescription import (
     PharmacyModel,
     PrescriptionAssignLogModel,
@@ -17,7 +21,10 @@ from rest_api.models.prescription import (
 from rest_api.repositories.common import CommonModelRepo
 from rest_api.repositories.patient import PatientRepo
 from rest_api.repositories.user import UserRepo
-from rest_api.repositories.utils import convert_patient_id_to_user_id
+from rest_api.repositories.utils import (
+    convert_patient_id_to_user_id,
+    flush_buffered_views,
+)
 from rest_api.schemas.common import StateSchema
 from rest_api.schemas.prescription import (
     PharmacySchema,
@@ -28,12 +35,15 @@ from rest_api.schemas.prescription import (
     PrescriptionStateLogSchema,
     PrescriptionViewedLogSchema,
 )
-from rest_api.serializers.prescription import PrescriptionLineItemSerializer
 from rest_api.services.elastic_indexes.prescription import PrescriptionIndex
-from rest_api.services.geo import GeoPyService
-from rest_api.services.notification import NotificationService
+from rest_api.services.geocode import (
+    ADDRESS_FIELDS,
+    GeocodeCache,
+    address_components,
+)
+from rest_api.services.outbox import Outbox
 from rest_api.services.s3 import ObjectStorageService
-from rest_api.utils.elastic_migration import ElasticMigration
+from rest_api.services.view_tracking import ViewTracker
 
 User = get_user_model()
 
@@ -41,9 +51,21 @@ User = get_user_model()
 class PrescriptionRepo(CommonModelRepo[PrescriptionSchema]):
 
     elastic_service: PrescriptionIndex
-    geo_service: GeoPyService
+    delta_lookups = (
+        "updated_at",
+        "patient__updated_at",
+        "assigned_to__updated_at",
+        "pharmacy__updated_at",
+        "prescriptionlineitemmodel__updated_at",
+        "prescriptioncommentmodel__updated_at",
+        "prescriptionstatelogmodel__created_at",
+        "prescriptionassignlogmodel__created_at",
+        "prescriptionviewedlogmodel__created_at",
+    )
+    geocode_cache: GeocodeCache
     storage_service: ObjectStorageService
-    notification_service: NotificationService
+    outbox: Outbox
+    view_tracker: ViewTracker
 
     states: list[StateSchema] = [
         StateSchema(id="submitted", name="Submitted", description="Submitted"),
@@ -61,192 +83,270 @@ class PrescriptionRepo(CommonModelRepo[PrescriptionSchema]):
     def __init__(
         self,
         elastic_service: PrescriptionIndex,
-        geo_service: GeoPyService,
+        geocode_cache: GeocodeCache,
         storage_service: ObjectStorageService,
-        notification_service: NotificationService,
+        outbox: Outbox,
         patient_repo: PatientRepo,
         user_repo: UserRepo,
+        view_tracker: ViewTracker,
     ):
         super(PrescriptionRepo, self).__init__(es_instance=elastic_service)
         self.elastic_service = elastic_service
-        self.geo_service = geo_service
+        self.geocode_cache = geocode_cache
         self.storage_service = storage_service
-        self.notification_service = notification_service
+        self.outbox = outbox
         self.patient_repo = patient_repo
         self.user_repo = user_repo
+        self.view_tracker = view_tracker
 
     def get(self, id: int) -> PrescriptionSchema:
-        prescription = PrescriptionModel.objects.get(
-            id=id,
+        result = self.get_many([id])
+        if not result:
+            raise PrescriptionModel.DoesNotExist(f"Prescription {id} does not exist")
+        return result[0]
+
+    def get_many(
+        self, ids: list[int], expand: set[str] | None = None
+    ) -> list[PrescriptionSchema]:
+        """
+        Hydrate prescriptions with a fixed number of queries, in the order given.
+        `expand` limits the nested collections loaded, the rest are left as None.
+        """
+        if not ids:
+            return []
+
+        def wants(field: str) -> bool:
+            return expand is None or field in expand
+
+        prescriptions = PrescriptionModel.objects.select_related("pharmacy").in_bulk(
+            ids
         )
 
-        items_q = PrescriptionLineItemModel.objects.filter(
-            request=prescription,
+        items: dict[int, list[PrescriptionLineItemSchema]] = defaultdict(list)
+        items_q = PrescriptionLineItemModel.objects.filter(request_id__in=ids).order_by(
+            "id"
         )
+        for item in items_q:
+            items[item.request_id].append(
+                PrescriptionLineItemSchema(
+                    id=item.id,
+                    name=item.name,
+                    quantity=item.quantity,
+                    created_at=item.created_at,
+                    updated_at=item.updated_at,
+                )
+            )
 
-        items: list[PrescriptionLineItemSchema] = list(
-            map(
-                lambda x: PrescriptionLineItemSchema(
-                    **PrescriptionLineItemSerializer(x).data
-                ),
-                items_q,
+        logs_q = list(
+            PrescriptionStateLogModel.objects.filter(prescription_id__in=ids).order_by(
+                "-created_at"
+            )
+            if wants("logs")
+            else []
+        )
+        comments_q = list(
+            PrescriptionCommentModel.objects.filter(prescription_id__in=ids).order_by(
+                "-created_at"
+            )
+            if wants("comments")
+            else []
+        )
+        assign_logs_q = list(
+            PrescriptionAssignLogModel.objects.filter(prescription_id__in=ids).order_by(
+                "-created_at"
+            )
+            if wants("assign_history")
+            else []
+        )
+        viewed_history_q = list(
+            PrescriptionViewedLogModel.objects.filter(prescription_id__in=ids).order_by(
+                "-created_at"
             )
+            if wants("viewed_logs")
+            else []
         )
 
-        logs_q = PrescriptionStateLogModel.objects.filter(prescription_id=id).order_by(
-            "-created_at"
+        user_ids: set[int | None] = set()
+        if wants("assigned_to"):
+            user_ids.update(p.assigned_to_id for p in prescriptions.values())
+        user_ids.update(log.triggered_by_id for log in logs_q)
+        user_ids.update(comm.user_id for comm in comments_q)
+        for log in assign_logs_q:
+            user_ids.update([log.from_user_id, log.to_user_id, log.triggered_by_id])
+        user_ids.update(item.viewed_by_id for item in viewed_history_q)
+        users = self.user_repo.get_many([i for i in user_ids if i is not None])
+        patients = (
+            self.patient_repo.get_many([p.patient_id for p in prescriptions.values()])
+            if wants("patient")
+            else {}
         )
-        logs: list[PrescriptionStateLogSchema] = []
+
+        logs: dict[int, list[PrescriptionStateLogSchema]] = defaultdict(list)
         for log in logs_q:
             if log.transition_away_at is not None:
                 diff_dates = (log.transition_away_at - log.created_at).total_seconds()
             else:
                 diff_dates = None
-            logs.append(
+            logs[log.prescription_id].append(
                 PrescriptionStateLogSchema(
                     id=log.id,
-                    prescription_id=log.prescription.id,
+                    prescription_id=log.prescription_id,
                     created_at=log.created_at,
                     from_state=log.from_state,
                     to_state=log.to_state,
-                    triggered_by_id=log.triggered_by.id,
-                    triggered_by=self.user_repo.get(log.triggered_by.id),
+                    triggered_by_id=log.triggered_by_id,
+                    triggered_by=users[log.triggered_by_id],
                     transition_away_at=log.transition_away_at,
                     transition_delta=diff_dates,
                 )
             )
 
-        comments_q = PrescriptionCommentModel.objects.filter(
-            prescription_id=id
-        ).order_by("-created_at")
-        comments: list[PrescriptionCommentSchema] = []
+        comments: dict[int, list[PrescriptionCommentSchema]] = defaultdict(list)
         for comm in comments_q:
-            comments.append(
+            comments[comm.prescription_id].append(
                 PrescriptionCommentSchema(
                     id=comm.id,
                     comment=comm.comment,
                     created_at=comm.created_at,
-                    prescription_id=comm.prescription.id,
+                    prescription_id=comm.prescription_id,
                     updated_at=comm.updated_at,
-                    user_id=comm.user.id,
-                    user=self.user_repo.get(comm.user.id),
+                    user_id=comm.user_id,
+                    user=users[comm.user_id],
                 )
             )
 
-        assign_logs_q = PrescriptionAssignLogModel.objects.filter(
-            prescription_id=id
-        ).order_by("-created_at")
-        assign_logs: list[PrescriptionAssignSchema] = []
+        assign_logs: dict[int, list[PrescriptionAssignSchema]] = defaultdict(list)
         for log in assign_logs_q:
-            assign_logs.append(
+            assign_logs[log.prescription_id].append(
                 PrescriptionAssignSchema(
                     id=log.id,
-                    prescription_id=log.prescription.id,
+                    prescription_id=log.prescription_id,
                     created_at=log.created_at,
-                    from_user=self.user_repo.get(log.from_user.id)
-                    if log.from_user
-                    else None,
-                    to_user=self.user_repo.get(log.to_user.id) if log.to_user else None,
-                    triggered_by=self.user_repo.get(log.triggered_by.id)
-                    if log.triggered_by
-                    else None,
+                    from_user=users.get(log.from_user_id),
+                    to_user=users.get(log.to_user_id),
+                    triggered_by=users.get(log.triggered_by_id),
                 )
             )
 
-        patient = self.patient_repo.get(prescription.patient.id)
-
-        if prescription.assigned_to:
-            assigned_to = self.user_repo.get(prescription.assigned_to.id)
-        else:
-            assigned_to = None
-
-        viewed_history_q = PrescriptionViewedLogModel.objects.filter(
-            prescription_id=id
-        ).order_by("-created_at")
-        viewed_history: list[PrescriptionViewedLogSchema] = []
-
+        viewed_history: dict[int, list[PrescriptionViewedLogSchema]] = defaultdict(list)
         for item in viewed_history_q:
-            viewed_history.append(
+            viewed_history[item.prescription_id].append(
                 PrescriptionViewedLogSchema(
                     id=item.id,
-                    prescription_id=item.prescription.id,
+                    prescription_id=item.prescription_id,
                     created_at=item.created_at,
-                    viewed_by=self.user_repo.get(item.viewed_by.id),
+                    viewed_by=users[item.viewed_by_id],
                 )
             )
 
-        return PrescriptionSchema(
-            id=prescription.id,
-            updated_at=prescription.updated_at,
-            created_at=prescription.created_at,
-            pharmacy=PharmacySchema(
-                id=prescription.pharmacy.id,
-                name=prescription.pharmacy.name,
-                updated_at=prescription.pharmacy.updated_at,
-                created_at=prescription.pharmacy.created_at,
-                address_line_1=prescription.pharmacy.address_line_1,
-                address_line_2=prescription.pharmacy.address_line_2,
-                latitude=prescription.pharmacy.latitude,
-                longitude=prescription.pharmacy.longitude,
-                city=prescription.pharmacy.city,
-                country=prescription.pharmacy.country,
-                zip_code=prescription.pharmacy.zip_code,
-                state=prescription.pharmacy.state,
-            ),
-            patient_id=prescription.patient.id,
-            practice_id=prescription.practice.id,
-            state=prescription.state,
-            items=items,
-            logs=logs,
-            assigned_to_id=prescription.assigned_to.id
-            if prescription.assigned_to
-            else None,
-            comments=comments,
-            patient=patient,
-            assigned_to=assigned_to,
-            assign_history=assign_logs,
-            viewed_logs=viewed_history,
-        )
+        result: list[PrescriptionSchema] = []
+        for id in ids:
+            prescription = prescriptions.get(id)
+            if prescription is None:
+                continue
+            pharmacy = prescription.pharmacy
+            result.append(
+                PrescriptionSchema(
+                    id=prescription.id,
+                    updated_at=prescription.updated_at,
+                    created_at=prescription.created_at,
+                    pharmacy=PharmacySchema(
+                        id=pharmacy.id,
+                        name=pharmacy.name,
+                        updated_at=pharmacy.updated_at,
+                        created_at=pharmacy.created_at,
+                        address_line_1=pharmacy.address_line_1,
+                        address_line_2=pharmacy.address_line_2,
+                        latitude=pharmacy.latitude,
+                        longitude=pharmacy.longitude,
+                        city=pharmacy.city,
+                        country=pharmacy.country,
+                        zip_code=pharmacy.zip_code,
+                        state=pharmacy.state,
+                    ),
+                    patient_id=prescription.patient_id,
+                    practice_id=prescription.practice_id,
+                    state=prescription.state,
+                    items=items[id],
+                    logs=logs[id] if wants("logs") else None,
+                    assigned_to_id=prescription.assigned_to_id,
+                    comments=comments[id] if wants("comments") else None,
+                    patient=patients.get(prescription.patient_id),
+                    assigned_to=(
+                        users.get(prescription.assigned_to_id)
+                        if wants("assigned_to")
+                        else None
+                    ),
+                    assign_history=(
+                        assign_logs[id] if wants("assign_history") else None
+                    ),
+                    viewed_logs=(viewed_history[id] if wants("viewed_logs") else None),
+                )
+            )
+        return result
+
+    def load_documents(self, ids: list[int]) -> list[PrescriptionSchema]:
+        return self.get_many(ids)
 
     def get_with_tracking(self, id: int, viewed_by: int) -> PrescriptionSchema:
-        if viewed_by is not None:
-            PrescriptionViewedLogModel.objects.create(
-                prescription_id=id, viewed_by_id=viewed_by
-            )
         result = self.get(id=id)
-        self.elastic_service.update(id=id, doc_data=result)
+        if viewed_by is not None:
+            self.view_tracker.record("prescription", id, viewed_by)
         return result
 
+    def flush_viewed_logs(self) -> int:
+        return flush_buffered_views(
+            self.view_tracker,
+            self.outbox,
+            "prescription",
+            PrescriptionViewedLogModel,
+            self.elastic_service,
+        )
+
+    def get_or_create_pharmacy(
+        self, data: PharmacySchema, test_data=False
+    ) -> PharmacyModel:
+        """Pharmacies are told apart by their coordinates. An address the
+        geocode cache misses is matched on its address fields instead, and a
+        new pharmacy is created without coordinates and geocoded by a task
+        once the transaction has committed"""
+        components = address_components(data)
+        if test_data:
+            coordinates = (data.latitude or 0, data.longitude or 0)
+        else:
+            coordinates = self.geocode_cache.lookup(components)
+        if coordinates is not None:
+            pharmacy, _ = PharmacyModel.objects.get_or_create(
+                latitude=coordinates[0],
+                longitude=coordinates[1],
+                defaults={"name": data.name, **components},
+            )
+            return pharmacy
+
+        pharmacy = PharmacyModel.objects.filter(**components).first()
+        if pharmacy is None:
+            pharmacy = PharmacyModel.objects.create(name=data.name, **components)
+            transaction.on_commit(
+                lambda: backfill_pharmacy_coordinates_event.delay(pharmacy.id)
+            )
+        return pharmacy
+
+    def backfill_pharmacy_coordinates(self, id: int) -> None:
+        """Geocode a pharmacy created on a geocode cache miss. Runs outside a
+        transaction so the HTTP call holds no locks"""
+        current = PharmacyModel.objects.values(*ADDRESS_FIELDS).get(id=id)
+        lat, lng = self.geocode_cache.resolve(address_components(current))
+        if PharmacyModel.objects.filter(id=id, **current).update(
+            latitude=lat, longitude=lng, updated_at=timezone.now()
+        ):
+            prescription_ids = PrescriptionModel.objects.filter(
+                pharmacy_id=id
+            ).values_list("id", flat=True)
+            self.outbox.index(self.elastic_service, *prescription_ids)
+
     @atomic
     def create(self, data: PrescriptionSchema, test_data=False) -> PrescriptionSchema:
-        if not test_data:
-            lat, lng = self.geo_service.get_location_coordinates(
-                components={
-                    "country": data.pharmacy.country,
-                    "city": data.pharmacy.city,
-                    "state": data.pharmacy.state,
-                    "zip_code": data.pharmacy.zip_code,
-                    "address_line_1": data.pharmacy.address_line_1,
-                    "address_line_2": data.pharmacy.address_line_2,
-                }
-            )
-        else:
-            lat = data.pharmacy.latitude or 0
-            lng = data.pharmacy.longitude or 0
-
-        pharmacy, created = PharmacyModel.objects.get_or_create(
-            latitude=lat,
-            longitude=lng,
-            defaults={
-                "name": data.pharmacy.name,
-                "address_line_1": data.pharmacy.address_line_1,
-                "address_line_2": data.pharmacy.address_line_2,
-                "city": data.pharmacy.city,
-                "state": data.pharmacy.state,
-                "zip_code": data.pharmacy.zip_code,
-                "country": data.pharmacy.country,
-            },
-        )
+        pharmacy = self.get_or_create_pharmacy(data.pharmacy, test_data=test_data)
 
         if data.patient_id:
             self.patient_repo.add_practice_link(
@@ -276,9 +376,7 @@ class PrescriptionRepo(CommonModelRepo[PrescriptionSchema]):
         )
 
         result = self.get(prescription.id)
-        transaction.on_commit(
-            lambda: self.elastic_service.add(id=prescription.id, doc_data=result)
-        )
+        self.outbox.index(self.elastic_service, prescription.id)
         return result
 
     @atomic
@@ -309,7 +407,7 @@ class PrescriptionRepo(CommonModelRepo[PrescriptionSchema]):
             )
 
             patient_email = PrescriptionModel.objects.get(id=id).patient.user.email
-            self.notification_service.send_email(
+            self.outbox.send_email(
                 to_emails=[patient_email],
                 subject="Prescription State Change",
                 text=f"Your prescription state has changed from {old_state} to {new_state}",
@@ -326,30 +424,7 @@ class PrescriptionRepo(CommonModelRepo[PrescriptionSchema]):
                 appointment_id=id,
             )
 
-        lat, lng = self.geo_service.get_location_coordinates(
-            components={
-                "country": data.pharmacy.country,
-                "city": data.pharmacy.city,
-                "state": data.pharmacy.state,
-                "zip_code": data.pharmacy.zip_code,
-                "address_line_1": data.pharmacy.address_line_1,
-                "address_line_2": data.pharmacy.address_line_2,
-            }
-        )
-
-        pharmacy, created = PharmacyModel.objects.get_or_create(
-            latitude=lat,
-            longitude=lng,
-            defaults={
-                "name": data.pharmacy.name,
-                "address_line_1": data.pharmacy.address_line_1,
-                "address_line_2": data.pharmacy.address_line_2,
-                "city": data.pharmacy.city,
-                "state": data.pharmacy.state,
-                "zip_code": data.pharmacy.zip_code,
-                "country": data.pharmacy.country,
-            },
-        )
+        pharmacy = self.get_or_create_pharmacy(data.pharmacy)
 
         PrescriptionModel.objects.filter(id=id).update(
             pharmacy_id=pharmacy.id,
@@ -357,6 +432,7 @@ class PrescriptionRepo(CommonModelRepo[PrescriptionSchema]):
             patient_id=data.patient_id,
             practice_id=data.practice_id,
             assigned_to_id=data.assigned_to_id,
+            updated_at=timezone.now(),
         )
 
         items_ids = list(map(lambda x: x.id, data.items))
@@ -396,35 +472,17 @@ class PrescriptionRepo(CommonModelRepo[PrescriptionSchema]):
                     user_id=comment.user_id,
                 )
 
-        result = self.get(id)
-        transaction.on_commit(
-            lambda: self.elastic_service.update(id=id, doc_data=result)
-        )
-        return result
+        self.outbox.sync(self.elastic_service, id)
+        return self.get(id)
 
     @atomic
     def delete(self, id: int):
         prescription = PrescriptionModel.objects.get(id=id)
         prescription.delete()
-        transaction.on_commit(lambda: self.elastic_service.remove(id=id))
-
-    def update_index_by_patient_id(self, patient_id: int) -> None:
-        queryset = PrescriptionModel.objects.filter(patient_id=patient_id)
-        for prescript in queryset:
-            p = self.get(id=prescript.id)
-            self.elastic_service.update(id=prescript.id, doc_data=p)
-
-    def recreate_index(self) -> None:
-        queryset = PrescriptionModel.objects.all()
-        docs: list[PrescriptionSchema] = []
-        chunk_size = 2500
-        with ElasticMigration(self.elastic_service):
-            for prescript in queryset:
-                result = self.get(id=prescript.id)
-                docs.append(result)
-                if len(docs) == chunk_size:
-                    self.elastic_service.bulk_add_docs(docs)
-                    docs = []
+        self.outbox.index(self.elastic_service, id)
+
+    def reindex_queryset(self) -> QuerySet:
+        return PrescriptionModel.objects.all()
 
     def search(self, term: str, size: int = 10) -> list[PrescriptionSchema]:
         if size > 50:
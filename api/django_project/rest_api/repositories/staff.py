@@ -1,14 +1,21 @@
 from django.contrib.auth import get_user_model
 from django.db import transaction
+from django.db.models import QuerySet
 from django.db.transaction import atomic
+from django.utils import timezone
 from injector import inject
 
+from django_project import settings
+from rest_api.events.propagation import propagate_after_commit
 from rest_api.models.staff import StaffModel
 from rest_api.repositories.common import CommonModelRepo
 from rest_api.schemas.staff import StaffMemberSchema
 from rest_api.services.auth0 import Auth0Service
 from rest_api.services.elastic_indexes.staff import StaffIndex
-from rest_api.utils.elastic_migration import ElasticMigration
+from rest_api.services.outbox import Outbox
+from rest_api.utils.identity_cache import invalidate_user_identity
+from rest_api.utils.identity_map import load_many
+from rest_api.utils.schema_cache import SchemaCache, evict
 
 User = get_user_model()
 
@@ -16,12 +23,19 @@ User = get_user_model()
 class StaffRepo(CommonModelRepo[StaffMemberSchema]):
 
     elastic_service: StaffIndex
+    outbox: Outbox
     auth0_service: Auth0Service
+    cache: SchemaCache[StaffMemberSchema] = SchemaCache(
+        "staff", StaffMemberSchema, ttl=settings.SCHEMA_CACHE_TTL_SECONDS
+    )
 
     @inject
-    def __init__(self, elastic_service: StaffIndex, auth0_service: Auth0Service):
+    def __init__(
+        self, elastic_service: StaffIndex, outbox: Outbox, auth0_service: Auth0Service
+    ):
         super(StaffRepo, self).__init__(es_instance=elastic_service)
         self.elastic_service = elastic_service
+        self.outbox = outbox
         self.auth0_service = auth0_service
 
     def get_model(self, id: int) -> StaffModel:
@@ -30,11 +44,25 @@ class StaffRepo(CommonModelRepo[StaffMemberSchema]):
         )
 
     def get(self, id: int) -> StaffMemberSchema:
-        model = self.get_model(id=id)
+        result = self.get_many([id])
+        if id not in result:
+            raise StaffModel.DoesNotExist(f"Staff {id} does not exist")
+        return result[id]
+
+    def get_many(self, ids: list[int]) -> dict[int, StaffMemberSchema]:
+        return load_many(
+            "staff", ids, lambda missing: self.cache.get_many(missing, self.load_many)
+        )
+
+    def load_many(self, ids: list[int]) -> dict[int, StaffMemberSchema]:
+        queryset = StaffModel.objects.filter(id__in=ids).select_related("user")
+        return {model.id: self.to_schema(model) for model in queryset}
+
+    def to_schema(self, model: StaffModel) -> StaffMemberSchema:
         return StaffMemberSchema(
             id=model.id,
             user_id=model.user.id,
-            practice_id=model.practice.id if model.practice else None,
+            practice_id=model.practice_id,
             bio=model.bio,
             email=model.user.email,
             first_name=model.user.first_name,
@@ -61,10 +89,10 @@ class StaffRepo(CommonModelRepo[StaffMemberSchema]):
             job_title=data.job_title,
             practice_id=data.practice_id,
         )
+        evict("user", data.user_id)
         result = self.get(id=staff.id)
-        transaction.on_commit(
-            lambda: self.elastic_service.add(id=staff.id, doc_data=result)
-        )
+        self.outbox.index(self.elastic_service, staff.id)
+        invalidate_user_identity(data.user_id)
         transaction.on_commit(
             lambda: self.auth0_service.assign_staff_role(id=user.username)
         )
@@ -78,17 +106,21 @@ class StaffRepo(CommonModelRepo[StaffMemberSchema]):
         user.last_name = data.last_name
         user.email = data.email
         user.save()
+        old_user_id = StaffModel.objects.get(id=id).user_id
         StaffModel.objects.filter(id=id).update(
             user_id=data.user_id,
             bio=data.bio,
             job_title=data.job_title,
             practice_id=data.practice_id,
+            updated_at=timezone.now(),
         )
+        evict("staff", id)
+        evict("user", data.user_id)
         staff = StaffModel.objects.get(id=id)
         result = self.get(id=staff.id)
-        transaction.on_commit(
-            lambda: self.elastic_service.update(id=staff.id, doc_data=result)
-        )
+        self.outbox.index(self.elastic_service, staff.id)
+        propagate_after_commit("user", data.user_id)
+        invalidate_user_identity(old_user_id, data.user_id)
         transaction.on_commit(
             lambda: self.auth0_service.assign_staff_role(id=user.username)
         )
@@ -98,7 +130,9 @@ class StaffRepo(CommonModelRepo[StaffMemberSchema]):
     def delete(self, id: int):
         staff = StaffModel.objects.get(id=id)
         staff.delete()
-        transaction.on_commit(lambda: self.elastic_service.remove(id=id))
+        evict("staff", id)
+        self.outbox.index(self.elastic_service, id)
+        invalidate_user_identity(staff.user_id)
 
     def search(self, term: str, size: int = 10) -> list[StaffMemberSchema]:
         if size > 50:
@@ -154,17 +188,11 @@ class StaffRepo(CommonModelRepo[StaffMemberSchema]):
         result_drop_duplicates = list({v.id: v for v in result}.values())
         return result_drop_duplicates
 
-    def recreate_index(self) -> None:
-        queryset = StaffModel.objects.all()
-        docs: list[StaffMemberSchema] = []
-        chunk_size = 2500
-        with ElasticMigration(self.elastic_service):
-            for staff in queryset:
-                result = self.get(id=staff.id)
-                docs.append(result)
-                if len(docs) == chunk_size:
-                    self.elastic_service.bulk_add_docs(docs)
-                    docs = []
+    def reindex_queryset(self) -> QuerySet:
+        return StaffModel.objects.all()
+
+    def load_documents(self, ids: list[int]) -> list[StaffMemberSchema]:
+        return list(self.load_many(ids).values())
 
     def check_has_onboarded(self, staff_id: int) -> bool:
         staff = self.get(staff_id)
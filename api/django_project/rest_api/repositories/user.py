@@ -1,33 +1,43 @@
 from django.contrib.auth.models import User
-from django.db import transaction
+from django.db.models import QuerySet
 from django.db.transaction import atomic
 from injector import inject
 
+from django_project import settings
+from rest_api.events.propagation import propagate_after_commit
 from rest_api.repositories.common import CommonModelRepo
 from rest_api.schemas.user import UserSchema
 from rest_api.services.elastic_indexes.user import UserIndex
-from rest_api.utils.elastic_migration import ElasticMigration
+from rest_api.services.outbox import Outbox
+from rest_api.utils.identity_map import load_many
+from rest_api.utils.schema_cache import SchemaCache, evict
 
 
 class UserRepo(CommonModelRepo[UserSchema]):
 
     elastic_service: UserIndex
+    delta_lookups = ("date_joined", "stamp__updated_at")
+    outbox: Outbox
+    cache: SchemaCache[UserSchema] = SchemaCache(
+        "user", UserSchema, ttl=settings.SCHEMA_CACHE_TTL_SECONDS
+    )
 
     @inject
     def __init__(
         self,
         elastic_service: UserIndex,
+        outbox: Outbox,
     ):
         super(UserRepo, self).__init__(es_instance=elastic_service)
         self.elastic_service = elastic_service
+        self.outbox = outbox
 
     def get_model(self, id: int) -> User:
         return User.objects.get(
             id=id,
         )
 
-    def get(self, id: int) -> UserSchema:
-        model = self.get_model(id=id)
+    def to_schema(self, model: User) -> UserSchema:
         return UserSchema(
             id=model.id,
             email=model.email,
@@ -36,6 +46,21 @@ class UserRepo(CommonModelRepo[UserSchema]):
             full_name=model.get_full_name(),
         )
 
+    def get(self, id: int) -> UserSchema:
+        result = self.get_many([id])
+        if id not in result:
+            raise User.DoesNotExist(f"User {id} does not exist")
+        return result[id]
+
+    def get_many(self, ids: list[int]) -> dict[int, UserSchema]:
+        return load_many(
+            "user", ids, lambda missing: self.cache.get_many(missing, self.load_many)
+        )
+
+    def load_many(self, ids: list[int]) -> dict[int, UserSchema]:
+        queryset = User.objects.filter(id__in=ids)
+        return {model.id: self.to_schema(model) for model in queryset}
+
     @atomic
     def create(self, data: UserSchema) -> UserSchema:
         user = User.objects.create(
@@ -45,9 +70,7 @@ class UserRepo(CommonModelRepo[UserSchema]):
             username=data.email,
         )
         result = self.get(id=user.id)
-        transaction.on_commit(
-            lambda: self.elastic_service.add(id=user.id, doc_data=result)
-        )
+        self.outbox.index(self.elastic_service, user.id)
 
         return result
 
@@ -58,10 +81,10 @@ class UserRepo(CommonModelRepo[UserSchema]):
         user.last_name = data.last_name
         user.email = data.email
         user.save()
+        evict("user", user.id)
         result = self.get(id=user.id)
-        transaction.on_commit(
-            lambda: self.elastic_service.update(id=id, doc_data=result)
-        )
+        self.outbox.index(self.elastic_service, id)
+        propagate_after_commit("user", id)
 
         return result
 
@@ -69,7 +92,8 @@ class UserRepo(CommonModelRepo[UserSchema]):
     def delete(self, id: int):
         staff = User.objects.get(id=id)
         staff.delete()
-        transaction.on_commit(lambda: self.elastic_service.remove(id=id))
+        evict("user", id)
+        self.outbox.index(self.elastic_service, id)
 
     def search(self, term: str, size: int = 10) -> list[UserSchema]:
         if size > 50:
@@ -112,14 +136,8 @@ class UserRepo(CommonModelRepo[UserSchema]):
         result_drop_duplicates = list({v.id: v for v in result}.values())
         return result_drop_duplicates
 
-    def recreate_index(self) -> None:
-        queryset = User.objects.all()
-        docs: list[UserSchema] = []
-        chunk_size = 2500
-        with ElasticMigration(self.elastic_service):
-            for user in queryset:
-                result = self.get(id=user.id)
-                docs.append(result)
-                if len(docs) == chunk_size:
-                    self.elastic_service.bulk_add_docs(docs)
-                    docs = []
+    def reindex_queryset(self) -> QuerySet:
+        return User.objects.all()
+
+    def load_documents(self, ids: list[int]) -> list[UserSchema]:
+        return list(self.load_many(ids).values())
@@ -1,9 +1,18 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
 from rest_framework.exceptions import NotFound
 
+from rest_api.models.common import CommonViewedLogModel
 from rest_api.models.patient import PatientModel
 from rest_api.models.practice import PracticeModel
 from rest_api.models.practice_items import PracticeOrgLinkModel
 from rest_api.models.staff import StaffModel
+from rest_api.services.elastic import ElasticSearchService
+from rest_api.services.outbox import Outbox
+from rest_api.services.view_tracking import View, ViewTracker
+from rest_api.utils.identity_cache import identity_cache
+
+User = get_user_model()
 
 
 def convert_user_id_to_staff_id(user_id: int) -> int:
@@ -28,15 +37,10 @@ def convert_patient_id_to_user_id(patient_id: int) -> int:
 
 
 def convert_practice_slug_to_id(slug: str) -> int:
-    practice = PracticeModel.objects.filter(slug=slug).first()
-    if not practice:
+    practice_id = resolve_practice_slug(slug)
+    if practice_id is None:
         raise NotFound
-    return practice.id
-
-
-def convert_org_id_to_practice(org_id: str) -> PracticeModel | None:
-    org = PracticeOrgLinkModel.objects.filter(org_id=org_id).first()
-    return org.practice if org else None
+    return practice_id
 
 
 def get_patient_id_or_none(user_id: int) -> int | None:
@@ -44,3 +48,112 @@ def get_patient_id_or_none(user_id: int) -> int | None:
     if not patient:
         return None
     return patient.id
+
+
+def get_staff_id_or_none(user_id: int) -> int | None:
+    staff = StaffModel.objects.filter(user_id=user_id).first()
+    if not staff:
+        return None
+    return staff.id
+
+
+def get_practice_id_or_none(org_id: str) -> int | None:
+    org = PracticeOrgLinkModel.objects.filter(org_id=org_id).first()
+    return org.practice_id if org else None
+
+
+def get_practice_id_by_slug_or_none(slug: str) -> int | None:
+    return PracticeModel.objects.filter(slug=slug).values_list("id", flat=True).first()
+
+
+def resolve_practice_slug(slug: str) -> int | None:
+    key = identity_cache.key("practice_slug", slug)
+    return identity_cache.get_many(
+        {key: lambda: get_practice_id_by_slug_or_none(slug)}
+    )[key]
+
+
+def resolve_org_practice(org_id: str) -> int | None:
+    key = identity_cache.key("practice", org_id)
+    return identity_cache.get_many({key: lambda: get_practice_id_or_none(org_id)})[key]
+
+
+def warm_practice_identities() -> int:
+    """Load every slug and org id mapping into Redis so web processes don't
+    start cold"""
+    values = {
+        identity_cache.key("practice_slug", slug): id
+        for id, slug in PracticeModel.objects.values_list("id", "slug")
+    }
+    values.update(
+        {
+            identity_cache.key("practice", org_id): practice_id
+            for practice_id, org_id in PracticeOrgLinkModel.objects.values_list(
+                "practice_id", "org_id"
+            )
+        }
+    )
+    identity_cache.set_many(values)
+    return len(values)
+
+
+def resolve_user_identity(
+    user_id: int | None, org_id: str | None
+) -> tuple[int | None, int | None, int | None]:
+    patient_key = identity_cache.key("patient", user_id)
+    staff_key = identity_cache.key("staff", user_id)
+    practice_key = identity_cache.key("practice", org_id)
+
+    loaders = {}
+    if user_id is not None:
+        loaders[patient_key] = lambda: get_patient_id_or_none(user_id)
+        loaders[staff_key] = lambda: get_staff_id_or_none(user_id)
+    if org_id:
+        loaders[practice_key] = lambda: get_practice_id_or_none(org_id)
+
+    identity = identity_cache.get_many(loaders) if loaders else {}
+    return (
+        identity.get(patient_key),
+        identity.get(staff_key),
+        identity.get(practice_key),
+    )
+
+
+def flush_buffered_views(
+    view_tracker: ViewTracker,
+    outbox: Outbox,
+    kind: str,
+    log_model: type[CommonViewedLogModel],
+    service: ElasticSearchService,
+) -> int:
+    """Write the buffered views of kind as log_model rows in bulk, and queue
+    their documents for service's index. The log model's foreign key to the
+    viewed object is named after kind"""
+    object_model = log_model._meta.get_field(kind).related_model
+
+    def write(views: list[View]) -> int:
+        # Views of an object or a user deleted since are dropped
+        existing = set(
+            object_model.objects.filter(id__in={id for id, _, _ in views}).values_list(
+                "id", flat=True
+            )
+        )
+        viewers = set(
+            User.objects.filter(
+                id__in={viewed_by_id for _, viewed_by_id, _ in views}
+            ).values_list("id", flat=True)
+        )
+        rows = [
+            log_model(
+                **{f"{kind}_id": id}, viewed_by_id=viewed_by_id, created_at=viewed_at
+            )
+            for id, viewed_by_id, viewed_at in views
+            if id in existing and viewed_by_id in viewers
+        ]
+        if rows:
+            with transaction.atomic():
+                log_model.objects.bulk_create(rows)
+                outbox.index(service, *{getattr(row, f"{kind}_id") for row in rows})
+        return len(rows)
+
+    return view_tracker.flush(kind, write)
@@ -55,6 +55,20 @@ class AppointmentSchema(BaseModel):
     viewed_logs: list[AppointmentViewedLogSchema] | None
 
 
+class AppointmentSummarySchema(BaseModel):
+    id: int | None
+    symptoms: str
+    symptom_category: str
+    symptoms_duration_seconds: int
+    priority: int | None
+    state: str | None
+    patient_id: int
+    practice_id: int
+    assigned_to_id: int | None
+    created_at: datetime | None
+    updated_at: datetime | None
+
+
 AppointmentElasticMapping = {
     "properties": {
         "id": {"type": "keyword"},
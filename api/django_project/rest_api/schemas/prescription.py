@@ -61,6 +61,18 @@ class PrescriptionSchema(BaseModel):
     patient: PatientSchema | None
 
 
+class PrescriptionSummarySchema(BaseModel):
+    id: int | None
+    updated_at: datetime | None
+    created_at: datetime | None
+    items: list[PrescriptionLineItemSchema]
+    pharmacy: PharmacySchema
+    state: str
+    patient_id: int | None
+    assigned_to_id: int | None
+    practice_id: int
+
+
 PrescriptionElasticMapping = {
     "properties": {
         "id": {"type": "keyword"},
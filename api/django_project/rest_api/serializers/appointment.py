@@ -4,6 +4,7 @@ from rest_api.serializers.common import (
     AssignedToSerializer,
     CommentSerializer,
     GroupByPointSerializer,
+    SparseFieldsSerializerMixin,
     StateLogSerializer,
     TimeSeriesPointSerializer,
     UserSerializer,
@@ -36,7 +37,7 @@ class AppointmentViewedLogSerializer(ViewedLogSerializer):
     appointment_id = serializers.IntegerField()
 
 
-class AppointmentSerializer(serializers.Serializer):
+class AppointmentSerializer(SparseFieldsSerializerMixin):
     id = serializers.IntegerField(
         read_only=True,
     )
@@ -1,6 +1,17 @@
 from rest_framework import serializers
 
 
+class SparseFieldsSerializerMixin(serializers.Serializer):
+    """Takes an optional `fields` argument limiting the fields rendered"""
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop("fields", None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
 class UserSerializer(serializers.Serializer):
     id = serializers.IntegerField(
         read_only=True,
@@ -5,6 +5,7 @@ from rest_api.serializers.common import (
     AssignedToSerializer,
     CommentSerializer,
     GroupByPointSerializer,
+    SparseFieldsSerializerMixin,
     StateLogSerializer,
     TimeSeriesPointSerializer,
     UserSerializer,
@@ -48,7 +49,7 @@ class PrescriptionViewedLogSerializer(ViewedLogSerializer):
     prescription_id = serializers.IntegerField()
 
 
-class PrescriptionSerializer(serializers.Serializer):
+class PrescriptionSerializer(SparseFieldsSerializerMixin):
     id = serializers.IntegerField(
         read_only=True,
     )
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+from injector import Inject
+from opentelemetry import metrics
+from redis import Redis
+
+from django_project import settings
+from rest_api.models.index_tombstone import IndexTombstoneModel
+from rest_api.repositories.common import CommonModelRepo
+
+meter = metrics.get_meter(__name__)
+upserted_documents_counter = meter.create_counter(
+    "delta_reindex.upserted_documents",
+    description="Documents written since the watermark and upserted",
+)
+removed_documents_counter = meter.create_counter(
+    "delta_reindex.removed_documents",
+    description="Documents removed for tombstones logged since the watermark",
+)
+
+
+class DeltaReindexer:
+    """
+    Keeps an index in step with its tables without a rebuild. A run upserts
+    every document with a row written after the index's watermark, removes the
+    ones tombstoned after it, and moves the watermark to the time the run
+    started.
+
+    Rows are stamped when written but only seen once committed, so runs look
+    DELTA_REINDEX_OVERLAP_SECONDS further back than the watermark. Upserts and
+    removals are idempotent, the overlap only repeats a little work.
+    """
+
+    def __init__(self, redis: Inject[Redis]):
+        self.redis = redis
+
+    @staticmethod
+    def key(index_name: str) -> str:
+        return f"delta_reindex_{index_name}_watermark"
+
+    def watermark(self, index_name: str) -> datetime | None:
+        value = self.redis.get(self.key(index_name))
+        return datetime.fromisoformat(value.decode()) if value else None
+
+    def sync(
+        self, repo: CommonModelRepo, since: datetime | None = None
+    ) -> tuple[int, int]:
+        """Bring the index up to date from its watermark, or from since, and
+        return how many documents were upserted and removed"""
+        service = repo.es_instance
+        started = timezone.now()
+        if since is None:
+            watermark = self.watermark(service.es_index_name) or started
+            since = watermark - timedelta(
+                seconds=settings.DELTA_REINDEX_OVERLAP_SECONDS
+            )
+
+        upserted = repo.reindex_changed(since)
+        deleted_ids = sorted(
+            set(
+                IndexTombstoneModel.objects.filter(
+                    index_name=service.es_index_name, deleted_at__gt=since
+                ).values_list("document_id", flat=True)
+            )
+        )
+        removed = service.bulk_remove_docs(deleted_ids) if deleted_ids else 0
+        self.redis.set(self.key(service.es_index_name), started.isoformat())
+
+        attributes = {"index": service.es_index_name}
+        upserted_documents_counter.add(upserted, attributes)
+        removed_documents_counter.add(removed, attributes)
+        return upserted, removed
+
+    @staticmethod
+    def prune_tombstones() -> int:
+        cutoff = timezone.now() - timedelta(
+            days=settings.INDEX_TOMBSTONE_RETENTION_DAYS
+        )
+        deleted, _ = IndexTombstoneModel.objects.filter(deleted_at__lt=cutoff).delete()
+        return deleted
@@ -1,22 +1,73 @@
 import json
 import uuid
 from functools import wraps
-from typing import Any, Callable, Generic, TypeVar, cast
+from typing import Any, Callable, Generic, Iterable, Iterator, TypeVar, cast
 
-from elasticsearch import Elasticsearch, helpers
+from elasticsearch import Elasticsearch, NotFoundError, helpers
 from injector import Inject
 from pydantic import BaseModel
 from redis import Redis
 
+from django_project import settings
+
 FuncT = TypeVar("FuncT", bound=Callable[..., Any])
 ElasticPydanticModel = TypeVar("ElasticPydanticModel", bound=BaseModel)
 
 
+# Replaces every copy of an embedded document found at one of the paths,
+# walking into lists along the way, and skips documents without one
+UPDATE_EMBEDDED_SCRIPT = """
+boolean replace(def node, List path, int depth, Map document, String id) {
+  if (node instanceof List) {
+    boolean changed = false;
+    for (def item : node) {
+      if (replace(item, path, depth, document, id)) {
+        changed = true;
+      }
+    }
+    return changed;
+  }
+  if (!(node instanceof Map)) {
+    return false;
+  }
+  if (depth == path.size()) {
+    if (!id.equals(String.valueOf(node.get('id')))) {
+      return false;
+    }
+    node.putAll(document);
+    return true;
+  }
+  return replace(node.get(path.get(depth)), path, depth + 1, document, id);
+}
+
+boolean changed = false;
+for (List path : params.paths) {
+  if (replace(ctx._source, path, 0, params.document, params.id)) {
+    changed = true;
+  }
+}
+if (!changed) {
+  ctx.op = 'noop';
+}
+"""
+
+
+def is_index_not_found(error: NotFoundError) -> bool:
+    """A missing index, as opposed to a missing document"""
+    return error.error == "index_not_found_exception"
+
+
 class ElasticSearchService(Generic[ElasticPydanticModel]):
     es_index_name: str
     pydantic_model: ElasticPydanticModel
     es_index_mapping: dict
     es_settings: dict
+    # Indexes whose documents are read back right after a write, e.g. a list
+    # refetched once a form is saved. Their outbox rows get a task of their
+    # own instead of waiting for the next drain
+    read_your_writes: bool = False
+    # Write alias -> index version it was last seen to exist at, per process
+    known_indexes: dict[str, int] = {}
 
     def __init__(
         self,
@@ -31,10 +82,30 @@ class ElasticSearchService(Generic[ElasticPydanticModel]):
 
     @staticmethod
     def index_check_decorator(func: FuncT) -> FuncT:
+        """Make sure the index exists before a write, writing to a missing
+        write alias would create a plain index with the alias' name"""
+
         @wraps(func)
         def wrapper(self, *args, **kwargs):
-            if not self.check_index_exists():
-                self.create_index()
+            self.ensure_index()
+            return func(self, *args, **kwargs)
+
+        return cast(FuncT, wrapper)
+
+    @staticmethod
+    def create_missing_index(func: FuncT) -> FuncT:
+        """Read without checking first, and only create the index and retry
+        when the read fails because it is missing"""
+
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return func(self, *args, **kwargs)
+            except NotFoundError as e:
+                if not is_index_not_found(e):
+                    raise
+            self.forget_index()
+            self.ensure_index()
             return func(self, *args, **kwargs)
 
         return cast(FuncT, wrapper)
@@ -47,6 +118,33 @@ class ElasticSearchService(Generic[ElasticPydanticModel]):
     def write_name(self) -> str:
         return self.es_index_name + ".write"
 
+    @property
+    def version_key(self) -> str:
+        return f"{self.es_index_name}_index_version"
+
+    def index_version(self) -> int:
+        return int(self.redis.get(self.version_key) or 0)
+
+    def bump_index_version(self) -> None:
+        """Make every process check the index again before its next write"""
+        self.redis.incr(self.version_key)
+        self.forget_index()
+
+    def forget_index(self) -> None:
+        self.known_indexes.pop(self.write_name, None)
+
+    def ensure_index(self) -> None:
+        """Check the index exists, or create it, once per process until its
+        aliases are moved or it is deleted. Costs a Redis GET instead of an
+        Elasticsearch round trip once it is known"""
+        version = self.index_version()
+        if self.known_indexes.get(self.write_name) == version:
+            return
+        if not self.check_index_exists():
+            self.create_index()
+            version = self.index_version()
+        self.known_indexes[self.write_name] = version
+
     def get_new_index_name(self):
         guid = str(uuid.uuid4())
         return f"{self.es_index_name}_{guid}"
@@ -75,10 +173,13 @@ class ElasticSearchService(Generic[ElasticPydanticModel]):
                 },
             ]
         )
+        self.bump_index_version()
         return result
 
-    def begin_migration(self):
-        self.lock.acquire(blocking=True)
+    def begin_migration(self, token: str | None = None):
+        """Point the write alias at a fresh index. Pass a token to finish the
+        migration from another process, e.g. at the end of a chord"""
+        self.lock.acquire(blocking=True, token=token)
         new_index_name = self.get_new_index_name()
         self.es.indices.create(
             index=new_index_name,
@@ -104,8 +205,9 @@ class ElasticSearchService(Generic[ElasticPydanticModel]):
                 }
             )
         self.es.indices.update_aliases(actions=actions)
+        self.bump_index_version()
 
-    def end_migration(self):
+    def end_migration(self, token: str | None = None):
         action = []
         current_index_names = self.get_index_names_with_alias(self.read_name)
         for index_name in current_index_names:
@@ -132,11 +234,12 @@ class ElasticSearchService(Generic[ElasticPydanticModel]):
         self.es.indices.update_aliases(actions=action)
         for index_name in current_index_names:
             self.es.indices.delete(index=index_name, ignore_unavailable=True)
+        self.bump_index_version()
 
         self.refresh_index()
-        self.lock.release()
+        self.release_lock(token)
 
-    def handle_migration_exception(self):
+    def handle_migration_exception(self, token: str | None = None):
         action = []
         new_index_names = self.get_index_names_with_alias(self.write_name)
         for index_name in new_index_names:
@@ -163,8 +266,21 @@ class ElasticSearchService(Generic[ElasticPydanticModel]):
         self.es.indices.update_aliases(actions=action)
         for index_name in new_index_names:
             self.es.indices.delete(index=index_name, ignore_unavailable=True)
+        self.bump_index_version()
 
-        self.lock.release()
+        self.release_lock(token)
+
+    def extend_lock(self, token: str) -> None:
+        """Reset the migration lock's TTL from a process other than the one
+        that took it, so a rebuild running longer than the TTL keeps it"""
+        self.lock.local.token = self.redis.get_encoder().encode(token)
+        self.lock.reacquire()
+
+    def release_lock(self, token: str | None = None):
+        if token is None:
+            self.lock.release()
+        else:
+            self.lock.do_release(token)
 
     def update_index_mapping(self):
         return self.es.indices.put_mapping(
@@ -173,7 +289,9 @@ class ElasticSearchService(Generic[ElasticPydanticModel]):
         )
 
     def delete_index(self):
-        return self.es.indices.delete(index=self.write_name, ignore_unavailable=True)
+        result = self.es.indices.delete(index=self.write_name, ignore_unavailable=True)
+        self.bump_index_version()
+        return result
 
     def check_index_exists(self):
         return self.es.indices.exists(index=self.write_name)
@@ -183,37 +301,38 @@ class ElasticSearchService(Generic[ElasticPydanticModel]):
 
     @index_check_decorator
     def add(self, id: str, doc_data: ElasticPydanticModel):
-        if not self.es.exists(index=self.write_name, id=id):
-            return self.es.index(
-                index=self.write_name,
-                id=id,
-                document=doc_data.dict(),
-                refresh=True,
-            )
+        # An id that is already indexed is rejected with a 409 and ignored
+        return self.es.options(ignore_status=409).create(
+            index=self.write_name, id=id, document=doc_data.dict()
+        )
 
     @index_check_decorator
     def remove(self, id):
-        if self.es.exists(index=self.write_name, id=id):
-            return self.es.delete(index=self.write_name, id=id, refresh=True)
+        return self.es.options(ignore_status=404).delete(index=self.write_name, id=id)
 
-    @index_check_decorator
+    @create_missing_index
     def get(self, id) -> ElasticPydanticModel | None:
         res = self.es.get(index=self.read_name, id=id)["_source"]
         if res:
-            return self.pydantic_model.parse_obj(**res)
+            return self.pydantic_model.parse_obj(res)
         return None
 
+    @create_missing_index
+    def mget(self, ids: list[int]) -> dict[int, ElasticPydanticModel]:
+        if not ids:
+            return {}
+        docs = self.es.mget(index=self.read_name, ids=[str(id) for id in ids])["docs"]
+        return {
+            int(doc["_id"]): self.pydantic_model.parse_obj(doc["_source"])
+            for doc in docs
+            if doc.get("found")
+        }
+
     @index_check_decorator
     def update(self, id, doc_data: ElasticPydanticModel):
-        return self.es.update(
-            index=self.write_name,
-            id=id,
-            doc=doc_data.dict(),
-            refresh=True,
-            doc_as_upsert=True,
-        )
+        return self.es.index(index=self.write_name, id=id, document=doc_data.dict())
 
-    @index_check_decorator
+    @create_missing_index
     def search(
         self,
         query: dict | None = None,
@@ -225,19 +344,126 @@ class ElasticSearchService(Generic[ElasticPydanticModel]):
             index=self.read_name, query=query, suggest=suggest, size=size, aggs=aggs
         )
 
-    def bulk_add_docs(self, documents: list[ElasticPydanticModel]) -> int:
-        actions = []
+    @index_check_decorator
+    def bulk_index_docs(
+        self, documents: list[ElasticPydanticModel], refresh: bool | str = False
+    ) -> int:
+        """Create or replace many documents in one request"""
+        success_count, fails = helpers.bulk(
+            self.es, self.document_actions(documents, "index"), refresh=refresh
+        )
+        if isinstance(fails, list) and len(fails) > 0:
+            raise Exception(f"Failed to bulk index docs: {json.dumps(fails)}")
+        return success_count
+
+    @index_check_decorator
+    def bulk_update_fields(self, fields_by_id: dict[int, dict]) -> int:
+        """Partially update many documents, skipping ones not indexed yet"""
+        actions = [
+            {
+                "_index": self.write_name,
+                "_op_type": "update",
+                "_id": id,
+                "doc": fields,
+            }
+            for id, fields in fields_by_id.items()
+        ]
+        success_count, fails = helpers.bulk(self.es, actions, raise_on_error=False)
+        if isinstance(fails, list):
+            fails = [x for x in fails if x.get("update", {}).get("status") != 404]
+            if len(fails) > 0:
+                raise Exception(f"Failed to bulk update docs: {json.dumps(fails)}")
+        return success_count
+
+    @index_check_decorator
+    def bulk_remove_docs(self, ids: list[int], refresh: bool | str = False) -> int:
+        """Delete many documents in one request, skipping ones not indexed"""
+        actions = [
+            {"_index": self.write_name, "_op_type": "delete", "_id": id} for id in ids
+        ]
+        success_count, fails = helpers.bulk(
+            self.es, actions, raise_on_error=False, refresh=refresh
+        )
+        if isinstance(fails, list):
+            fails = [x for x in fails if x.get("delete", {}).get("status") != 404]
+            if len(fails) > 0:
+                raise Exception(f"Failed to bulk remove docs: {json.dumps(fails)}")
+        return success_count
+
+    @index_check_decorator
+    def update_embedded(
+        self, ids: list[int], paths: Iterable[str], document: BaseModel
+    ) -> int:
+        """Replace the copies of another index's document embedded at the
+        given dotted paths of these documents in place, with one
+        update_by_query per INDEX_PROPAGATION_BATCH_SIZE documents"""
+        params = {
+            "paths": [path.split(".") for path in paths],
+            "id": str(document.id),
+            "document": document.dict(),
+        }
+        size = settings.INDEX_PROPAGATION_BATCH_SIZE
+        updated = 0
+        for start in range(0, len(ids), size):
+            end = start + size
+            result = self.es.update_by_query(
+                index=self.write_name,
+                query={"ids": {"values": [str(id) for id in ids[start:end]]}},
+                script={
+                    "source": UPDATE_EMBEDDED_SCRIPT,
+                    "lang": "painless",
+                    "params": params,
+                },
+                # A document rewritten meanwhile was hydrated after this change
+                conflicts="proceed",
+            )
+            updated += result["updated"]
+        return updated
+
+    def document_actions(
+        self, documents: Iterable[ElasticPydanticModel], op_type: str
+    ) -> Iterator[dict]:
         for doc in documents:
             data_dict = doc.dict()
-            actions.append(
-                {
-                    "_index": self.write_name,
-                    "_op_type": "create",
-                    "_id": data_dict.get("id"),
-                    "_source": doc.dict(),
-                }
-            )
-        success_count, fails = helpers.bulk(self.es, actions)
+            yield {
+                "_index": self.write_name,
+                "_op_type": op_type,
+                "_id": data_dict.get("id"),
+                "_source": data_dict,
+            }
+
+    def bulk_add_docs(self, documents: list[ElasticPydanticModel]) -> int:
+        success_count, fails = helpers.bulk(
+            self.es, self.document_actions(documents, "create")
+        )
         if isinstance(fails, list) and len(fails) > 0:
             raise Exception(f"Failed to bulk add docs: {json.dumps(fails)}")
         return success_count
+
+    def stream_add_docs(self, documents: Iterable[ElasticPydanticModel]) -> int:
+        """Create documents from a lazy iterable, e.g. a generator hydrating
+        rows batch by batch.
+
+        Documents are serialized as they are pulled and sent in requests cut
+        by count and by size, and the next document is only pulled once the
+        current request has been answered, so a slow or rejecting cluster
+        slows hydration down instead of letting documents pile up in memory.
+        """
+        success_count = 0
+        fails = []
+        for ok, item in helpers.streaming_bulk(
+            self.es,
+            self.document_actions(documents, "create"),
+            chunk_size=settings.ELASTIC_BULK_CHUNK_SIZE,
+            max_chunk_bytes=settings.ELASTIC_BULK_MAX_BYTES,
+            max_retries=settings.ELASTIC_BULK_MAX_RETRIES,
+            raise_on_error=False,
+        ):
+            if ok:
+                success_count += 1
+            elif len(fails) < 10:
+                # Only a sample, a broken mapping would fail every document
+                fails.append(item)
+        if fails:
+            raise Exception(f"Failed to bulk add docs: {json.dumps(fails)}")
+        return success_count
@@ -8,3 +8,5 @@ class AppointmentIndex(ElasticSearchService):
     pydantic_model = AppointmentSchema
     es_index_mapping = AppointmentElasticMapping
     es_settings = {}
+    # The appointment list reads documents back from the index
+    read_your_writes = True
@@ -8,3 +8,5 @@ class BookingIndex(ElasticSearchService):
     pydantic_model = BookingSchema
     es_index_mapping = BookingElasticMapping
     es_settings = {}
+    # Bookings are only listed through search
+    read_your_writes = True
@@ -0,0 +1,104 @@
+import hashlib
+import re
+from typing import Any
+
+from django.core.cache import cache
+from injector import Inject
+
+from rest_api.models.geocode import GeocodeModel
+from rest_api.services.geo import GeoPyService
+
+ADDRESS_FIELDS = (
+    "country",
+    "city",
+    "state",
+    "zip_code",
+    "address_line_1",
+    "address_line_2",
+)
+
+
+def address_components(source: Any) -> dict[str, str | None]:
+    """Address fields of a schema, model or values() dict, in a fixed order"""
+    if isinstance(source, dict):
+        return {field: source.get(field) for field in ADDRESS_FIELDS}
+    return {field: getattr(source, field, None) for field in ADDRESS_FIELDS}
+
+
+def normalize_address(components: dict[str, str | None]) -> str:
+    parts = []
+    for field in ADDRESS_FIELDS:
+        value = re.sub(r"[^\w\s]", " ", (components.get(field) or "").lower())
+        parts.append(" ".join(value.split()))
+    return "|".join(parts)
+
+
+def address_fingerprint(components: dict[str, str | None]) -> str:
+    return hashlib.sha1(normalize_address(components).encode()).hexdigest()
+
+
+class GeocodeCache:
+    """
+    Geocoding results keyed by a fingerprint of the normalized address, kept
+    in Postgres with Redis in front. Only resolve() calls out to Google, so
+    code running inside a transaction can use lookup() and leave misses to
+    a task.
+    """
+
+    redis_ttl = 60 * 60 * 24 * 7
+
+    def __init__(self, geo_service: Inject[GeoPyService]):
+        self.geo_service = geo_service
+
+    @staticmethod
+    def key(fingerprint: str) -> str:
+        return f"geocode_{fingerprint}"
+
+    def lookup(self, components: dict[str, str | None]) -> tuple[float, float] | None:
+        fingerprint = address_fingerprint(components)
+        cached = cache.get(self.key(fingerprint))
+        if cached is not None:
+            return cached[0], cached[1]
+
+        row = GeocodeModel.objects.filter(fingerprint=fingerprint).first()
+        if row is None:
+            return None
+        cache.set(self.key(fingerprint), (row.latitude, row.longitude), self.redis_ttl)
+        return row.latitude, row.longitude
+
+    def coordinates_for_update(
+        self, current: dict[str, Any], components: dict[str, str | None]
+    ) -> tuple[float | None, float | None, bool]:
+        """Coordinates to store for an address write without calling out.
+
+        An unchanged address keeps the current coordinates and a cached one
+        uses the cached coordinates. Otherwise the current coordinates are
+        kept and the last item is True: the caller should resolve() the new
+        address once its transaction has committed.
+        """
+        if address_fingerprint(current) == address_fingerprint(components):
+            return current["latitude"], current["longitude"], False
+        coordinates = self.lookup(components)
+        if coordinates is not None:
+            return coordinates[0], coordinates[1], False
+        return current["latitude"], current["longitude"], True
+
+    def resolve(self, components: dict[str, str | None]) -> tuple[float, float]:
+        coordinates = self.lookup(components)
+        if coordinates is not None:
+            return coordinates
+
+        lat, lng = self.geo_service.get_location_coordinates(components=components)
+        if (lat, lng) != (0.0, 0.0):
+            # Failed lookups aren't stored so the address is retried next time
+            fingerprint = address_fingerprint(components)
+            GeocodeModel.objects.get_or_create(
+                fingerprint=fingerprint,
+                defaults={
+                    "address": normalize_address(components),
+                    "latitude": lat,
+                    "longitude": lng,
+                },
+            )
+            cache.set(self.key(fingerprint), (lat, lng), self.redis_ttl)
+        return lat, lng
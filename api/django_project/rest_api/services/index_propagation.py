@@ -0,0 +1,166 @@
+"""
+Where documents embed copies of other entities.
+
+Appointments and prescriptions carry their patient and every user shown on
+them, bookings carry a whole appointment plus the booking user and the invited
+staff member. When one of those entities changes, its copies are replaced in
+place with a scripted update_by_query per dependent index, instead of
+rehydrating every document that shows it.
+"""
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+from django.db import models
+from django.db.models import Q
+
+from rest_api.models.appointment import (
+    AppointmentAssignLogModel,
+    AppointmentCommentModel,
+    AppointmentModel,
+    AppointmentStateLogModel,
+    AppointmentViewedLogModel,
+)
+from rest_api.models.booking import BookingModel
+from rest_api.models.prescription import (
+    PrescriptionAssignLogModel,
+    PrescriptionCommentModel,
+    PrescriptionModel,
+    PrescriptionStateLogModel,
+    PrescriptionViewedLogModel,
+)
+from rest_api.services.elastic import ElasticSearchService
+from rest_api.services.elastic_indexes.appointment import AppointmentIndex
+from rest_api.services.elastic_indexes.booking import BookingIndex
+from rest_api.services.elastic_indexes.prescription import PrescriptionIndex
+
+Resolver = Callable[[int], Iterable[int]]
+
+
+@dataclass(frozen=True)
+class Embedding:
+    index: type[ElasticSearchService]
+    # Dotted paths to the copies, through lists and nested objects alike
+    paths: tuple[str, ...]
+    # Ids of the documents of the index that embed the given entity id
+    documents: Resolver
+
+
+# Users shown on an appointment or a prescription
+USER_PATHS = (
+    "assigned_to",
+    "logs.triggered_by",
+    "comments.user",
+    "assign_history.from_user",
+    "assign_history.to_user",
+    "assign_history.triggered_by",
+    "viewed_logs.viewed_by",
+)
+
+
+def in_bookings(paths: Iterable[str]) -> tuple[str, ...]:
+    """Paths of an appointment's copies in a booking, which embeds it twice:
+    as its appointment and as its invitation's"""
+    return tuple(
+        f"{prefix}.{path}"
+        for prefix in ("appointment", "invitation.appointment")
+        for path in paths
+    )
+
+
+def documents_of_patient(model: type[models.Model]) -> Resolver:
+    def resolve(patient_id: int) -> Iterable[int]:
+        return model.objects.filter(patient_id=patient_id).values_list("id", flat=True)
+
+    return resolve
+
+
+def documents_showing_user(
+    model: type[models.Model],
+    parent: str,
+    children: dict[type[models.Model], tuple[str, ...]],
+) -> Resolver:
+    """Ids of the documents that show the user as the assignee or on a
+    comment or log entry"""
+
+    def resolve(user_id: int) -> set[int]:
+        # assigned_to is hydrated through the user repo, so it holds a user id
+        ids = set(
+            model.objects.filter(assigned_to_id=user_id).values_list("id", flat=True)
+        )
+        for child, user_fields in children.items():
+            query = Q()
+            for field in user_fields:
+                query |= Q(**{f"{field}_id": user_id})
+            ids.update(
+                child.objects.filter(query).values_list(f"{parent}_id", flat=True)
+            )
+        return ids
+
+    return resolve
+
+
+appointments_showing_user = documents_showing_user(
+    AppointmentModel,
+    "appointment",
+    {
+        AppointmentCommentModel: ("user",),
+        AppointmentStateLogModel: ("triggered_by",),
+        AppointmentAssignLogModel: ("from_user", "to_user", "triggered_by"),
+        AppointmentViewedLogModel: ("viewed_by",),
+    },
+)
+
+prescriptions_showing_user = documents_showing_user(
+    PrescriptionModel,
+    "prescription",
+    {
+        PrescriptionCommentModel: ("user",),
+        PrescriptionStateLogModel: ("triggered_by",),
+        PrescriptionAssignLogModel: ("from_user", "to_user", "triggered_by"),
+        PrescriptionViewedLogModel: ("viewed_by",),
+    },
+)
+
+
+def bookings_showing_user(user_id: int) -> Iterable[int]:
+    return BookingModel.objects.filter(
+        Q(booked_by_id=user_id)
+        | Q(appointment_id__in=appointments_showing_user(user_id))
+    ).values_list("id", flat=True)
+
+
+def bookings_of_patient(patient_id: int) -> Iterable[int]:
+    return BookingModel.objects.filter(appointment__patient_id=patient_id).values_list(
+        "id", flat=True
+    )
+
+
+def bookings_inviting_staff(staff_id: int) -> Iterable[int]:
+    return BookingModel.objects.filter(
+        appointment__bookinginvitemodel__staff_id=staff_id
+    ).values_list("id", flat=True)
+
+
+EMBEDDINGS: dict[str, list[Embedding]] = {
+    "patient": [
+        Embedding(
+            AppointmentIndex, ("patient",), documents_of_patient(AppointmentModel)
+        ),
+        Embedding(
+            PrescriptionIndex, ("patient",), documents_of_patient(PrescriptionModel)
+        ),
+        Embedding(BookingIndex, in_bookings(["patient"]), bookings_of_patient),
+    ],
+    "staff": [
+        Embedding(BookingIndex, ("invitation.staff",), bookings_inviting_staff),
+    ],
+    "user": [
+        Embedding(AppointmentIndex, USER_PATHS, appointments_showing_user),
+        Embedding(PrescriptionIndex, USER_PATHS, prescriptions_showing_user),
+        Embedding(
+            BookingIndex,
+            ("booked_by",) + in_bookings(USER_PATHS),
+            bookings_showing_user,
+        ),
+    ],
+}
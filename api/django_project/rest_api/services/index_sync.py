@@ -0,0 +1,102 @@
+import time
+from typing import Callable, Iterable
+
+from injector import Inject
+from opentelemetry import metrics, trace
+from pydantic import BaseModel
+from redis import Redis
+
+from django_project import settings
+from rest_api.services.elastic import ElasticSearchService
+
+meter = metrics.get_meter(__name__)
+coalesced_writes_counter = meter.create_counter(
+    "index_sync.coalesced_writes",
+    description="Document writes folded into an earlier pending sync",
+)
+synced_documents_counter = meter.create_counter(
+    "index_sync.synced_documents",
+    description="Documents pushed to Elasticsearch by the sync scheduler",
+)
+
+
+class IndexSyncScheduler:
+    """
+    Debounced Elasticsearch sync. Writes record an index_sync outbox row, and
+    delivering it marks (index, id) as dirty instead of re-indexing straight
+    away. A periodic flush hydrates every document
+    that has been quiet for INDEX_SYNC_DEBOUNCE_SECONDS (or pending for longer
+    than INDEX_SYNC_MAX_DELAY_SECONDS) and pushes them in one bulk request.
+    """
+
+    def __init__(self, redis: Inject[Redis]):
+        self.redis = redis
+
+    @staticmethod
+    def keys(index_name: str) -> tuple[str, str, str]:
+        prefix = f"index_sync_{index_name}"
+        return f"{prefix}_last", f"{prefix}_first", f"{prefix}_marks"
+
+    def mark_dirty(self, service: ElasticSearchService, id: int) -> None:
+        self.mark_dirty_many(service, [id])
+
+    def mark_dirty_many(
+        self, service: ElasticSearchService, ids: Iterable[int]
+    ) -> None:
+        ids = list(ids)
+        if not ids:
+            return
+        last_key, first_key, marks_key = self.keys(service.es_index_name)
+        now = time.time()
+        with self.redis.pipeline() as pipe:
+            pipe.zadd(last_key, {id: now for id in ids})
+            pipe.zadd(first_key, {id: now for id in ids}, nx=True)
+            for id in ids:
+                pipe.hincrby(marks_key, id, 1)
+            pipe.execute()
+
+    def take_due(self, index_name: str) -> list[int]:
+        last_key, first_key, marks_key = self.keys(index_name)
+        now = time.time()
+        with self.redis.pipeline() as pipe:
+            pipe.zrangebyscore(
+                last_key, "-inf", now - settings.INDEX_SYNC_DEBOUNCE_SECONDS
+            )
+            pipe.zrangebyscore(
+                first_key, "-inf", now - settings.INDEX_SYNC_MAX_DELAY_SECONDS
+            )
+            quiet, overdue = pipe.execute()
+        ids = sorted({int(x) for x in quiet + overdue})
+        if not ids:
+            return []
+
+        with self.redis.pipeline() as pipe:
+            pipe.zrem(last_key, *ids)
+            pipe.zrem(first_key, *ids)
+            pipe.hmget(marks_key, ids)
+            pipe.hdel(marks_key, *ids)
+            _, _, marks, _ = pipe.execute()
+
+        coalesced = sum(int(x or 1) for x in marks) - len(ids)
+        attributes = {"index": index_name}
+        coalesced_writes_counter.add(coalesced, attributes)
+        synced_documents_counter.add(len(ids), attributes)
+        span = trace.get_current_span()
+        span.set_attribute(f"index_sync.{index_name}.coalesced_writes", coalesced)
+        span.set_attribute(f"index_sync.{index_name}.synced_documents", len(ids))
+        return ids
+
+    def flush(
+        self,
+        service: ElasticSearchService,
+        loader: Callable[[list[int]], Iterable[BaseModel]],
+    ) -> int:
+        """Hydrate the due documents once and index them in a single bulk request"""
+        ids = self.take_due(service.es_index_name)
+        if not ids:
+            return 0
+        try:
+            return service.bulk_index_docs(list(loader(ids)))
+        except Exception:
+            self.mark_dirty_many(service, ids)
+            raise
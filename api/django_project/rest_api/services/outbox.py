@@ -0,0 +1,120 @@
+import logging
+
+from django.db import transaction
+from django.db.backends.base.base import BaseDatabaseWrapper
+from pydantic import BaseModel
+
+from rest_api.models.outbox import OutboxModel
+from rest_api.services.elastic import ElasticSearchService
+from rest_api.services.websocket import WebsocketEventTypes
+
+logger = logging.getLogger(__name__)
+
+
+def drain_after_commit(connection: BaseDatabaseWrapper, token: object) -> None:
+    from rest_api.tasks.outbox import drain_outbox
+
+    # Every callback of one commit shares a token, the first to run takes it
+    if connection.outbox_drain_token is not token:
+        return
+    connection.outbox_drain_token = None
+    drain_outbox.delay()
+
+
+def deliver_after_commit(ids: list[int]) -> None:
+    from rest_api.tasks.outbox import deliver_outbox_rows
+
+    # The write has committed, so nothing may reach the caller from here.
+    # Whatever is left undelivered is picked up by drain_outbox
+    try:
+        deliver_outbox_rows.delay(ids)
+    except Exception:
+        logger.exception("Failed to enqueue outbox rows %s after commit", ids)
+
+
+class Outbox:
+    """
+    Side effects of a write (index syncs, websocket messages and emails)
+    recorded as rows in the write's own transaction. They are never sent for
+    a transaction that rolled back, and aren't lost if the process dies right
+    after the commit. The drain_outbox task delivers them in batches once the
+    transaction commits.
+
+    Index rows only carry the document id, the document is read when the row
+    is delivered, so delivering a row twice or late is harmless.
+    """
+
+    def index(self, service: ElasticSearchService, *ids: int) -> None:
+        rows = OutboxModel.objects.bulk_create(
+            [
+                OutboxModel(
+                    kind=OutboxModel.Kind.INDEX,
+                    target=service.es_index_name,
+                    payload={"id": id},
+                )
+                for id in ids
+            ]
+        )
+        self.schedule_drain()
+        if service.read_your_writes:
+            # Booking search and appointment name search read from the index,
+            # and a patient or staff member who has just written expects to
+            # find the result there. These rows get a task of their own
+            # instead of waiting for a drain that may be busy with a backlog
+            row_ids = [row.id for row in rows]
+            transaction.on_commit(lambda: deliver_after_commit(row_ids))
+
+    def sync(self, service: ElasticSearchService, *ids: int) -> None:
+        """Like index, but the documents are handed to the IndexSyncScheduler,
+        so a burst of writes to one document is indexed once"""
+        OutboxModel.objects.bulk_create(
+            [
+                OutboxModel(
+                    kind=OutboxModel.Kind.INDEX_SYNC,
+                    target=service.es_index_name,
+                    payload={"id": id},
+                )
+                for id in ids
+            ]
+        )
+        self.schedule_drain()
+
+    def send_message(
+        self, practice_id: int, type_event: WebsocketEventTypes, message: BaseModel
+    ) -> None:
+        OutboxModel.objects.create(
+            kind=OutboxModel.Kind.WEBSOCKET,
+            target=str(practice_id),
+            payload={"type": type_event.value, "message": message.json()},
+        )
+        self.schedule_drain()
+
+    def send_email(
+        self, to_emails: list[str], subject: str, text: str, ics: str | None = None
+    ) -> None:
+        OutboxModel.objects.create(
+            kind=OutboxModel.Kind.EMAIL,
+            payload={
+                "to_emails": to_emails,
+                "subject": subject,
+                "text": text,
+                "ics": ics,
+            },
+        )
+        self.schedule_drain()
+
+    @staticmethod
+    def schedule_drain() -> None:
+        """Enqueue one drain per transaction, however many rows it writes.
+
+        Each write registers its own callback, since rolling back a savepoint
+        drops the callbacks registered in it. They share a token kept on the
+        connection, so only the first one to run after the commit enqueues.
+        A token left behind by a rolled back transaction is simply reused by
+        the next one
+        """
+        connection = transaction.get_connection()
+        if getattr(connection, "outbox_drain_token", None) is None:
+            connection.outbox_drain_token = object()
+        token = connection.outbox_drain_token
+        transaction.on_commit(lambda: drain_after_commit(connection, token))
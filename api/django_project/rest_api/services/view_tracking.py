@@ -0,0 +1,112 @@
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Callable
+
+from injector import Inject
+from redis import Redis
+
+from django_project import settings
+
+logger = logging.getLogger(__name__)
+
+# (object_id, viewed_by_id, viewed_at)
+View = tuple[int, int, datetime]
+
+
+class ViewTracker:
+    """
+    Write-behind buffer for detail page views. The first view of an object by
+    a viewer claims a key that expires after VIEW_TRACKING_WINDOW_SECONDS, and
+    only that view is appended to a Redis list, so repeated views within a
+    window collapse into a single entry whatever the flush interval. The list
+    is drained in chunks by a Celery task.
+    """
+
+    def __init__(self, redis: Inject[Redis]):
+        self.redis = redis
+
+    @staticmethod
+    def buffer_key(kind: str) -> str:
+        return f"viewed_logs_buffer_{kind}"
+
+    @staticmethod
+    def processing_key(kind: str) -> str:
+        return f"viewed_logs_processing_{kind}"
+
+    @staticmethod
+    def failures_key(kind: str) -> str:
+        return f"viewed_logs_failures_{kind}"
+
+    @staticmethod
+    def dead_letter_key(kind: str) -> str:
+        return f"viewed_logs_dead_letter_{kind}"
+
+    @staticmethod
+    def seen_key(kind: str, object_id: int, viewed_by_id: int) -> str:
+        return f"viewed_logs_seen_{kind}_{object_id}_{viewed_by_id}"
+
+    def record(self, kind: str, object_id: int, viewed_by_id: int) -> None:
+        first_view = self.redis.set(
+            self.seen_key(kind, object_id, viewed_by_id),
+            1,
+            nx=True,
+            ex=settings.VIEW_TRACKING_WINDOW_SECONDS,
+        )
+        if first_view:
+            self.redis.rpush(
+                self.buffer_key(kind), f"{object_id}:{viewed_by_id}:{time.time()}"
+            )
+
+    def flush(self, kind: str, write: Callable[[list[View]], int]) -> int:
+        """Hand every buffered view to write, VIEW_TRACKING_FLUSH_BATCH_SIZE
+        at a time as (object_id, viewed_by_id, viewed_at), and return the
+        total write reports.
+
+        The views are moved to a processing key and a chunk is only trimmed
+        off it once write returns, so a failed flush leaves it for the next
+        one. A chunk that has failed VIEW_TRACKING_MAX_ATTEMPTS times in a
+        row is moved to a dead letter key instead, so it can't hold up the
+        views behind it
+        """
+        processing = self.processing_key(kind)
+        # Only this task drains, so the buffer can't vanish before the rename
+        if not self.redis.exists(processing) and self.redis.exists(
+            self.buffer_key(kind)
+        ):
+            self.redis.rename(self.buffer_key(kind), processing)
+
+        written = 0
+        while True:
+            entries = self.redis.lrange(
+                processing, 0, settings.VIEW_TRACKING_FLUSH_BATCH_SIZE - 1
+            )
+            if not entries:
+                return written
+            try:
+                written += write([self.parse(entry) for entry in entries])
+            except Exception:
+                failures = self.redis.incr(self.failures_key(kind))
+                if failures < settings.VIEW_TRACKING_MAX_ATTEMPTS:
+                    raise
+                logger.exception(
+                    "Moved %d %s views to %s after %d failed flushes",
+                    len(entries),
+                    kind,
+                    self.dead_letter_key(kind),
+                    failures,
+                )
+                self.redis.rpush(self.dead_letter_key(kind), *entries)
+            with self.redis.pipeline() as pipe:
+                pipe.ltrim(processing, len(entries), -1)
+                pipe.delete(self.failures_key(kind))
+                pipe.execute()
+
+    @staticmethod
+    def parse(entry: bytes) -> View:
+        object_id, viewed_by_id, viewed_at = entry.decode().split(":")
+        return (
+            int(object_id),
+            int(viewed_by_id),
+            datetime.fromtimestamp(float(viewed_at), timezone.utc),
+        )
@@ -25,3 +25,11 @@ class WebsocketService:
                 "message": message.json(),
             },
         )
+
+    def send_batch(self, practice_id: int, events: list[dict]) -> None:
+        """Publish several events to a practice in one message. Each event
+        is a dict with the "type" and "message" send_message would use"""
+        async_to_sync(self.channel_layer.group_send)(
+            "practice_" + str(practice_id),
+            {"type": "batch", "events": events},
+        )
@@ -0,0 +1,215 @@
+"""
+Dependency graph from models to the cached aggregates built from them.
+
+Each Dependency says "a write to this model changes these ids of that
+aggregate". post_save/post_delete of every model in the graph resolves the
+affected ids once the transaction commits and hands them to the aggregate's
+handler: cached practices, staff, patients and users are dropped from the
+schema cache (and optionally recomputed in the background). Their copies in
+appointment, prescription and booking documents are updated by the
+repositories through rest_api.events.propagation.
+
+Queryset update() and bulk_create() don't send signals, so repositories that
+write that way keep evicting explicitly.
+
+Deleting a row behind a search index, directly or through a cascade, also logs
+a tombstone in the deleting transaction for the delta reindex to pick up.
+Saving a user's indexed fields bumps its UserStampModel in the same
+transaction, auth.User having no timestamp of its own.
+"""
+from copy import copy
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+from django.contrib.auth.models import User
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from django_project import settings
+from rest_api.models.appointment import AppointmentModel, AvailableAppointmentModel
+from rest_api.models.booking import BookingModel
+from rest_api.models.feature_flags import PracticeFeatureFlagModel
+from rest_api.models.index_tombstone import IndexTombstoneModel
+from rest_api.models.patient import (
+    PatientDocumentModel,
+    PatientModel,
+    PatientVerificationModel,
+)
+from rest_api.models.patient_practice import PatientPracticeModel
+from rest_api.models.practice import PracticeModel
+from rest_api.models.practice_items import (
+    ContactOptionModel,
+    NoticeModel,
+    OpeningHourModel,
+    OpeningTimeExceptionModel,
+    PracticeOrgLinkModel,
+    TeamMemberModel,
+)
+from rest_api.models.prescription import PrescriptionModel
+from rest_api.models.staff import StaffModel
+from rest_api.models.user_stamp import UserStampModel
+from rest_api.services.elastic_indexes.elastic_indexes import (
+    APPOINTMENT_INDEX_NAME,
+    AVAILABILITY_INDEX_NAME,
+    BOOKING_INDEX_NAME,
+    PATIENT_INDEX_NAME,
+    PRACTICE_INDEX_NAME,
+    PRESCRIPTION_INDEX_NAME,
+    STAFF_INDEX_NAME,
+    USER_INDEX_NAME,
+)
+from rest_api.tasks.cache import warm_schema_cache
+from rest_api.utils.schema_cache import schema_caches
+
+Resolver = Callable[[models.Model], Iterable[int | None]]
+
+# Fields of auth.User that end up in a cached aggregate. Saves that only touch
+# other fields (e.g. last_login) don't invalidate anything
+USER_FIELDS = frozenset({"first_name", "last_name", "email"})
+
+
+@dataclass(frozen=True)
+class Dependency:
+    model: type[models.Model]
+    aggregate: str
+    resolve: Resolver
+    fields: frozenset[str] | None = None
+
+    def affected_by(self, update_fields: Iterable[str] | None) -> bool:
+        return (
+            update_fields is None
+            or self.fields is None
+            or bool(self.fields & set(update_fields))
+        )
+
+
+def own_id(instance: models.Model) -> list[int]:
+    return [instance.pk]
+
+
+def practice_id(instance: models.Model) -> list[int]:
+    return [instance.practice_id]
+
+
+def patient_id(instance: models.Model) -> list[int]:
+    return [instance.patient_id]
+
+
+def staff_of_user(user: User) -> Iterable[int]:
+    return StaffModel.objects.filter(user_id=user.id).values_list("id", flat=True)
+
+
+def patient_of_user(user: User) -> Iterable[int]:
+    return PatientModel.objects.filter(user_id=user.id).values_list("id", flat=True)
+
+
+def patient_of_verification(verification: PatientVerificationModel) -> Iterable[int]:
+    return PatientDocumentModel.objects.filter(
+        id=verification.patient_document_id
+    ).values_list("patient_id", flat=True)
+
+
+CACHE_DEPENDENCIES: list[Dependency] = [
+    Dependency(PracticeModel, "practice", own_id),
+    Dependency(OpeningHourModel, "practice", practice_id),
+    Dependency(OpeningTimeExceptionModel, "practice", practice_id),
+    Dependency(ContactOptionModel, "practice", practice_id),
+    Dependency(NoticeModel, "practice", practice_id),
+    Dependency(TeamMemberModel, "practice", practice_id),
+    Dependency(PracticeFeatureFlagModel, "practice", practice_id),
+    Dependency(PracticeOrgLinkModel, "practice", practice_id),
+    Dependency(StaffModel, "staff", own_id),
+    Dependency(PatientModel, "patient", own_id),
+    Dependency(PatientDocumentModel, "patient", patient_id),
+    Dependency(PatientVerificationModel, "patient", patient_of_verification),
+    Dependency(PatientPracticeModel, "patient", patient_id),
+    Dependency(User, "user", own_id, USER_FIELDS),
+    Dependency(User, "staff", staff_of_user, USER_FIELDS),
+    Dependency(User, "patient", patient_of_user, USER_FIELDS),
+]
+
+
+def invalidate_schema_cache(name: str) -> Callable[[set[int]], None]:
+    def handler(ids: set[int]) -> None:
+        schema_caches[name].delete(*ids)
+        if settings.CACHE_DEPENDENCY_RECOMPUTE:
+            warm_schema_cache.delay(name, sorted(ids))
+
+    return handler
+
+
+AGGREGATE_HANDLERS: dict[str, Callable[[set[int]], None]] = {
+    "practice": invalidate_schema_cache("practice"),
+    "staff": invalidate_schema_cache("staff"),
+    "patient": invalidate_schema_cache("patient"),
+    "user": invalidate_schema_cache("user"),
+}
+
+
+def propagate(dependencies: list[Dependency], instance: models.Model) -> None:
+    affected: dict[str, set[int]] = {}
+    for dependency in dependencies:
+        ids = {id for id in dependency.resolve(instance) if id is not None}
+        if ids:
+            affected.setdefault(dependency.aggregate, set()).update(ids)
+    for aggregate, ids in affected.items():
+        AGGREGATE_HANDLERS[aggregate](ids)
+
+
+def on_model_write(sender, instance, update_fields=None, **kwargs) -> None:
+    dependencies = [
+        dependency
+        for dependency in CACHE_DEPENDENCIES
+        if dependency.model is sender and dependency.affected_by(update_fields)
+    ]
+    if dependencies:
+        # Deleting resets the primary key once all signals have been sent
+        snapshot = copy(instance)
+        transaction.on_commit(lambda: propagate(dependencies, snapshot))
+
+
+def connect_cache_dependencies() -> None:
+    for model in {dependency.model for dependency in CACHE_DEPENDENCIES}:
+        post_save.connect(
+            on_model_write, sender=model, dispatch_uid="cache_dependencies"
+        )
+        post_delete.connect(
+            on_model_write, sender=model, dispatch_uid="cache_dependencies"
+        )
+
+
+TOMBSTONE_INDEXES: dict[type[models.Model], str] = {
+    PracticeModel: PRACTICE_INDEX_NAME,
+    AppointmentModel: APPOINTMENT_INDEX_NAME,
+    PatientModel: PATIENT_INDEX_NAME,
+    PrescriptionModel: PRESCRIPTION_INDEX_NAME,
+    AvailableAppointmentModel: AVAILABILITY_INDEX_NAME,
+    BookingModel: BOOKING_INDEX_NAME,
+    StaffModel: STAFF_INDEX_NAME,
+    User: USER_INDEX_NAME,
+}
+
+
+def record_tombstone(sender, instance, **kwargs) -> None:
+    IndexTombstoneModel.objects.create(
+        index_name=TOMBSTONE_INDEXES[sender], document_id=instance.pk
+    )
+
+
+def connect_index_tombstones() -> None:
+    for model in TOMBSTONE_INDEXES:
+        post_delete.connect(
+            record_tombstone, sender=model, dispatch_uid="index_tombstones"
+        )
+
+
+def stamp_user(sender, instance, update_fields=None, **kwargs) -> None:
+    if update_fields is None or USER_FIELDS & set(update_fields):
+        UserStampModel.objects.update_or_create(
+            user_id=instance.pk, defaults={"updated_at": timezone.now()}
+        )
+
+
+def connect_user_stamps() -> None:
+    post_save.connect(stamp_user, sender=User, dispatch_uid="user_stamps")
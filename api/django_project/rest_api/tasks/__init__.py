@@ -1,4 +1,7 @@
+from .cache import warm_identity_cache, warm_schema_cache  # noqa: F401
 from .elastic import (  # noqa: F401
+    delta_reindex,
+    flush_index_sync,
     full_es_reset,
     recreate_all_indices,
     recreate_appointment_index,
@@ -7,4 +10,6 @@ from .elastic import (  # noqa: F401
     recreate_prescription_index,
     task_fail_always_test,
 )
+from .outbox import deliver_outbox_rows, drain_outbox  # noqa: F401
 from .seed import seed_data_task  # noqa: F401
+from .view_tracking import flush_viewed_logs  # noqa: F401
@@ -0,0 +1,28 @@
+from celery import shared_task
+from celery_singleton import Singleton
+
+from rest_api.factory.repo import GpBaseInjector
+from rest_api.repositories.patient import PatientRepo
+from rest_api.repositories.practice import PracticeRepo
+from rest_api.repositories.staff import StaffRepo
+from rest_api.repositories.user import UserRepo
+from rest_api.repositories.utils import warm_practice_identities
+
+CACHED_REPOS = {
+    "practice": PracticeRepo,
+    "staff": StaffRepo,
+    "patient": PatientRepo,
+    "user": UserRepo,
+}
+
+
+@shared_task
+def warm_schema_cache(name: str, ids: list[int]):
+    GpBaseInjector.get(CACHED_REPOS[name]).get_many(ids)
+
+
+@shared_task(base=Singleton)
+def warm_identity_cache():
+    """Fill Redis with every slug and org id mapping. Started by each worker
+    that boots, Singleton runs one scan however many boot together"""
+    return warm_practice_identities()
@@ -1,50 +1,134 @@
-from celery import group, shared_task
+import logging
+import uuid
+from datetime import datetime
+
+from celery import chain, chord, group, shared_task
 from celery_singleton import Singleton
+from django.utils import timezone
 from elasticsearch import Elasticsearch
 
+from django_project import settings
 from rest_api.factory.repo import GpBaseInjector
 from rest_api.repositories.appointment import AppointmentRepo
 from rest_api.repositories.availability import AvailabilityRepo
 from rest_api.repositories.booking import BookingRepo
+from rest_api.repositories.common import CommonModelRepo
 from rest_api.repositories.patient import PatientRepo
 from rest_api.repositories.practice import PracticeRepo
 from rest_api.repositories.prescription import PrescriptionRepo
+from rest_api.repositories.staff import StaffRepo
+from rest_api.repositories.user import UserRepo
+from rest_api.services.delta_reindex import DeltaReindexer
+from rest_api.services.index_sync import IndexSyncScheduler
+from rest_api.utils.elastic_migration import chunk_id_ranges, split_lanes
+
+logger = logging.getLogger(__name__)
+
+REINDEX_REPOS: dict[str, type[CommonModelRepo]] = {
+    "practice": PracticeRepo,
+    "appointment": AppointmentRepo,
+    "patient": PatientRepo,
+    "prescription": PrescriptionRepo,
+    "availability": AvailabilityRepo,
+    "booking": BookingRepo,
+    "staff": StaffRepo,
+    "user": UserRepo,
+}
+
+
+def start_parallel_reindex(name: str) -> None:
+    """
+    Rebuild an index across workers: take the migration lock, split the
+    table into id ranges, index them in ELASTIC_REINDEX_CONCURRENCY chains
+    of chunk tasks, and swap the aliases and release the lock in the chord
+    callback (or roll back if any chunk fails). Every chunk resets the lock's
+    TTL, so it's held however long the whole rebuild takes.
+    """
+    repo = GpBaseInjector.get(REINDEX_REPOS[name])
+    token = str(uuid.uuid4())
+    repo.es_instance.begin_migration(token)
+    try:
+        ranges = chunk_id_ranges(
+            repo.reindex_queryset(), settings.ELASTIC_REINDEX_CHUNK_SIZE
+        )
+        lanes = [
+            chain(
+                reindex_chunk.si(0, name, token, *lane[0]),
+                *[reindex_chunk.s(name, token, *bounds) for bounds in lane[1:]],
+            )
+            for lane in split_lanes(ranges, settings.ELASTIC_REINDEX_CONCURRENCY)
+        ]
+        if not lanes:
+            repo.es_instance.end_migration(token)
+            return
+        chord(lanes)(
+            finish_reindex.s(name, token).on_error(abort_reindex.si(name, token))
+        )
+    except Exception:
+        repo.es_instance.handle_migration_exception(token)
+        raise
+
+
+@shared_task(acks_late=True, autoretry_for=(Exception,), max_retries=3)
+def reindex_chunk(
+    indexed: int, name: str, token: str, first_id: int, last_id: int
+) -> int:
+    repo = GpBaseInjector.get(REINDEX_REPOS[name])
+    repo.es_instance.extend_lock(token)
+    return indexed + repo.reindex_range(first_id, last_id)
+
+
+@shared_task
+def finish_reindex(indexed: list[int], name: str, token: str) -> int:
+    GpBaseInjector.get(REINDEX_REPOS[name]).es_instance.end_migration(token)
+    return sum(indexed)
+
+
+@shared_task
+def abort_reindex(name: str, token: str):
+    GpBaseInjector.get(REINDEX_REPOS[name]).es_instance.handle_migration_exception(
+        token
+    )
 
 
 @shared_task(base=Singleton)
 def recreate_practice_index():
-    repo = GpBaseInjector.get(PracticeRepo)
-    repo.recreate_index()
+    start_parallel_reindex("practice")
 
 
 @shared_task(base=Singleton)
 def recreate_appointment_index():
-    repo = GpBaseInjector.get(AppointmentRepo)
-    repo.recreate_index()
+    start_parallel_reindex("appointment")
 
 
 @shared_task(base=Singleton)
 def recreate_patient_index():
-    repo = GpBaseInjector.get(PatientRepo)
-    repo.recreate_index()
+    start_parallel_reindex("patient")
 
 
 @shared_task(base=Singleton)
 def recreate_prescription_index():
-    repo = GpBaseInjector.get(PrescriptionRepo)
-    repo.recreate_index()
+    start_parallel_reindex("prescription")
 
 
 @shared_task(base=Singleton)
 def recreate_availability_index():
-    repo = GpBaseInjector.get(AvailabilityRepo)
-    repo.recreate_index()
+    start_parallel_reindex("availability")
 
 
 @shared_task(base=Singleton)
 def recreate_booking_index():
-    repo = GpBaseInjector.get(BookingRepo)
-    repo.recreate_index()
+    start_parallel_reindex("booking")
+
+
+@shared_task(base=Singleton)
+def recreate_staff_index():
+    start_parallel_reindex("staff")
+
+
+@shared_task(base=Singleton)
+def recreate_user_index():
+    start_parallel_reindex("user")
 
 
 @shared_task(base=Singleton)
@@ -55,6 +139,8 @@ def recreate_all_indices():
     prescription_sig = recreate_prescription_index.s()
     availability_sig = recreate_availability_index.s()
     booking_sig = recreate_booking_index.s()
+    staff_sig = recreate_staff_index.s()
+    user_sig = recreate_user_index.s()
     group(
         [
             practice_sig,
@@ -63,10 +149,47 @@ def recreate_all_indices():
             prescription_sig,
             availability_sig,
             booking_sig,
+            staff_sig,
+            user_sig,
         ]
     ).apply_async()
 
 
+@shared_task(base=Singleton)
+def flush_index_sync():
+    index_sync = GpBaseInjector.get(IndexSyncScheduler)
+    for repo in [
+        GpBaseInjector.get(AppointmentRepo),
+        GpBaseInjector.get(PrescriptionRepo),
+    ]:
+        index_sync.flush(repo.elastic_service, repo.load_documents)
+
+
+@shared_task(base=Singleton)
+def delta_reindex(since: str | None = None) -> dict[str, tuple[int, int]]:
+    """Upsert the documents written since each index's watermark and remove
+    the deleted ones. Pass an ISO timestamp to replay everything written since
+    then, e.g. to repair the indexes after an Elasticsearch outage"""
+    reindexer = GpBaseInjector.get(DeltaReindexer)
+    start = datetime.fromisoformat(since) if since else None
+    if start is not None and timezone.is_naive(start):
+        start = timezone.make_aware(start)
+
+    synced: dict[str, tuple[int, int]] = {}
+    failed: list[str] = []
+    for name, repo_class in REINDEX_REPOS.items():
+        try:
+            synced[name] = reindexer.sync(GpBaseInjector.get(repo_class), start)
+        except Exception:
+            # Its watermark stays put, the next run picks the changes up again
+            logger.exception("Delta reindex of %s failed", name)
+            failed.append(name)
+    reindexer.prune_tombstones()
+    if failed:
+        raise Exception(f"Delta reindex failed for {', '.join(failed)}")
+    return synced
+
+
 @shared_task(base=Singleton)
 def full_es_reset():
     es = GpBaseInjector.get(Elasticsearch)
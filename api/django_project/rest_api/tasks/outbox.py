@@ -0,0 +1,168 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from celery import shared_task
+from celery_singleton import Singleton
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from opentelemetry import metrics
+
+from django_project import settings
+from rest_api.factory.repo import GpBaseInjector
+from rest_api.models.outbox import OutboxModel
+from rest_api.repositories.common import CommonModelRepo
+from rest_api.services.index_sync import IndexSyncScheduler
+from rest_api.services.notification import NotificationService
+from rest_api.services.websocket import WebsocketService
+from rest_api.tasks.elastic import REINDEX_REPOS
+
+meter = metrics.get_meter(__name__)
+delivered_counter = meter.create_counter(
+    "outbox.delivered",
+    description="Outbox rows delivered",
+)
+failed_counter = meter.create_counter(
+    "outbox.failed",
+    description="Outbox rows that failed and were put back for a retry",
+)
+
+
+def index_repos() -> dict[str, CommonModelRepo]:
+    repos = [GpBaseInjector.get(repo) for repo in REINDEX_REPOS.values()]
+    return {repo.es_instance.es_index_name: repo for repo in repos}
+
+
+def deliver_index(index_name: str, rows: list[OutboxModel]) -> None:
+    """Index the current state of every document in one bulk request, and
+    remove the ones whose rows are gone"""
+    repo = index_repos()[index_name]
+    service = repo.es_instance
+    ids = {row.payload["id"] for row in rows}
+    existing = set(
+        repo.reindex_queryset().filter(id__in=ids).values_list("id", flat=True)
+    )
+    if existing:
+        service.bulk_index_docs(list(repo.load_documents(sorted(existing))))
+    if ids - existing:
+        service.bulk_remove_docs(sorted(ids - existing))
+
+
+def deliver_index_sync(index_name: str, rows: list[OutboxModel]) -> None:
+    service = index_repos()[index_name].es_instance
+    GpBaseInjector.get(IndexSyncScheduler).mark_dirty_many(
+        service, {row.payload["id"] for row in rows}
+    )
+
+
+def deliver_messages(practice_id: str, rows: list[OutboxModel]) -> None:
+    GpBaseInjector.get(WebsocketService).send_batch(
+        int(practice_id), [row.payload for row in rows]
+    )
+
+
+def deliver_email(_: str, rows: list[OutboxModel]) -> None:
+    notification_service = GpBaseInjector.get(NotificationService)
+    for row in rows:
+        # A row is sent at most once, even if it is claimed again because its
+        # lease ran out before it was deleted
+        sent_key = f"outbox_email_sent_{row.id}"
+        if cache.get(sent_key):
+            continue
+        notification_service.send_email(**row.payload)
+        cache.set(sent_key, 1, 60 * 60 * 24)
+
+
+DELIVERIES = {
+    OutboxModel.Kind.INDEX: deliver_index,
+    OutboxModel.Kind.INDEX_SYNC: deliver_index_sync,
+    OutboxModel.Kind.WEBSOCKET: deliver_messages,
+    OutboxModel.Kind.EMAIL: deliver_email,
+}
+
+
+def backoff(attempts: int) -> timedelta:
+    seconds = settings.OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1)
+    return timedelta(seconds=min(seconds, settings.OUTBOX_MAX_BACKOFF_SECONDS))
+
+
+def claim_outbox_rows(ids: list[int] | None = None) -> list[OutboxModel]:
+    now = timezone.now()
+    with transaction.atomic():
+        queryset = OutboxModel.objects.select_for_update(skip_locked=True).filter(
+            available_at__lte=now, attempts__lt=settings.OUTBOX_MAX_ATTEMPTS
+        )
+        if ids is not None:
+            queryset = queryset.filter(id__in=ids)
+        rows = list(queryset.order_by("id")[: settings.OUTBOX_BATCH_SIZE])
+        OutboxModel.objects.filter(id__in=[row.id for row in rows]).update(
+            available_at=now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+        )
+    return rows
+
+
+def process_outbox_batch(ids: list[int] | None = None) -> int:
+    """
+    Deliver up to OUTBOX_BATCH_SIZE due rows, or only the given ones, and
+    return how many were handled.
+
+    Rows are claimed in a short transaction that locks them with SKIP LOCKED,
+    so concurrent drains split the work, and leases them for
+    OUTBOX_LEASE_SECONDS by moving available_at forward. They are delivered
+    with no transaction or row lock held, and deleted or put back in a second
+    short transaction. Rows of a drain that died become due again once the
+    lease runs out.
+
+    Rows are grouped so each index gets one bulk request, each practice one
+    channel layer message, and each email its own call. A group that fails
+    is put back with a backoff without holding up the others.
+    """
+    rows = claim_outbox_rows(ids)
+    if not rows:
+        return 0
+
+    groups: dict[tuple[str, str], list[OutboxModel]] = defaultdict(list)
+    for row in rows:
+        target = str(row.id) if row.kind == OutboxModel.Kind.EMAIL else row.target
+        groups[(row.kind, target)].append(row)
+
+    delivered: list[int] = []
+    failed: list[OutboxModel] = []
+    for (kind, target), group in groups.items():
+        try:
+            DELIVERIES[kind](target, group)
+        except Exception as e:
+            now = timezone.now()
+            for row in group:
+                row.attempts += 1
+                row.available_at = now + backoff(row.attempts)
+                row.last_error = repr(e)
+            failed.extend(group)
+            failed_counter.add(len(group), {"kind": kind})
+        else:
+            delivered.extend(row.id for row in group)
+            delivered_counter.add(len(group), {"kind": kind})
+
+    with transaction.atomic():
+        OutboxModel.objects.filter(id__in=delivered).delete()
+        OutboxModel.objects.bulk_update(
+            failed, ["attempts", "available_at", "last_error"]
+        )
+    return len(rows)
+
+
+@shared_task
+def deliver_outbox_rows(ids: list[int]) -> int:
+    """Deliver these rows straight away, e.g. writes that are read back right
+    after the request. Not a singleton, so it doesn't wait for a drain"""
+    return process_outbox_batch(ids=ids)
+
+
+@shared_task(base=Singleton)
+def drain_outbox() -> int:
+    handled = 0
+    while True:
+        batch = process_outbox_batch()
+        handled += batch
+        if batch < settings.OUTBOX_BATCH_SIZE:
+            return handled
@@ -0,0 +1,12 @@
+from celery import shared_task
+from celery_singleton import Singleton
+
+from rest_api.factory.repo import GpBaseInjector
+from rest_api.repositories.appointment import AppointmentRepo
+from rest_api.repositories.prescription import PrescriptionRepo
+
+
+@shared_task(base=Singleton)
+def flush_viewed_logs():
+    GpBaseInjector.get(AppointmentRepo).flush_viewed_logs()
+    GpBaseInjector.get(PrescriptionRepo).flush_viewed_logs()
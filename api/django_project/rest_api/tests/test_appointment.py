@@ -0,0 +1,255 @@
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from faker import Faker
+from redis import Redis
+
+from django_project import settings
+from rest_api.factory.repo import TestGpBaseInjector
+from rest_api.models.appointment import (
+    AppointmentAssignLogModel,
+    AppointmentCommentModel,
+    AppointmentDocumentModel,
+    AppointmentModel,
+    AppointmentStateLogModel,
+    AppointmentViewedLogModel,
+)
+from rest_api.models.patient import PatientDocumentModel
+from rest_api.repositories.appointment import AppointmentRepo
+from rest_api.repositories.patient import PatientRepo
+from rest_api.repositories.practice import PracticeRepo
+from rest_api.repositories.user import UserRepo
+from rest_api.schemas.appointment import AppointmentSchema, AppointmentSummarySchema
+from rest_api.serializers.appointment import AppointmentSerializer
+from rest_api.services.view_tracking import ViewTracker
+from rest_api.utils.schema_cache import clear_local_caches
+from rest_api.utils.sparse_fields import get_sparse_fieldset
+
+GET_MANY_QUERIES = 10
+
+
+class TestAppointmentRepo(TestCase):
+
+    faker = TestGpBaseInjector.get(Faker)
+    user_repo = TestGpBaseInjector.get(UserRepo)
+    patient_repo = TestGpBaseInjector.get(PatientRepo)
+    practice_repo = TestGpBaseInjector.get(PracticeRepo)
+    appointment_repo = TestGpBaseInjector.get(AppointmentRepo)
+
+    def setUp(self):
+        self.admin = self.user_repo.create(self.faker.get_user())
+        self.practice = self.practice_repo.create(
+            data=self.faker.get_practice(self.admin.id), skip_gmaps=True
+        )
+        self.patients = []
+        for username in ["patient.one", "patient.two"]:
+            user = User.objects.create(username=username)
+            self.patients.append(
+                self.patient_repo.create(
+                    self.faker.get_patient(user.id, self.faker.get_user()),
+                    test_data=True,
+                )
+            )
+
+    def create_appointments(self, count: int) -> list[int]:
+        appointments = AppointmentModel.objects.bulk_create(
+            [
+                AppointmentModel(
+                    **self.faker.get_appointment(
+                        self.patients[i % 2].id, self.practice.id
+                    ).dict(include={"symptoms", "symptom_category", "state"}),
+                    symptoms_duration_seconds=60,
+                    patient_id=self.patients[i % 2].id,
+                    practice_id=self.practice.id,
+                )
+                for i in range(count)
+            ]
+        )
+        documents = PatientDocumentModel.objects.bulk_create(
+            [
+                PatientDocumentModel(patient_id=a.patient_id, s3_url=f"doc/{a.id}")
+                for a in appointments
+            ]
+        )
+        AppointmentDocumentModel.objects.bulk_create(
+            [
+                AppointmentDocumentModel(
+                    appointment=a,
+                    document=d,
+                    patient_id=a.patient_id,
+                    practice_id=a.practice_id,
+                )
+                for a, d in zip(appointments, documents)
+            ]
+        )
+        for model, fields in [
+            (
+                AppointmentStateLogModel,
+                {"to_state": "submitted", "triggered_by_id": self.admin.id},
+            ),
+            (AppointmentCommentModel, {"user_id": self.admin.id, "comment": "hi"}),
+            (AppointmentViewedLogModel, {"viewed_by_id": self.admin.id}),
+            (
+                AppointmentAssignLogModel,
+                {"to_user_id": self.admin.id, "triggered_by_id": self.admin.id},
+            ),
+        ]:
+            model.objects.bulk_create(
+                [model(appointment=a, **fields) for a in appointments]
+            )
+        return [a.id for a in appointments]
+
+    def test_get_many_query_budget(self):
+        for count in [1, 50, 500]:
+            with self.subTest(count=count):
+                ids = self.create_appointments(count)
+                cache.clear()
+                clear_local_caches()
+                with self.assertNumQueries(GET_MANY_QUERIES):
+                    result = self.appointment_repo.get_many(ids)
+                assert [a.id for a in result] == ids
+                assert all(len(a.logs) == 1 for a in result)
+                assert all(a.comments[0].user.id == self.admin.id for a in result)
+                assert all(a.patient.id == a.patient_id for a in result)
+
+    def test_get_matches_get_many(self):
+        ids = self.create_appointments(3)
+        for id, appointment in zip(ids, self.appointment_repo.get_many(ids)):
+            assert self.appointment_repo.get(id) == appointment
+
+        with self.assertRaises(AppointmentModel.DoesNotExist):
+            self.appointment_repo.get(max(ids) + 1)
+
+    def test_get_many_from_index_falls_back_to_db(self):
+        ids = self.create_appointments(3)
+        indexed = self.appointment_repo.get_many(ids[:2])
+        es = self.appointment_repo.elastic_service.es
+        es.mget.return_value = {
+            "docs": [
+                {"_id": str(a.id), "found": True, "_source": a.dict()} for a in indexed
+            ]
+            + [{"_id": str(ids[2]), "found": False}]
+        }
+        try:
+            cache.clear()
+            clear_local_caches()
+            with self.assertNumQueries(GET_MANY_QUERIES):
+                result = self.appointment_repo.get_many_from_index(ids)
+        finally:
+            es.mget.reset_mock(return_value=True)
+        assert [a.id for a in result] == ids
+        assert result[:2] == indexed
+
+    def test_get_many_skips_collections_not_expanded(self):
+        ids = self.create_appointments(5)
+        with self.assertNumQueries(1):
+            result = self.appointment_repo.get_many(ids, expand=set())
+        assert [a.id for a in result] == ids
+        assert all(a.logs is None and a.patient is None for a in result)
+
+        with self.assertNumQueries(3):
+            result = self.appointment_repo.get_many(ids, expand={"comments"})
+        assert all(a.comments[0].user.id == self.admin.id for a in result)
+        assert all(a.viewed_logs is None for a in result)
+
+    def test_views_are_buffered_and_flushed_in_bulk(self):
+        ids = self.create_appointments(2)
+        tracker = ViewTracker(Redis.from_url(settings.CELERY_RESULT_BACKEND))
+        tracker.redis.delete(
+            tracker.buffer_key("appointment"),
+            tracker.processing_key("appointment"),
+            tracker.failures_key("appointment"),
+            tracker.dead_letter_key("appointment"),
+            *[tracker.seen_key("appointment", id, self.admin.id) for id in ids],
+        )
+        repo = TestGpBaseInjector.create_object(
+            AppointmentRepo, additional_kwargs={"view_tracker": tracker}
+        )
+        for id in [ids[0], ids[0], ids[1], ids[0]]:
+            repo.get_with_tracking(id, self.admin.id)
+        viewed_before = timezone.now()
+        assert AppointmentViewedLogModel.objects.count() == 2
+
+        # A failed flush leaves the views for the next one
+        with patch.object(repo.outbox, "index", side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                repo.flush_viewed_logs()
+        assert AppointmentViewedLogModel.objects.count() == 2
+
+        with patch.object(repo.outbox, "index") as index:
+            assert repo.flush_viewed_logs() == 2
+        assert AppointmentViewedLogModel.objects.count() == 4
+        assert sorted(index.call_args.args[1:]) == sorted(ids)
+        flushed = AppointmentViewedLogModel.objects.order_by("-id")[:2]
+        assert all(log.created_at <= viewed_before for log in flushed)
+
+        # Later views in the same window are still collapsed after a flush
+        repo.get_with_tracking(ids[0], self.admin.id)
+        assert repo.flush_viewed_logs() == 0
+
+    @patch.object(settings, "VIEW_TRACKING_FLUSH_BATCH_SIZE", 2)
+    @patch.object(settings, "VIEW_TRACKING_MAX_ATTEMPTS", 2)
+    def test_bad_views_cannot_block_the_buffer(self):
+        ids = self.create_appointments(3)
+        tracker = ViewTracker(Redis.from_url(settings.CELERY_RESULT_BACKEND))
+        kind = "appointment"
+        tracker.redis.delete(
+            tracker.buffer_key(kind),
+            tracker.processing_key(kind),
+            tracker.failures_key(kind),
+            tracker.dead_letter_key(kind),
+            *[tracker.seen_key(kind, id, self.admin.id) for id in ids],
+        )
+        repo = TestGpBaseInjector.create_object(
+            AppointmentRepo, additional_kwargs={"view_tracker": tracker}
+        )
+        # Viewed by a user deleted before the flush
+        tracker.record(kind, ids[0], self.admin.id + 1000)
+        for id in ids:
+            tracker.record(kind, id, self.admin.id)
+        with patch.object(repo.outbox, "index") as index:
+            assert repo.flush_viewed_logs() == 3
+        # One chunk of two views, then one of the remaining two
+        assert index.call_count == 2
+        assert not tracker.redis.exists(tracker.processing_key(kind))
+
+        # A chunk that keeps failing is set aside after the last attempt
+        tracker.redis.delete(*[tracker.seen_key(kind, id, self.admin.id) for id in ids])
+        for id in ids:
+            tracker.record(kind, id, self.admin.id)
+        with patch.object(repo.outbox, "index", side_effect=[ValueError] * 2 + [None]):
+            with self.assertRaises(ValueError):
+                repo.flush_viewed_logs()
+            with self.assertLogs("rest_api.services.view_tracking", "ERROR"):
+                assert repo.flush_viewed_logs() == 1
+        assert tracker.redis.llen(tracker.dead_letter_key(kind)) == 2
+        assert not tracker.redis.exists(tracker.processing_key(kind))
+
+
+class TestSparseFieldset(SimpleTestCase):
+    def test_no_params_returns_full_rows(self):
+        assert get_sparse_fieldset(
+            QueryDict(), AppointmentSchema, AppointmentSummarySchema
+        ) == (None, None)
+
+    def test_fields_and_expand(self):
+        fields, expand = get_sparse_fieldset(
+            QueryDict("expand=logs,patient"),
+            AppointmentSchema,
+            AppointmentSummarySchema,
+        )
+        assert expand == {"logs", "patient"}
+        assert fields == set(AppointmentSummarySchema.__fields__) | expand
+
+        fields, expand = get_sparse_fieldset(
+            QueryDict("fields=id,state,comments"),
+            AppointmentSchema,
+            AppointmentSummarySchema,
+        )
+        assert (fields, expand) == ({"id", "state", "comments"}, {"comments"})
+        serializer = AppointmentSerializer(fields=fields)
+        assert set(serializer.fields) == fields
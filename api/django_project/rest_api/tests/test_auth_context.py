@@ -0,0 +1,193 @@
+from unittest import mock
+
+import jwt
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from faker import Faker
+from rest_framework.test import APIClient
+
+from django_project import auth_utils
+from django_project.jwks import JWKSKeyStore
+from django_project.jwks_testing import LocalJWKSServer
+from rest_api.factory.repo import TestGpBaseInjector
+from rest_api.repositories.appointment import AppointmentRepo
+from rest_api.repositories.patient import PatientRepo
+from rest_api.repositories.practice import PracticeRepo
+from rest_api.repositories.staff import StaffRepo
+from rest_api.repositories.user import UserRepo
+from rest_api.utils.identity_cache import identity_cache
+
+AUDIENCE = "https://api.test/"
+PATIENT_SCOPES = "get:patient get:appointment get:prescription"
+STAFF_SCOPES = "get:staff manage:appointment manage:prescription"
+IDENTITY_LOOKUPS = [
+    'WHERE "rest_api_patientmodel"."user_id" =',
+    'WHERE "rest_api_staffmodel"."user_id" =',
+]
+
+
+class TestAuthContext(TestCase):
+
+    faker = TestGpBaseInjector.get(Faker)
+    user_repo = TestGpBaseInjector.get(UserRepo)
+    patient_repo = TestGpBaseInjector.get(PatientRepo)
+    practice_repo = TestGpBaseInjector.get(PracticeRepo)
+    staff_repo = TestGpBaseInjector.get(StaffRepo)
+    appointment_repo = TestGpBaseInjector.get(AppointmentRepo)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = LocalJWKSServer().start()
+        cls.patcher = mock.patch.multiple(
+            auth_utils,
+            AUTH0_DOMAIN=cls.server.issuer,
+            AUTH0_IDENTIFIER=AUDIENCE,
+            jwks_key_store=JWKSKeyStore(jwks_url=cls.server.jwks_url),
+        )
+        cls.patcher.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.patcher.stop()
+        cls.server.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        identity_cache.clear()
+        admin = self.user_repo.create(self.faker.get_user())
+        self.practice = self.practice_repo.create(
+            data=self.faker.get_practice(admin.id), skip_gmaps=True
+        )
+
+        patient_user = User.objects.create(username="auth0.patient")
+        fake_user = self.faker.get_user()
+        self.patient = self.patient_repo.create(
+            self.faker.get_patient(patient_user.id, fake_user), test_data=True
+        )
+        self.appointment = self.appointment_repo.create(
+            self.faker.get_appointment(self.patient.id, self.practice.id)
+        )
+
+        User.objects.create(username="auth0.staff")
+        self.staff = self.staff_repo.get_by_user_id(user_id=admin.id)
+
+    def client_for(self, sub: str, scopes: str) -> APIClient:
+        token = self.server.mint_token(
+            audience=AUDIENCE, claims={"sub": sub, "scope": scopes}
+        )
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        return client
+
+    def identity_queries(self, client: APIClient, url: str) -> int:
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        assert response.status_code == 200, response.content
+        return len(
+            [
+                q
+                for q in queries.captured_queries
+                if any(lookup in q["sql"] for lookup in IDENTITY_LOOKUPS)
+            ]
+        )
+
+    def assert_single_verification(self, client: APIClient, url: str):
+        with mock.patch.object(
+            auth_utils.jwt, "decode", wraps=jwt.decode
+        ) as decode, mock.patch.object(
+            auth_utils,
+            "resolve_user_identity",
+            wraps=auth_utils.resolve_user_identity,
+        ) as resolve, CaptureQueriesContext(
+            connection
+        ) as queries:
+            response = client.get(url)
+        assert response.status_code == 200, response.content
+        assert decode.call_count == 1
+        assert resolve.call_count == 1
+        for lookup in IDENTITY_LOOKUPS:
+            matching = [q for q in queries.captured_queries if lookup in q["sql"]]
+            assert len(matching) <= 1, (lookup, len(matching))
+
+    def test_patient_endpoints_verify_token_once(self):
+        client = self.client_for("auth0|patient", PATIENT_SCOPES)
+        for url in [
+            "/patient/manage",
+            "/appointments",
+            "/prescriptions",
+            f"/appointment/{self.appointment.id}",
+        ]:
+            with self.subTest(url=url):
+                self.assert_single_verification(client, url)
+
+    def test_staff_endpoints_verify_token_once(self):
+        staff_user = User.objects.get(username="auth0.staff")
+        self.staff_repo.update(
+            id=self.staff.id,
+            data=self.staff.copy(update={"user_id": staff_user.id}),
+        )
+        client = self.client_for("auth0|staff", STAFF_SCOPES)
+        for url in [
+            "/staff/user",
+            f"/practice/{self.practice.id}/appointments/state/{self.appointment.state}",
+            f"/practice/{self.practice.id}/prescriptions/state/submitted",
+        ]:
+            with self.subTest(url=url):
+                self.assert_single_verification(client, url)
+
+    def test_warm_requests_skip_identity_queries(self):
+        client = self.client_for("auth0|patient", PATIENT_SCOPES)
+        assert self.identity_queries(client, "/patient/manage") == 2
+        assert self.identity_queries(client, "/appointments") == 0
+
+        identity_cache.clear()
+        assert self.identity_queries(client, "/appointments") == 0
+
+    def test_staff_update_invalidates_identity(self):
+        staff_user = User.objects.get(username="auth0.staff")
+        claims = {"scope": STAFF_SCOPES, "org_id": None}
+        context = auth_utils.build_auth_context("token", claims, staff_user.id)
+        assert context.staff_id is None
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.staff_repo.update(
+                id=self.staff.id,
+                data=self.staff.copy(update={"user_id": staff_user.id}),
+            )
+        context = auth_utils.build_auth_context("token", claims, staff_user.id)
+        assert context.staff_id == self.staff.id
+
+    def test_grants_loaded_before_an_invalidation_are_not_served(self):
+        key = identity_cache.key("staff", self.staff.user_id)
+
+        def load_before_the_write():
+            # The write commits and invalidates while this read is in flight
+            identity_cache.invalidate(key)
+            return 1
+
+        assert identity_cache.get_many({key: load_before_the_write})[key] == 1
+        assert identity_cache.get_many({key: lambda: self.staff.id})[key] == (
+            self.staff.id
+        )
+        assert identity_cache.get_many({key: lambda: None})[key] == self.staff.id
+        assert identity_cache.local.get(key) is None
+
+    def test_org_practice_grants_are_not_kept_locally(self):
+        org_key = identity_cache.key("practice", "org_1")
+        slug_key = identity_cache.key("practice_slug", "my-practice")
+        identity_cache.get_many({org_key: lambda: 1, slug_key: lambda: 1})
+        assert identity_cache.local.get(org_key) is None
+        assert identity_cache.local.get(slug_key) == 1
+
+    def test_auth_context_is_immutable(self):
+        context = auth_utils.build_auth_context(
+            "token", {"scope": "get:patient", "org_id": None}, None
+        )
+        assert context.scopes == ("get:patient",)
+        with self.assertRaises(TypeError):
+            context.patient_id = 1
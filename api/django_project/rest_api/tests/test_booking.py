@@ -0,0 +1,97 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from faker import Faker
+
+from rest_api.factory.repo import TestGpBaseInjector
+from rest_api.models.appointment import AvailableAppointmentModel
+from rest_api.models.booking import BookingInviteModel, BookingModel
+from rest_api.models.practice_items import TeamMemberModel
+from rest_api.repositories.appointment import AppointmentRepo
+from rest_api.repositories.booking import BookingRepo
+from rest_api.repositories.patient import PatientRepo
+from rest_api.repositories.practice import PracticeRepo
+from rest_api.repositories.staff import StaffRepo
+from rest_api.repositories.user import UserRepo
+from rest_api.utils.schema_cache import clear_local_caches
+
+
+class TestBookingRepo(TestCase):
+
+    faker = TestGpBaseInjector.get(Faker)
+    user_repo = TestGpBaseInjector.get(UserRepo)
+    patient_repo = TestGpBaseInjector.get(PatientRepo)
+    practice_repo = TestGpBaseInjector.get(PracticeRepo)
+    staff_repo = TestGpBaseInjector.get(StaffRepo)
+    appointment_repo = TestGpBaseInjector.get(AppointmentRepo)
+    booking_repo = TestGpBaseInjector.get(BookingRepo)
+
+    def setUp(self):
+        admin = self.user_repo.create(self.faker.get_user())
+        self.practice = self.practice_repo.create(
+            data=self.faker.get_practice(admin.id), skip_gmaps=True
+        )
+        self.staff = self.staff_repo.get_by_user_id(user_id=admin.id)
+        user = User.objects.create(username="patient.one")
+        self.patient = self.patient_repo.create(
+            self.faker.get_patient(user.id, self.faker.get_user()), test_data=True
+        )
+        self.team_member = TeamMemberModel.objects.create(
+            staff_id=self.staff.id,
+            practice_id=self.practice.id,
+            first_name="Ada",
+            last_name="Lovelace",
+            job_title="GP",
+        )
+
+    def create_bookings(self, count: int) -> list[int]:
+        ids = []
+        for i in range(count):
+            appointment = self.appointment_repo.create(
+                self.faker.get_appointment(self.patient.id, self.practice.id)
+            )
+            BookingInviteModel.objects.create(
+                appointment_id=appointment.id,
+                staff_id=self.staff.id,
+                practice_id=self.practice.id,
+            )
+            start_time = timezone.now() + timedelta(hours=i)
+            availability = AvailableAppointmentModel.objects.create(
+                team_member=self.team_member,
+                staff_id=self.staff.id,
+                practice_id=self.practice.id,
+                start_time=start_time,
+                end_time=start_time + timedelta(minutes=15),
+            )
+            booking = BookingModel.objects.create(
+                appointment_id=appointment.id,
+                available_appointment=availability,
+                booked_by_id=self.patient.user_id,
+            )
+            ids.append(booking.id)
+        return ids
+
+    def test_get_many_query_count_is_independent_of_batch_size(self):
+        counts = []
+        for count in [1, 20]:
+            ids = self.create_bookings(count)
+            # Writes no longer warm the cache, so measure both batches cold
+            cache.clear()
+            clear_local_caches()
+            with CaptureQueriesContext(connection) as queries:
+                result = self.booking_repo.get_many(ids)
+            counts.append(len(queries.captured_queries))
+            assert [b.id for b in result] == ids
+            assert all(b.invitation.appointment == b.appointment for b in result)
+            assert all(b.invitation.staff.id == self.staff.id for b in result)
+        assert counts[0] == counts[1]
+
+    def test_get_matches_get_many(self):
+        ids = self.create_bookings(2)
+        for id, booking in zip(ids, self.booking_repo.get_many(ids)):
+            assert self.booking_repo.get(id) == booking
@@ -0,0 +1,89 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import TestCase
+from faker import Faker
+
+from rest_api.factory.repo import TestGpBaseInjector
+from rest_api.models.practice_items import TeamMemberModel
+from rest_api.repositories.patient import PatientRepo
+from rest_api.repositories.practice import PracticeRepo
+from rest_api.repositories.staff import StaffRepo
+from rest_api.repositories.user import UserRepo
+from rest_api.signals import AGGREGATE_HANDLERS, CACHE_DEPENDENCIES
+from rest_api.utils.schema_cache import clear_local_caches
+
+
+class TestCacheDependencies(TestCase):
+
+    faker = TestGpBaseInjector.get(Faker)
+    user_repo = TestGpBaseInjector.get(UserRepo)
+    practice_repo = TestGpBaseInjector.get(PracticeRepo)
+    staff_repo = TestGpBaseInjector.get(StaffRepo)
+    patient_repo = TestGpBaseInjector.get(PatientRepo)
+
+    def setUp(self):
+        admin = self.user_repo.create(self.faker.get_user())
+        self.practice = self.practice_repo.create(
+            data=self.faker.get_practice(admin.id), skip_gmaps=True
+        )
+        self.staff = self.staff_repo.get_by_user_id(user_id=admin.id)
+        user = User.objects.create(username="patient.one")
+        self.patient = self.patient_repo.create(
+            self.faker.get_patient(user.id, self.faker.get_user()), test_data=True
+        )
+
+    def is_cached(self, repo, id: int) -> bool:
+        clear_local_caches()
+        return repo.cache.get(id, lambda ids: {}) is not None
+
+    def test_child_write_invalidates_cached_practice(self):
+        self.practice_repo.get(self.practice.id)
+        assert self.is_cached(self.practice_repo, self.practice.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TeamMemberModel.objects.create(
+                practice_id=self.practice.id,
+                staff_id=self.staff.id,
+                first_name="Jane",
+                last_name="Doe",
+                job_title="GP",
+            )
+
+        assert not self.is_cached(self.practice_repo, self.practice.id)
+        team = self.practice_repo.get(self.practice.id).team_members
+        assert "Jane" in [member.first_name for member in team]
+
+    def test_user_rename_invalidates_patient(self):
+        self.patient_repo.get(self.patient.id)
+        self.staff_repo.get(self.staff.id)
+
+        user = User.objects.get(id=self.patient.user_id)
+        user.first_name = "Renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+
+        assert not self.is_cached(self.patient_repo, self.patient.id)
+        assert self.is_cached(self.staff_repo, self.staff.id)
+
+    def test_saves_of_unrelated_user_fields_are_ignored(self):
+        user = User.objects.get(id=self.patient.user_id)
+        with self.captureOnCommitCallbacks() as callbacks:
+            user.save(update_fields=["last_login"])
+        assert callbacks == []
+
+    def test_every_dependency_is_handled(self):
+        assert {d.aggregate for d in CACHE_DEPENDENCIES} <= set(AGGREGATE_HANDLERS)
+
+    def test_rolled_back_writes_are_never_cached(self):
+        staff = self.staff_repo.get(self.staff.id)
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                renamed = self.staff_repo.update(
+                    id=staff.id, data=staff.copy(update={"first_name": "Renamed"})
+                )
+                assert renamed.first_name == "Renamed"
+                assert not self.is_cached(self.staff_repo, staff.id)
+                raise ValueError("rolled back")
+
+        assert not self.is_cached(self.staff_repo, staff.id)
+        assert self.staff_repo.get(staff.id).first_name == staff.first_name
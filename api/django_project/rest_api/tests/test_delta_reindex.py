@@ -0,0 +1,78 @@
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+from faker import Faker
+from redis import Redis
+
+from django_project import settings
+from rest_api.factory.repo import TestGpBaseInjector
+from rest_api.models.index_tombstone import IndexTombstoneModel
+from rest_api.models.practice import PracticeModel
+from rest_api.models.practice_items import TeamMemberModel
+from rest_api.repositories.practice import PracticeRepo
+from rest_api.repositories.staff import StaffRepo
+from rest_api.repositories.user import UserRepo
+from rest_api.services.delta_reindex import DeltaReindexer
+from rest_api.services.elastic_indexes.elastic_indexes import PRACTICE_INDEX_NAME
+from rest_api.services.elastic_indexes.practice import PracticeIndex
+from rest_api.tasks.elastic import REINDEX_REPOS
+
+
+class TestDeltaReindex(TestCase):
+
+    faker = TestGpBaseInjector.get(Faker)
+    user_repo = TestGpBaseInjector.get(UserRepo)
+    practice_repo = TestGpBaseInjector.get(PracticeRepo)
+    staff_repo = TestGpBaseInjector.get(StaffRepo)
+
+    def setUp(self):
+        self.reindexer = DeltaReindexer(Redis.from_url(settings.CELERY_RESULT_BACKEND))
+        self.reindexer.redis.delete(self.reindexer.key(PRACTICE_INDEX_NAME))
+
+    def test_every_index_finds_changed_documents(self):
+        for repo in REINDEX_REPOS.values():
+            assert TestGpBaseInjector.get(repo).changed_ids(timezone.now()) == []
+
+    @patch.object(PracticeIndex, "bulk_remove_docs", return_value=1)
+    @patch.object(PracticeIndex, "bulk_index_docs", return_value=1)
+    def test_child_writes_and_deletes_are_synced(self, bulk_index, bulk_remove):
+        admin = self.user_repo.create(self.faker.get_user())
+        practice = self.practice_repo.create(
+            data=self.faker.get_practice(admin.id), skip_gmaps=True
+        )
+        staff = self.staff_repo.get_by_user_id(user_id=admin.id)
+        since = timezone.now()
+        TeamMemberModel.objects.create(
+            practice_id=practice.id,
+            staff_id=staff.id,
+            first_name="Jane",
+            last_name="Doe",
+            job_title="GP",
+        )
+
+        assert self.reindexer.sync(self.practice_repo, since) == (1, 0)
+        (docs,) = bulk_index.call_args.args
+        assert [doc.id for doc in docs] == [practice.id]
+        assert self.reindexer.watermark(PRACTICE_INDEX_NAME) > since
+
+        PracticeModel.objects.filter(id=practice.id).delete()
+        assert IndexTombstoneModel.objects.filter(
+            index_name=PRACTICE_INDEX_NAME, document_id=practice.id
+        ).exists()
+        assert self.reindexer.sync(self.practice_repo) == (0, 1)
+        bulk_remove.assert_called_once_with([practice.id])
+
+    def test_renaming_a_user_without_a_profile_is_synced(self):
+        user = User.objects.create(username="jane@example.com", first_name="Jane")
+        since = timezone.now()
+        assert self.user_repo.changed_ids(since) == []
+
+        user.last_login = timezone.now()
+        user.save(update_fields=["last_login"])
+        assert self.user_repo.changed_ids(since) == []
+
+        user.last_name = "Doe"
+        user.save()
+        assert self.user_repo.changed_ids(since) == [user.id]
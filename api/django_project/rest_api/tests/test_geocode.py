@@ -0,0 +1,137 @@
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from faker import Faker
+
+from rest_api.factory.repo import TestGpBaseInjector
+from rest_api.models.practice import PracticeModel
+from rest_api.models.prescription import PharmacyModel
+from rest_api.repositories.patient import PatientRepo
+from rest_api.repositories.practice import PracticeRepo
+from rest_api.repositories.prescription import PrescriptionRepo
+from rest_api.repositories.staff import StaffRepo
+from rest_api.repositories.user import UserRepo
+from rest_api.services.geocode import GeocodeCache, address_fingerprint
+
+ADDRESS = {
+    "country": "Canada",
+    "city": "Toronto",
+    "state": "ON",
+    "zip_code": "M5V 2T6",
+    "address_line_1": "12 King St. W",
+    "address_line_2": None,
+}
+
+
+class TestGeocodeCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.geo_service = MagicMock()
+        self.geo_service.get_location_coordinates.return_value = (43.6, -79.3)
+        self.geocode_cache = GeocodeCache(self.geo_service)
+
+    def test_fingerprint_ignores_case_spacing_and_punctuation(self):
+        messy = {**ADDRESS, "address_line_1": " 12  king st w", "address_line_2": ""}
+        assert address_fingerprint(messy) == address_fingerprint(ADDRESS)
+        moved = {**ADDRESS, "address_line_1": "14 King St. W"}
+        assert address_fingerprint(moved) != address_fingerprint(ADDRESS)
+
+    def test_resolved_addresses_are_served_from_redis_then_postgres(self):
+        assert self.geocode_cache.resolve(ADDRESS) == (43.6, -79.3)
+        with self.assertNumQueries(0):
+            assert self.geocode_cache.resolve(ADDRESS) == (43.6, -79.3)
+
+        cache.clear()
+        with self.assertNumQueries(1):
+            assert self.geocode_cache.resolve(ADDRESS) == (43.6, -79.3)
+        self.geo_service.get_location_coordinates.assert_called_once()
+
+    def test_update_only_geocodes_changed_addresses(self):
+        current = {**ADDRESS, "latitude": 1.0, "longitude": 2.0}
+        with self.assertNumQueries(0):
+            assert self.geocode_cache.coordinates_for_update(current, ADDRESS) == (
+                1.0,
+                2.0,
+                False,
+            )
+
+        moved = {**ADDRESS, "address_line_1": "14 King St. W"}
+        assert self.geocode_cache.coordinates_for_update(current, moved) == (
+            1.0,
+            2.0,
+            True,
+        )
+        self.geocode_cache.resolve(moved)
+        assert self.geocode_cache.coordinates_for_update(current, moved) == (
+            43.6,
+            -79.3,
+            False,
+        )
+        self.geo_service.get_location_coordinates.assert_called_once()
+
+
+class TestPracticeGeocoding(TestCase):
+
+    faker = TestGpBaseInjector.get(Faker)
+    user_repo = TestGpBaseInjector.get(UserRepo)
+    practice_repo = TestGpBaseInjector.get(PracticeRepo)
+    staff_repo = TestGpBaseInjector.get(StaffRepo)
+
+    def setUp(self):
+        cache.clear()
+        admin = self.user_repo.create(self.faker.get_user())
+        self.practice = self.practice_repo.create(
+            data=self.faker.get_practice(admin.id), skip_gmaps=True
+        )
+        self.staff = self.staff_repo.get_by_user_id(user_id=admin.id)
+
+    @patch("rest_api.repositories.practice.backfill_practice_coordinates_event")
+    def test_address_change_is_geocoded_after_commit(self, backfill):
+        practice = self.practice_repo.get(self.practice.id)
+        practice.staff_id = self.staff.id
+        with self.captureOnCommitCallbacks(execute=True):
+            self.practice_repo.update(id=practice.id, data=practice)
+        backfill.delay.assert_not_called()
+
+        practice.address_line_1 = "1 New Street"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.practice_repo.update(id=practice.id, data=practice)
+        backfill.delay.assert_called_once_with(practice.id)
+
+        self.practice_repo.backfill_coordinates(practice.id)
+        model = PracticeModel.objects.get(id=practice.id)
+        assert (model.latitude, model.longitude) == (1, 1)
+
+    @patch("rest_api.repositories.prescription.backfill_pharmacy_coordinates_event")
+    @patch("rest_api.repositories.practice.backfill_practice_coordinates_event")
+    def test_creates_leave_cache_misses_to_a_task(self, practice_backfill, backfill):
+        geo_service = self.practice_repo.geocode_cache.geo_service
+        geo_service.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            practice = self.practice_repo.create(
+                data=self.faker.get_practice(self.staff.user_id)
+            )
+        assert (practice.latitude, practice.longitude) == (None, None)
+        practice_backfill.delay.assert_called_once_with(practice.id)
+
+        prescription_repo = TestGpBaseInjector.get(PrescriptionRepo)
+        user = User.objects.create(username="patient.one")
+        patient = TestGpBaseInjector.get(PatientRepo).create(
+            self.faker.get_patient(user.id, self.faker.get_user()), test_data=True
+        )
+        data = self.faker.get_prescription(patient.id, practice.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            first = prescription_repo.create(data)
+            second = prescription_repo.create(data)
+        geo_service.get_location_coordinates.assert_not_called()
+        assert first.pharmacy.id == second.pharmacy.id
+        assert first.pharmacy.latitude is None
+        backfill.delay.assert_called_once_with(first.pharmacy.id)
+
+        with patch.object(prescription_repo.outbox, "index") as index:
+            prescription_repo.backfill_pharmacy_coordinates(first.pharmacy.id)
+        assert sorted(index.call_args.args[1:]) == sorted([first.id, second.id])
+        pharmacy = PharmacyModel.objects.get(id=first.pharmacy.id)
+        assert (pharmacy.latitude, pharmacy.longitude) == (1, 1)
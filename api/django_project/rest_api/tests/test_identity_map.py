@@ -0,0 +1,62 @@
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from faker import Faker
+
+from rest_api.factory.repo import TestGpBaseInjector
+from rest_api.repositories.user import UserRepo
+from rest_api.utils.identity_map import IdentityMap, identity_map_scope, load_many
+from rest_api.utils.schema_cache import clear_local_caches
+
+
+class TestIdentityMap(SimpleTestCase):
+    def test_missing_ids_are_batch_loaded_once(self):
+        calls = []
+
+        def loader(ids):
+            calls.append(sorted(ids))
+            return {id: f"user-{id}" for id in ids if id != 3}
+
+        identity_map = IdentityMap()
+        assert identity_map.get_many("user", [1, 2, 2], loader) == {
+            1: "user-1",
+            2: "user-2",
+        }
+        assert identity_map.get_many("user", [1, 2, 3], loader) == {
+            1: "user-1",
+            2: "user-2",
+        }
+        assert calls == [[1, 2], [3]]
+        assert (identity_map.hits, identity_map.misses) == (2, 3)
+
+    def test_load_many_without_scope_always_loads(self):
+        calls = []
+
+        def loader(ids):
+            calls.append(ids)
+            return {id: id for id in ids}
+
+        load_many("user", [1], loader)
+        load_many("user", [1], loader)
+        assert len(calls) == 2
+
+
+class TestUserRepoIdentityMap(TestCase):
+
+    faker = TestGpBaseInjector.get(Faker)
+    user_repo = TestGpBaseInjector.get(UserRepo)
+
+    def test_repeated_gets_hit_the_map(self):
+        user = self.user_repo.create(self.faker.get_user())
+        cache.clear()
+        clear_local_caches()
+        with identity_map_scope() as identity_map:
+            with self.assertNumQueries(1):
+                for _ in range(5):
+                    assert self.user_repo.get(user.id) == user
+            assert (identity_map.hits, identity_map.misses) == (4, 1)
+
+            updated = self.user_repo.update(
+                user.id, user.copy(update={"first_name": "New"})
+            )
+            assert self.user_repo.get(user.id) == updated
+            assert updated.first_name == "New"
@@ -0,0 +1,78 @@
+from unittest.mock import MagicMock
+
+from django.test import SimpleTestCase
+from elastic_transport import ApiResponseMeta, HttpHeaders
+from elasticsearch import NotFoundError
+from redis import Redis
+
+from django_project import settings
+from rest_api.services.elastic import ElasticSearchService
+from rest_api.services.elastic_indexes.user import UserIndex
+
+
+def not_found(error_type: str) -> NotFoundError:
+    meta = ApiResponseMeta(
+        status=404, http_version="1.1", headers=HttpHeaders(), duration=0.0, node=None
+    )
+    return NotFoundError(error_type, meta, {"error": {"type": error_type}})
+
+
+class TestIndexExistence(SimpleTestCase):
+    def setUp(self):
+        self.redis = Redis.from_url(settings.CELERY_RESULT_BACKEND)
+        self.service = UserIndex(es=MagicMock(), redis=self.redis)
+        self.service.lock = MagicMock()
+        self.redis.delete(self.service.version_key)
+        ElasticSearchService.known_indexes.clear()
+
+    def test_existence_is_checked_once_until_the_index_moves(self):
+        for id in range(3):
+            self.service.remove(id=id)
+        self.service.es.indices.exists.assert_called_once()
+
+        # A migration in another process moves the version on
+        self.redis.incr(self.service.version_key)
+        self.service.remove(id=4)
+        assert self.service.es.indices.exists.call_count == 2
+
+        version = self.service.index_version()
+        self.service.begin_migration()
+        self.service.end_migration()
+        assert self.service.index_version() == version + 2
+
+        self.service.delete_index()
+        self.service.es.indices.reset_mock()
+        self.service.es.indices.exists.return_value = False
+        self.service.remove(id=5)
+        self.service.remove(id=6)
+        self.service.es.indices.exists.assert_called_once()
+        self.service.es.indices.create.assert_called_once()
+
+    def test_reads_only_create_a_missing_index(self):
+        self.service.es.search.side_effect = [
+            not_found("index_not_found_exception"),
+            {},
+        ]
+        self.service.es.indices.exists.return_value = False
+        assert self.service.search(query={"match_all": {}}) == {}
+        self.service.es.indices.create.assert_called_once()
+        assert self.service.es.search.call_count == 2
+
+        self.service.es.get.side_effect = not_found("document_missing")
+        with self.assertRaises(NotFoundError):
+            self.service.get(1)
+        self.service.es.indices.create.assert_called_once()
+
+    def test_writes_skip_existence_checks(self):
+        self.service.es.indices.exists.return_value = True
+        self.service.add(id=1, doc_data=MagicMock(**{"dict.return_value": {"id": 1}}))
+        self.service.remove(id=2)
+        self.service.es.exists.assert_not_called()
+        self.service.es.options.assert_any_call(ignore_status=409)
+        self.service.es.options.return_value.create.assert_called_once_with(
+            index=self.service.write_name, id=1, document={"id": 1}
+        )
+        self.service.es.options.assert_called_with(ignore_status=404)
+        self.service.es.options.return_value.delete.assert_called_once_with(
+            index=self.service.write_name, id=2
+        )
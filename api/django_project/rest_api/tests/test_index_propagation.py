@@ -0,0 +1,107 @@
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from faker import Faker
+
+from django_project import settings
+from rest_api.events.propagation import propagate
+from rest_api.factory.repo import TestGpBaseInjector
+from rest_api.models.appointment import AppointmentCommentModel, AppointmentModel
+from rest_api.repositories.patient import PatientRepo
+from rest_api.repositories.practice import PracticeRepo
+from rest_api.repositories.staff import StaffRepo
+from rest_api.repositories.user import UserRepo
+from rest_api.schemas.user import UserSchema
+from rest_api.services.elastic_indexes.appointment import AppointmentIndex
+from rest_api.services.elastic_indexes.booking import BookingIndex
+from rest_api.services.elastic_indexes.patient import PatientIndex
+from rest_api.services.elastic_indexes.prescription import PrescriptionIndex
+from rest_api.services.index_propagation import USER_PATHS
+
+
+class TestIndexPropagation(TestCase):
+
+    faker = TestGpBaseInjector.get(Faker)
+    user_repo = TestGpBaseInjector.get(UserRepo)
+    practice_repo = TestGpBaseInjector.get(PracticeRepo)
+    staff_repo = TestGpBaseInjector.get(StaffRepo)
+    patient_repo = TestGpBaseInjector.get(PatientRepo)
+
+    def setUp(self):
+        admin = self.user_repo.create(self.faker.get_user())
+        self.practice = self.practice_repo.create(
+            data=self.faker.get_practice(admin.id), skip_gmaps=True
+        )
+        self.staff = self.staff_repo.get_by_user_id(user_id=admin.id)
+        user = User.objects.create(username="patient.one")
+        self.patient = self.patient_repo.create(
+            self.faker.get_patient(user.id, self.faker.get_user()), test_data=True
+        )
+        self.appointment = AppointmentModel.objects.create(
+            **self.faker.get_appointment(self.patient.id, self.practice.id).dict(
+                include={"symptoms", "symptom_category", "state"}
+            ),
+            symptoms_duration_seconds=60,
+            patient_id=self.patient.id,
+            practice_id=self.practice.id,
+        )
+
+    @patch("rest_api.events.propagation.propagate_entity_event")
+    def test_user_update_is_propagated_after_commit(self, event):
+        user = self.user_repo.get(self.patient.user_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user_repo.update(id=user.id, data=user)
+        event.delay.assert_called_once_with("user", user.id)
+
+    @patch.object(PatientIndex, "bulk_index_docs")
+    @patch.object(BookingIndex, "update_embedded", return_value=0)
+    @patch.object(PrescriptionIndex, "update_embedded", return_value=0)
+    @patch.object(AppointmentIndex, "update_embedded", return_value=1)
+    def test_user_rename_reaches_every_copy(
+        self, appointments, prescriptions, bookings, patients
+    ):
+        AppointmentCommentModel.objects.create(
+            appointment_id=self.appointment.id,
+            user_id=self.staff.user_id,
+            comment="Seen",
+        )
+        user = User.objects.get(id=self.staff.user_id)
+        user.first_name = "Renamed"
+        user.save()
+
+        assert propagate("user", self.staff.user_id) == 1
+        ids, paths, document = appointments.call_args.args
+        assert (ids, paths) == ([self.appointment.id], USER_PATHS)
+        assert document.first_name == "Renamed"
+        prescriptions.assert_not_called()
+        bookings.assert_not_called()
+        patients.assert_not_called()
+
+        user = User.objects.get(id=self.patient.user_id)
+        user.first_name = "Renamed"
+        user.save()
+        appointments.reset_mock()
+        propagate("user", user.id)
+        patients.assert_called_once()
+        ids, paths, document = appointments.call_args.args
+        assert (ids, paths) == ([self.appointment.id], ("patient",))
+        assert document.id == self.patient.id and document.first_name == "Renamed"
+
+
+class TestUpdateEmbedded(SimpleTestCase):
+    @patch.object(settings, "INDEX_PROPAGATION_BATCH_SIZE", 2)
+    def test_copies_are_updated_in_batches(self):
+        service = TestGpBaseInjector.get(AppointmentIndex)
+        service.es = MagicMock()
+        service.es.update_by_query.return_value = {"updated": 2}
+        user = UserSchema(id=7, first_name="A", last_name="B", email="a@example.com")
+
+        assert service.update_embedded([1, 2, 3], USER_PATHS, user) == 4
+        first, second = service.es.update_by_query.call_args_list
+        assert first.kwargs["query"] == {"ids": {"values": ["1", "2"]}}
+        assert second.kwargs["query"] == {"ids": {"values": ["3"]}}
+        params = first.kwargs["script"]["params"]
+        assert params["id"] == "7" and params["document"] == user.dict()
+        assert ["logs", "triggered_by"] in params["paths"]
+        assert first.kwargs["conflicts"] == "proceed"
@@ -0,0 +1,50 @@
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase
+from redis import Redis
+
+from django_project import settings
+from rest_api.services.index_sync import IndexSyncScheduler
+
+
+class TestIndexSyncScheduler(SimpleTestCase):
+    def setUp(self):
+        self.index_sync = IndexSyncScheduler(
+            Redis.from_url(settings.CELERY_RESULT_BACKEND)
+        )
+        self.service = MagicMock(es_index_name="test_sync")
+        self.index_sync.redis.delete(*self.index_sync.keys("test_sync"))
+
+    @patch.object(settings, "INDEX_SYNC_DEBOUNCE_SECONDS", 0)
+    def test_burst_of_writes_is_synced_once(self):
+        for id in [1, 1, 2, 1]:
+            self.index_sync.mark_dirty(self.service, id)
+
+        loader = MagicMock(return_value=["doc-1", "doc-2"])
+        with patch(
+            "rest_api.services.index_sync.coalesced_writes_counter"
+        ) as coalesced:
+            self.index_sync.flush(self.service, loader)
+        loader.assert_called_once_with([1, 2])
+        self.service.bulk_index_docs.assert_called_once_with(["doc-1", "doc-2"])
+        coalesced.add.assert_called_once_with(2, {"index": "test_sync"})
+
+        assert self.index_sync.flush(self.service, loader) == 0
+        assert loader.call_count == 1
+
+    @patch.object(settings, "INDEX_SYNC_DEBOUNCE_SECONDS", 60)
+    @patch.object(settings, "INDEX_SYNC_MAX_DELAY_SECONDS", 60)
+    def test_recent_writes_wait_for_the_window(self):
+        self.index_sync.mark_dirty(self.service, 1)
+        assert self.index_sync.take_due("test_sync") == []
+
+        with patch.object(settings, "INDEX_SYNC_MAX_DELAY_SECONDS", 0):
+            assert self.index_sync.take_due("test_sync") == [1]
+
+    @patch.object(settings, "INDEX_SYNC_DEBOUNCE_SECONDS", 0)
+    def test_failed_flush_keeps_documents_dirty(self):
+        self.index_sync.mark_dirty(self.service, 1)
+        self.service.bulk_index_docs.side_effect = Exception("es down")
+        with self.assertRaises(Exception):
+            self.index_sync.flush(self.service, lambda ids: ids)
+        assert self.index_sync.take_due("test_sync") == [1]
@@ -0,0 +1,65 @@
+import jwt
+from django.test import SimpleTestCase
+
+from django_project.jwks import JWKSKeyNotFound, JWKSKeyStore
+from django_project.jwks_testing import LocalJWKSServer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestJWKSKeyStore(SimpleTestCase):
+    def setUp(self):
+        self.server = LocalJWKSServer().start()
+        self.clock = FakeClock()
+        self.store = JWKSKeyStore(
+            jwks_url=self.server.jwks_url,
+            ttl=60,
+            min_refetch_interval=10,
+            clock=self.clock,
+        )
+
+    def tearDown(self):
+        self.server.stop()
+
+    def decode(self, token: str) -> dict:
+        kid = jwt.get_unverified_header(token)["kid"]
+        return jwt.decode(
+            token,
+            self.store.get_key(kid),
+            audience="test",
+            issuer=self.server.issuer,
+            algorithms=["RS256"],
+        )
+
+    def test_keys_are_cached_by_kid(self):
+        token = self.server.mint_token(audience="test")
+        for _ in range(5):
+            assert self.decode(token)["sub"] == "auth0|test-user"
+        assert self.server.request_count == 1
+
+    def test_unknown_kid_refetches_after_rotation(self):
+        self.decode(self.server.mint_token(audience="test"))
+        self.server.rotate()
+        self.clock.now += 11
+        self.decode(self.server.mint_token(audience="test"))
+        assert self.server.request_count == 2
+
+    def test_unknown_kid_refetch_is_rate_limited(self):
+        self.decode(self.server.mint_token(audience="test"))
+        for _ in range(3):
+            with self.assertRaises(JWKSKeyNotFound):
+                self.store.get_key("forged-kid")
+        assert self.server.request_count == 1
+
+    def test_stale_keys_are_served_when_endpoint_is_down(self):
+        token = self.server.mint_token(audience="test")
+        self.decode(token)
+        self.server.stop()
+        self.clock.now += 61
+        assert self.decode(token)["sub"] == "auth0|test-user"
@@ -0,0 +1,180 @@
+from unittest.mock import MagicMock, patch
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase
+from django.utils import timezone
+from faker import Faker
+
+from rest_api.factory.repo import TestGpBaseInjector
+from rest_api.models.outbox import OutboxModel
+from rest_api.repositories.user import UserRepo
+from rest_api.schemas.user import UserSchema
+from rest_api.services.elastic_indexes.appointment import AppointmentIndex
+from rest_api.services.elastic_indexes.elastic_indexes import USER_INDEX_NAME
+from rest_api.services.elastic_indexes.user import UserIndex
+from rest_api.services.index_sync import IndexSyncScheduler
+from rest_api.services.outbox import (
+    Outbox,
+    deliver_after_commit,
+)
+from rest_api.services.websocket import WebsocketEventTypes
+from rest_api.tasks.outbox import claim_outbox_rows, process_outbox_batch
+
+
+class TestOutbox(TestCase):
+
+    faker = TestGpBaseInjector.get(Faker)
+    outbox = TestGpBaseInjector.get(Outbox)
+    user_repo = TestGpBaseInjector.get(UserRepo)
+
+    def setUp(self):
+        cache.clear()
+        OutboxModel.objects.all().delete()
+
+    def test_rows_are_written_with_the_transaction(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            user = self.user_repo.create(self.faker.get_user())
+            self.user_repo.update(id=user.id, data=user)
+        assert (
+            OutboxModel.objects.filter(kind="index", target=USER_INDEX_NAME).count()
+            == 2
+        )
+        with patch("rest_api.tasks.outbox.drain_outbox") as drain:
+            for callback in callbacks:
+                callback()
+        drain.delay.assert_called_once_with()
+
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                self.user_repo.delete(user.id)
+                raise ValueError
+        assert OutboxModel.objects.count() == 2
+
+    def test_index_rows_are_delivered_in_one_request_per_index(self):
+        user = self.user_repo.create(self.faker.get_user())
+        deleted = self.user_repo.create(self.faker.get_user())
+        self.user_repo.update(id=user.id, data=user)
+        self.user_repo.delete(deleted.id)
+
+        with patch.object(
+            UserIndex, "bulk_index_docs"
+        ) as bulk_index_docs, patch.object(
+            UserIndex, "bulk_remove_docs"
+        ) as bulk_remove_docs:
+            assert process_outbox_batch() == 4
+
+        (docs,), kwargs = bulk_index_docs.call_args
+        assert docs == [self.user_repo.get(user.id)]
+        assert kwargs == {}
+        bulk_remove_docs.assert_called_once_with([deleted.id])
+        assert not OutboxModel.objects.exists()
+
+    @patch("rest_api.tasks.outbox.GpBaseInjector")
+    def test_failed_groups_back_off_without_blocking_others(self, injector):
+        websocket_service, notification_service = MagicMock(), MagicMock()
+        injector.get.side_effect = lambda cls: {
+            "WebsocketService": websocket_service,
+            "NotificationService": notification_service,
+        }[cls.__name__]
+        notification_service.send_email.side_effect = ConnectionError
+        message = UserSchema(id=1, email="a@example.com", first_name="A", last_name="B")
+        for _ in range(2):
+            self.outbox.send_message(
+                1, WebsocketEventTypes.UPDATE_AVAILABILITY, message
+            )
+        self.outbox.send_email(["a@example.com"], "Subject", "Text")
+
+        assert process_outbox_batch() == 3
+        practice_id, events = websocket_service.send_batch.call_args.args
+        assert practice_id == 1 and len(events) == 2
+        assert events[0] == {"type": "update_availability", "message": message.json()}
+
+        row = OutboxModel.objects.get()
+        assert row.kind == "email" and row.attempts == 1
+        assert row.available_at > timezone.now()
+        assert "ConnectionError" in row.last_error
+        assert process_outbox_batch() == 0
+
+    @patch("rest_api.tasks.outbox.GpBaseInjector")
+    def test_emails_already_sent_are_not_sent_again(self, injector):
+        notification_service = injector.get.return_value
+        self.outbox.send_email(["a@example.com"], "Subject", "Text")
+        row = OutboxModel.objects.get()
+        cache.set(f"outbox_email_sent_{row.id}", 1)
+
+        assert process_outbox_batch() == 1
+        notification_service.send_email.assert_not_called()
+        assert not OutboxModel.objects.exists()
+
+    @patch("rest_api.tasks.outbox.drain_outbox")
+    @patch("rest_api.tasks.outbox.deliver_outbox_rows")
+    def test_read_your_writes_rows_get_a_task_of_their_own(self, deliver, drain):
+        service = TestGpBaseInjector.get(AppointmentIndex)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.outbox.index(service, 1)
+        deliver.delay.assert_called_once_with([OutboxModel.objects.get().id])
+
+        deliver.delay.side_effect = ConnectionError
+        with self.assertLogs("rest_api.services.outbox", "ERROR"):
+            deliver_after_commit([1, 2])
+        drain.delay.assert_called_once_with()
+
+    @patch.object(IndexSyncScheduler, "mark_dirty_many")
+    def test_sync_rows_are_handed_to_the_scheduler(self, mark_dirty_many):
+        service = TestGpBaseInjector.get(AppointmentIndex)
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                self.outbox.sync(service, 1)
+                raise ValueError
+        assert not OutboxModel.objects.exists()
+
+        self.outbox.sync(service, 1, 2)
+        self.outbox.sync(service, 1)
+        assert process_outbox_batch() == 3
+        (index, ids), _ = mark_dirty_many.call_args
+        assert index.es_index_name == service.es_index_name and ids == {1, 2}
+        assert not OutboxModel.objects.exists()
+
+    @patch("rest_api.tasks.outbox.GpBaseInjector")
+    def test_rows_are_leased_and_delivered_outside_a_transaction(self, injector):
+        outer = len(connection.atomic_blocks)
+
+        def send_email(**_):
+            assert len(connection.atomic_blocks) == outer
+            assert claim_outbox_rows() == []
+
+        injector.get.return_value.send_email.side_effect = send_email
+        self.outbox.send_email(["a@example.com"], "Subject", "Text")
+        assert process_outbox_batch() == 1
+        assert not OutboxModel.objects.exists()
+
+        self.outbox.send_email(["a@example.com"], "Subject", "Text")
+        (row,) = claim_outbox_rows()
+        assert process_outbox_batch() == 0
+        # The drain that claimed it died, and its lease ran out
+        OutboxModel.objects.filter(id=row.id).update(available_at=timezone.now())
+        assert process_outbox_batch() == 1
+
+    @patch("rest_api.tasks.outbox.drain_outbox")
+    def test_one_drain_per_commit_across_savepoints(self, drain):
+        message = UserSchema(id=1, email="a@example.com", first_name="A", last_name="B")
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                with self.assertRaises(ValueError):
+                    with transaction.atomic():
+                        self.outbox.send_email(["a@example.com"], "Subject", "Text")
+                        raise ValueError
+                self.outbox.send_message(
+                    1, WebsocketEventTypes.UPDATE_AVAILABILITY, message
+                )
+                self.outbox.send_message(
+                    1, WebsocketEventTypes.UPDATE_AVAILABILITY, message
+                )
+        drain.delay.assert_called_once_with()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.outbox.send_message(
+                1, WebsocketEventTypes.UPDATE_AVAILABILITY, message
+            )
+        assert drain.delay.call_count == 2
@@ -0,0 +1,163 @@
+from types import SimpleNamespace
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from faker import Faker
+from rest_framework import generics
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from django_project.auth_utils import AuthContext
+from rest_api.factory.repo import TestGpBaseInjector
+from rest_api.models.appointment import AppointmentCommentModel, AppointmentModel
+from rest_api.models.prescription import PrescriptionModel
+from rest_api.repositories.appointment import AppointmentRepo
+from rest_api.repositories.patient import PatientRepo
+from rest_api.repositories.permissions import (
+    ObjectPermissionFilter,
+    PatientPermissionReadWrite,
+    StaffPermission,
+    filter_permitted,
+    permission_filter_errors,
+)
+from rest_api.repositories.practice import PracticeRepo
+from rest_api.repositories.prescription import PrescriptionRepo
+from rest_api.repositories.staff import StaffRepo
+from rest_api.repositories.user import UserRepo
+from rest_api.views.appointment import (
+    ListAppointmentByPracticeStateView,
+    ListAppointmentView,
+)
+from rest_api.views.prescription import ListPrescriptionView
+
+
+class TestBulkPermissions(TestCase):
+
+    faker = TestGpBaseInjector.get(Faker)
+    user_repo = TestGpBaseInjector.get(UserRepo)
+    patient_repo = TestGpBaseInjector.get(PatientRepo)
+    practice_repo = TestGpBaseInjector.get(PracticeRepo)
+    staff_repo = TestGpBaseInjector.get(StaffRepo)
+    appointment_repo = TestGpBaseInjector.get(AppointmentRepo)
+    prescription_repo = TestGpBaseInjector.get(PrescriptionRepo)
+
+    def setUp(self):
+        admin = self.user_repo.create(self.faker.get_user())
+        self.practice = self.practice_repo.create(
+            data=self.faker.get_practice(admin.id), skip_gmaps=True
+        )
+        self.staff = self.staff_repo.get_by_user_id(user_id=admin.id)
+        self.patients = []
+        for username in ["patient.one", "patient.two"]:
+            user = User.objects.create(username=username)
+            patient = self.patient_repo.create(
+                self.faker.get_patient(user.id, self.faker.get_user()), test_data=True
+            )
+            for _ in range(3):
+                self.appointment_repo.create(
+                    self.faker.get_appointment(patient.id, self.practice.id)
+                )
+                self.prescription_repo.create(
+                    self.faker.get_prescription(patient.id, self.practice.id),
+                    test_data=True,
+                )
+            self.patients.append(patient)
+
+    def context_for(self, scopes=(), **identity) -> AuthContext:
+        fields = {"patient_id": None, "staff_id": None, "practice_id": None}
+        fields.update(identity)
+        return AuthContext(
+            token="token", claims={}, scopes=scopes, org_id=None, user_id=None, **fields
+        )
+
+    def request_as(self, **identity) -> SimpleNamespace:
+        return SimpleNamespace(auth=self.context_for(**identity), method="GET")
+
+    def listed(self, view_class, url: str, **identity) -> list[int]:
+        scopes = ("get:appointment", "get:prescription")
+        request = APIRequestFactory().get(url)
+        force_authenticate(request, token=self.context_for(scopes, **identity))
+        response = view_class.as_view()(request)
+        assert response.status_code == 200, response.data
+        return [row["id"] for row in response.data["results"]]
+
+    def permitted(self, view_class, request) -> list[int]:
+        view = view_class()
+        queryset = AppointmentModel.objects.all()
+        with CaptureQueriesContext(connection) as queries:
+            result = list(
+                filter_permitted(request, view, queryset).values_list("id", flat=True)
+            )
+        assert len(queries.captured_queries) <= 1
+        return result
+
+    def test_patient_only_sees_own_rows(self):
+        patient = self.patients[0]
+        result = self.permitted(
+            ListAppointmentView, self.request_as(patient_id=patient.id)
+        )
+        expected = AppointmentModel.objects.filter(patient_id=patient.id)
+        assert sorted(result) == sorted(expected.values_list("id", flat=True))
+
+    def test_staff_scoped_to_own_practice(self):
+        result = self.permitted(
+            ListAppointmentByPracticeStateView,
+            self.request_as(staff_id=self.staff.id, practice_id=self.practice.id),
+        )
+        assert len(result) == 6
+
+        result = self.permitted(
+            ListAppointmentByPracticeStateView,
+            self.request_as(staff_id=self.staff.id, practice_id=self.practice.id + 1),
+        )
+        assert result == []
+
+    def test_anonymous_sees_nothing(self):
+        assert self.permitted(ListAppointmentView, self.request_as()) == []
+
+    def test_own_lists_are_not_widened_by_a_staff_identity(self):
+        staff = {"staff_id": self.staff.id, "practice_id": self.practice.id}
+        patient = self.patients[0]
+        for view_class, url, model in [
+            (ListAppointmentView, "/appointments", AppointmentModel),
+            (ListPrescriptionView, "/prescriptions", PrescriptionModel),
+        ]:
+            with self.subTest(url=url):
+                assert self.listed(view_class, url, **staff) == []
+
+                own = model.objects.filter(patient_id=patient.id)
+                result = self.listed(view_class, url, patient_id=patient.id, **staff)
+                assert sorted(result) == sorted(own.values_list("id", flat=True))
+
+    def test_object_checks_compare_ids_without_loading_relations(self):
+        appointment = AppointmentModel.objects.get(
+            id=AppointmentModel.objects.filter(patient_id=self.patients[0].id)
+            .values_list("id", flat=True)
+            .first()
+        )
+        comment = AppointmentCommentModel.objects.create(
+            appointment_id=appointment.id, user_id=self.staff.user_id, comment="Hi"
+        )
+        comment = AppointmentCommentModel.objects.get(id=comment.id)
+        patient = self.request_as(patient_id=self.patients[0].id)
+        staff = self.request_as(staff_id=self.staff.id, practice_id=self.practice.id)
+        with self.assertNumQueries(0):
+            assert PatientPermissionReadWrite().has_object_permission(
+                patient, None, appointment
+            )
+            assert StaffPermission().has_object_permission(staff, None, appointment)
+        with self.assertNumQueries(2):
+            assert PatientPermissionReadWrite().has_object_permission(
+                patient, None, comment
+            )
+            assert StaffPermission().has_object_permission(staff, None, comment)
+
+    def test_negated_permissions_are_rejected_on_filtered_views(self):
+        class NegatedView(generics.ListAPIView):
+            filter_backends = [ObjectPermissionFilter]
+            permission_classes = [PatientPermissionReadWrite | ~StaffPermission]
+
+        (error,) = permission_filter_errors([NegatedView, ListAppointmentView])
+        assert error.id == "rest_api.E001" and error.obj is NegatedView
+        assert permission_filter_errors() == []
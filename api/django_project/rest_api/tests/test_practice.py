@@ -1,10 +1,17 @@
-from django.test import TestCase
+import json
+
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
 from faker import Faker
+from rest_framework.test import APIClient
 
 from rest_api.factory.repo import TestGpBaseInjector
+from rest_api.models.practice_items import NoticeModel
 from rest_api.repositories.practice import PracticeRepo
 from rest_api.repositories.staff import StaffRepo
 from rest_api.repositories.user import UserRepo
+from rest_api.repositories.utils import resolve_practice_slug, warm_practice_identities
+from rest_api.utils.identity_cache import identity_cache
 
 
 class TestPracticeRepo(TestCase):
@@ -34,3 +41,132 @@ class TestPracticeRepo(TestCase):
         self.practice_repo.delete(id=self.practice.id)
         with self.assertRaises(Exception):
             self.practice_repo.get(id=self.practice.id)
+
+    def test_get_many_reads_cache_and_fills_misses(self):
+        others = [
+            self.practice_repo.create(
+                data=self.faker.get_practice(self.staff.user_id), skip_gmaps=True
+            )
+            for _ in range(2)
+        ]
+        ids = [self.practice.id] + [p.id for p in others]
+        self.practice_repo.cache.delete(*ids)
+
+        with self.assertNumQueries(8):
+            loaded = self.practice_repo.get_many(ids)
+        with self.assertNumQueries(0):
+            cached = self.practice_repo.get_many(ids)
+        assert loaded == cached
+        assert [loaded[id].id for id in ids] == ids
+        assert self.practice_repo.get(others[0].id).name == others[0].name
+
+    def test_slug_resolution_is_cached_until_the_slug_changes(self):
+        identity_cache.clear()
+        cache.clear()
+        with self.assertNumQueries(2):
+            assert resolve_practice_slug(self.practice.slug) == self.practice.id
+            assert resolve_practice_slug("new-name") is None
+        with self.assertNumQueries(0):
+            assert resolve_practice_slug(self.practice.slug) == self.practice.id
+            assert resolve_practice_slug("new-name") is None
+
+        old_slug = self.practice.slug
+        practice = self.practice_repo.get(id=self.practice.id)
+        practice.name = "New Name"
+        practice.staff_id = self.staff.id
+        with self.captureOnCommitCallbacks(execute=True):
+            self.practice_repo.update(id=practice.id, data=practice)
+        assert resolve_practice_slug("new-name") == self.practice.id
+        assert resolve_practice_slug(old_slug) is None
+
+    def test_warm_practice_identities(self):
+        identity_cache.clear()
+        cache.clear()
+        warm_practice_identities()
+        key = identity_cache.key("practice_slug", self.practice.slug)
+        assert identity_cache.local.get(key) is None
+        with self.assertNumQueries(0):
+            assert resolve_practice_slug(self.practice.slug) == self.practice.id
+
+
+class TestPublicPracticeViews(TestCase):
+
+    faker = TestGpBaseInjector.get(Faker)
+    user_repo = TestGpBaseInjector.get(UserRepo)
+    practice_repo = TestGpBaseInjector.get(PracticeRepo)
+    staff_repo = TestGpBaseInjector.get(StaffRepo)
+
+    def setUp(self):
+        cache.clear()
+        admin = self.user_repo.create(self.faker.get_user())
+        self.practice = self.practice_repo.create(
+            data=self.faker.get_practice(admin.id), skip_gmaps=True
+        )
+        self.staff = self.staff_repo.get_by_user_id(user_id=admin.id)
+        self.client = APIClient()
+        self.url = f"/practices/find/{self.practice.slug}"
+
+    def test_matching_etag_is_answered_without_queries(self):
+        response = self.client.get(self.url)
+        assert response.status_code == 200
+        assert response.json()["id"] == self.practice.id
+        etag = response["ETag"]
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url)
+            not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        assert cached.content == response.content
+        assert not_modified.status_code == 304
+        assert not_modified["ETag"] == etag
+
+    def test_practice_write_invalidates_rendered_pages(self):
+        etag = self.client.get(self.url)["ETag"]
+        list_etag = self.client.get("/practices")["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            NoticeModel.objects.create(
+                practice_id=self.practice.id,
+                staff_id=self.staff.id,
+                title="Closed on Friday",
+                description_markdown="",
+            )
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response["ETag"] != etag
+        notices = [notice["title"] for notice in response.json()["notices"]]
+        assert "Closed on Friday" in notices
+        assert self.client.get("/practices")["ETag"] != list_etag
+
+    def test_list_is_cached_by_page_and_ordering_only(self):
+        responses = self.practice_repo.responses
+        first = self.client.get("/practices?utm=1", HTTP_HOST="evil.example")
+        assert first.status_code == 200
+        assert "evil.example" not in first.content.decode()
+        assert cache.get(responses.body_key("list_1_")) == first.content
+
+        ordered = self.client.get("/practices?ordering=name")
+        with self.assertNumQueries(0):
+            other = self.client.get("/practices?utm=2&x=y")
+            repeated = self.client.get("/practices?ordering=name,-name,name")
+        assert other.content == first.content
+        assert repeated.content == ordered.content
+
+    def test_write_during_a_render_is_not_hidden(self):
+        responses = self.practice_repo.responses
+        tag = str(self.practice.id)
+
+        def render():
+            # A practice write lands while the page is being rendered
+            responses.invalidate(tag)
+            return {"name": "old"}
+
+        request = RequestFactory().get(self.url)
+        assert (
+            responses.respond(request, "race", lambda: ([tag], render)).status_code
+            == 200
+        )
+        fresh = responses.respond(
+            request, "race", lambda: ([tag], lambda: {"name": "new"})
+        )
+        assert json.loads(fresh.content) == {"name": "new"}
@@ -0,0 +1,62 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from faker import Faker
+
+from rest_api.factory.repo import TestGpBaseInjector
+from rest_api.models.prescription import PrescriptionModel
+from rest_api.repositories.patient import PatientRepo
+from rest_api.repositories.practice import PracticeRepo
+from rest_api.repositories.prescription import PrescriptionRepo
+from rest_api.repositories.user import UserRepo
+from rest_api.utils.schema_cache import clear_local_caches
+
+GET_MANY_QUERIES = 10
+
+
+class TestPrescriptionRepo(TestCase):
+
+    faker = TestGpBaseInjector.get(Faker)
+    user_repo = TestGpBaseInjector.get(UserRepo)
+    patient_repo = TestGpBaseInjector.get(PatientRepo)
+    practice_repo = TestGpBaseInjector.get(PracticeRepo)
+    prescription_repo = TestGpBaseInjector.get(PrescriptionRepo)
+
+    def setUp(self):
+        admin = self.user_repo.create(self.faker.get_user())
+        self.practice = self.practice_repo.create(
+            data=self.faker.get_practice(admin.id), skip_gmaps=True
+        )
+        user = User.objects.create(username="patient.one")
+        self.patient = self.patient_repo.create(
+            self.faker.get_patient(user.id, self.faker.get_user()), test_data=True
+        )
+
+    def create_prescriptions(self, count: int) -> list[int]:
+        return [
+            self.prescription_repo.create(
+                self.faker.get_prescription(self.patient.id, self.practice.id),
+                test_data=True,
+            ).id
+            for _ in range(count)
+        ]
+
+    def test_get_many_query_budget(self):
+        for count in [1, 25]:
+            with self.subTest(count=count):
+                ids = self.create_prescriptions(count)
+                cache.clear()
+                clear_local_caches()
+                with self.assertNumQueries(GET_MANY_QUERIES):
+                    result = self.prescription_repo.get_many(ids)
+                assert [p.id for p in result] == ids
+                assert all(p.items and p.pharmacy.id for p in result)
+                assert all(p.patient.id == self.patient.id for p in result)
+
+    def test_get_matches_get_many(self):
+        ids = self.create_prescriptions(3)
+        for id, prescription in zip(ids, self.prescription_repo.get_many(ids)):
+            assert self.prescription_repo.get(id) == prescription
+
+        with self.assertRaises(PrescriptionModel.DoesNotExist):
+            self.prescription_repo.get(max(ids) + 1)
@@ -0,0 +1,126 @@
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+
+from django_project import settings
+from rest_api.factory.repo import TestGpBaseInjector
+from rest_api.repositories.user import UserRepo
+from rest_api.services.elastic import ElasticSearchService
+from rest_api.tasks.elastic import reindex_chunk, start_parallel_reindex
+from rest_api.utils.elastic_migration import (
+    chunk_id_ranges,
+    keyset_id_batches,
+    split_lanes,
+)
+
+
+class TestSplitLanes(SimpleTestCase):
+    def test_ranges_are_dealt_round_robin(self):
+        ranges = [(1, 2), (3, 4), (5, 6), (7, 8), (9, 9)]
+        assert split_lanes(ranges, 2) == [[(1, 2), (5, 6), (9, 9)], [(3, 4), (7, 8)]]
+        assert split_lanes(ranges[:1], 4) == [[(1, 2)]]
+        assert split_lanes([], 4) == []
+
+
+class TestParallelReindex(TestCase):
+
+    user_repo = TestGpBaseInjector.get(UserRepo)
+
+    def setUp(self):
+        User.objects.all().delete()
+        self.ids = [
+            User.objects.create(username=f"reindex.{i}", email=f"{i}@example.com").id
+            for i in range(5)
+        ]
+
+    def test_chunk_ranges_include_the_final_partial_chunk(self):
+        ranges = chunk_id_ranges(User.objects.all(), 2)
+        assert ranges == [
+            (self.ids[0], self.ids[1]),
+            (self.ids[2], self.ids[3]),
+            (self.ids[4], self.ids[4]),
+        ]
+
+    def test_keyset_batches_stay_within_the_bounds(self):
+        users = User.objects.all()
+        assert list(keyset_id_batches(users, 2)) == [
+            self.ids[0:2],
+            self.ids[2:4],
+            self.ids[4:5],
+        ]
+        assert list(
+            keyset_id_batches(users, 2, first_id=self.ids[1], last_id=self.ids[3])
+        ) == [self.ids[1:3], self.ids[3:4]]
+        assert list(keyset_id_batches(users, 5)) == [self.ids]
+
+    @patch.object(settings, "ELASTIC_REINDEX_BATCH_SIZE", 2)
+    def test_recreate_index_streams_every_row_once(self):
+        service = self.user_repo.es_instance
+        hydrated = []
+
+        def stream_add_docs(documents):
+            for doc in documents:
+                hydrated.append(doc.id)
+            return len(hydrated)
+
+        with patch.object(service, "stream_add_docs", side_effect=stream_add_docs):
+            with self.assertNumQueries(6):
+                # Three id batches, each hydrated with one query
+                self.user_repo.recreate_index()
+        assert sorted(hydrated) == self.ids
+
+    @patch("rest_api.services.elastic.helpers.streaming_bulk")
+    def test_stream_add_docs_serializes_each_document_once(self, streaming_bulk):
+        streaming_bulk.side_effect = lambda client, actions, **kwargs: (
+            (True, {"create": action}) for action in actions
+        )
+        docs = [MagicMock(**{"dict.return_value": {"id": id}}) for id in self.ids]
+        service = self.user_repo.es_instance
+
+        assert service.stream_add_docs(iter(docs)) == len(self.ids)
+        assert [doc.dict.call_count for doc in docs] == [1] * len(self.ids)
+        kwargs = streaming_bulk.call_args.kwargs
+        assert kwargs["max_chunk_bytes"] == settings.ELASTIC_BULK_MAX_BYTES
+        assert kwargs["raise_on_error"] is False
+
+        streaming_bulk.side_effect = lambda client, actions, **kwargs: (
+            (False, {"create": {"status": 400}}) for action in actions
+        )
+        with self.assertRaises(Exception):
+            service.stream_add_docs(iter(docs))
+
+    @patch.object(settings, "ELASTIC_REINDEX_CHUNK_SIZE", 2)
+    @patch.object(settings, "ELASTIC_REINDEX_CONCURRENCY", 2)
+    @patch("rest_api.tasks.elastic.chord")
+    def test_chunks_fan_out_in_lanes_and_finish_with_the_lock_token(self, chord):
+        with patch(
+            "rest_api.services.elastic.ElasticSearchService.begin_migration"
+        ) as begin:
+            start_parallel_reindex("user")
+        token = begin.call_args.args[0]
+
+        lanes = chord.call_args.args[0]
+        assert len(lanes) == 2
+        chunks = [task.args[-2:] for lane in lanes for task in lane.tasks]
+        assert sorted(chunks) == [
+            (self.ids[0], self.ids[1]),
+            (self.ids[2], self.ids[3]),
+            (self.ids[4], self.ids[4]),
+        ]
+        assert all(task.args[-3] == token for lane in lanes for task in lane.tasks)
+        callback = chord.return_value.call_args.args[0]
+        assert callback.args == ("user", token)
+
+    def test_chunks_keep_the_lock_alive(self):
+        with patch.object(ElasticSearchService, "extend_lock") as extend, patch.object(
+            UserRepo, "reindex_range", return_value=5
+        ):
+            assert reindex_chunk(3, "user", "token", self.ids[0], self.ids[4]) == 8
+        extend.assert_called_once_with("token")
+
+        service = self.user_repo.es_instance
+        with patch.object(service, "lock") as lock:
+            service.extend_lock("token")
+        assert lock.local.token == service.redis.get_encoder().encode("token")
+        lock.reacquire.assert_called_once_with()
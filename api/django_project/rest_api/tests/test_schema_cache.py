@@ -0,0 +1,89 @@
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from pydantic import BaseModel
+
+from django_project import settings
+from rest_api.utils.schema_cache import SchemaCache, decode, encode
+
+
+class ItemSchema(BaseModel):
+    id: int
+    name: str
+    created_at: datetime | None
+    tags: list[str] = []
+
+
+class RenamedItemSchema(BaseModel):
+    id: int
+    title: str
+
+
+class TestSchemaCache(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.items = SchemaCache("test_item", ItemSchema, ttl=60)
+        self.loader = MagicMock(
+            side_effect=lambda ids: {
+                id: ItemSchema(id=id, name=f"item {id}") for id in ids if id != 404
+            }
+        )
+
+    def test_misses_are_loaded_in_one_batch_then_served_from_cache(self):
+        assert set(self.items.get_many([1, 2, 404], self.loader)) == {1, 2}
+        self.loader.assert_called_once_with([1, 2, 404])
+
+        self.items.get_many([1, 2], self.loader)
+        self.items.local.clear()
+        assert self.items.get_many([1, 2], self.loader)[2].name == "item 2"
+        assert self.loader.call_count == 1
+
+        self.items.delete(1)
+        self.items.get_many([1, 2], self.loader)
+        self.loader.assert_called_with([1])
+
+    def test_cached_values_are_copies(self):
+        self.items.get(1, self.loader).name = "changed"
+        self.items.get(1, self.loader).tags.append("changed")
+        item = self.items.get(1, self.loader)
+        assert item.name == "item 1" and item.tags == []
+
+    def test_misses_in_a_transaction_are_not_stored(self):
+        with patch("rest_api.utils.schema_cache.in_transaction", return_value=True):
+            self.items.get(1, self.loader)
+            assert self.items.get(1, self.loader).name == "item 1"
+        assert self.loader.call_count == 2
+        assert self.items.local.get(self.items.key(1)) is None
+        assert cache.get(self.items.key(1)) is None
+
+    def test_keys_are_versioned_by_schema(self):
+        renamed = SchemaCache("test_item", RenamedItemSchema, ttl=60)
+        assert renamed.key(1) != self.items.key(1)
+        assert SchemaCache("test_item", ItemSchema, ttl=60).key(1) == self.items.key(1)
+
+    def test_codec_round_trip(self):
+        item = ItemSchema(id=1, name="a", created_at=datetime.now(timezone.utc))
+        expires_at, delta, payload = decode(encode(10.0, 0.5, item))
+        assert (expires_at, delta) == (10.0, 0.5)
+        assert ItemSchema.parse_obj(payload) == item
+
+    @patch.object(settings, "SCHEMA_CACHE_LOCK_WAIT_SECONDS", 0.05)
+    def test_waits_for_another_worker_then_loads(self):
+        cache.add(self.items.lock_key(1), 1, 10)
+        assert self.items.get(1, self.loader).name == "item 1"
+        self.loader.assert_called_once_with([1])
+
+    def test_early_expired_value_is_served_while_another_worker_refreshes(self):
+        self.items.get(1, self.loader)
+        self.items.local.clear()
+        cache.add(self.items.lock_key(1), 1, 10)
+        with patch.object(SchemaCache, "should_refresh", return_value=True):
+            assert self.items.get(1, self.loader).name == "item 1"
+        assert self.loader.call_count == 1
+
+        cache.delete(self.items.lock_key(1))
+        with patch.object(SchemaCache, "should_refresh", return_value=True):
+            self.items.get(1, self.loader)
+        assert self.loader.call_count == 2
@@ -1,3 +1,7 @@
+from typing import Iterator
+
+from django.db.models import QuerySet
+
 from rest_api.services.elastic import ElasticSearchService
 
 
@@ -13,3 +17,60 @@ class ElasticMigration:
             self.es_service.handle_migration_exception()
         else:
             self.es_service.end_migration()
+
+
+def chunk_id_ranges(queryset: QuerySet, chunk_size: int) -> list[tuple[int, int]]:
+    """Split the rows of queryset into (first_id, last_id) ranges of at most
+    chunk_size rows. Only ids are read, and only range bounds are kept"""
+    ranges: list[tuple[int, int]] = []
+    first_id = last_id = None
+    count = 0
+    ids = queryset.order_by("id").values_list("id", flat=True)
+    for id in ids.iterator(chunk_size=10000):
+        if first_id is None:
+            first_id = id
+        last_id = id
+        count += 1
+        if count == chunk_size:
+            ranges.append((first_id, last_id))
+            first_id = None
+            count = 0
+    if first_id is not None:
+        ranges.append((first_id, last_id))
+    return ranges
+
+
+def keyset_id_batches(
+    queryset: QuerySet,
+    batch_size: int,
+    first_id: int | None = None,
+    last_id: int | None = None,
+) -> Iterator[list[int]]:
+    """Yield the ids of queryset in ascending batches of at most batch_size.
+
+    Each batch is its own query seeking past the last id seen, so every query
+    is an index range scan however deep into the table it is, and rows
+    written behind the cursor don't shift the following batches as they
+    would with OFFSET.
+    """
+    ids = queryset.order_by("id").values_list("id", flat=True)
+    if last_id is not None:
+        ids = ids.filter(id__lte=last_id)
+    cursor = first_id - 1 if first_id is not None else None
+    while True:
+        page = ids if cursor is None else ids.filter(id__gt=cursor)
+        batch = list(page[:batch_size])
+        if not batch:
+            return
+        yield batch
+        if len(batch) < batch_size:
+            return
+        cursor = batch[-1]
+
+
+def split_lanes(
+    ranges: list[tuple[int, int]], concurrency: int
+) -> list[list[tuple[int, int]]]:
+    """Deal ranges round-robin into at most concurrency lanes run in parallel"""
+    lanes = max(1, min(concurrency, len(ranges)))
+    return [ranges[lane::lanes] for lane in range(lanes) if ranges[lane::lanes]]
@@ -0,0 +1,136 @@
+from typing import Callable
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+
+from django_project import settings
+from rest_api.utils.schema_cache import LocalLRUCache
+
+
+class IdentityCache:
+    """Two-tier cache of user_id/org_id/slug to patient, staff and practice ids.
+
+    Positive practice slug lookups are kept in the in-process LRU and in
+    Redis. Patient, staff and org practice ids grant access to records, so
+    like negative results they only live in Redis, where an invalidation
+    (e.g. an org unlinked from its practice) reaches every worker.
+
+    Every entry records the generation of its key when it was loaded, and
+    invalidating moves the generation on. A value a concurrent reader loaded
+    before the write committed is therefore never served after it.
+    """
+
+    prefix = "identity"
+    missing = object()
+    grant_kinds = ("patient", "staff", "practice")
+
+    def __init__(self, local_ttl: float, redis_ttl: int, max_size: int):
+        self.local = LocalLRUCache(max_size=max_size, ttl=local_ttl)
+        self.redis_ttl = redis_ttl
+
+    def key(self, kind: str, value: int | str) -> str:
+        return f"{self.prefix}_{kind}:{value}"
+
+    def generation_key(self, key: str) -> str:
+        return f"{key}_generation"
+
+    def is_grant(self, key: str) -> bool:
+        # The separator after the kind keeps "practice" from matching slugs
+        return key.startswith(tuple(self.key(kind, "") for kind in self.grant_kinds))
+
+    def get_many(
+        self, loaders: dict[str, Callable[[], int | None]]
+    ) -> dict[str, int | None]:
+        result: dict[str, int | None] = {}
+        for key in loaders:
+            local_value = self.local.get(key, self.missing)
+            if local_value is not self.missing:
+                result[key] = local_value
+
+        remote_keys = [key for key in loaders if key not in result]
+        generations = {}
+        if remote_keys:
+            cached = cache.get_many(
+                remote_keys + [self.generation_key(key) for key in remote_keys]
+            )
+            for key in remote_keys:
+                generations[key] = cached.get(self.generation_key(key))
+                entry = cached.get(key)
+                if entry is not None and entry.get("generation") == generations[key]:
+                    result[key] = entry["id"]
+                    self._remember_locally(key, entry["id"])
+
+        loaded: dict[str, dict] = {}
+        for key, loader in loaders.items():
+            if key not in result:
+                result[key] = loader()
+                loaded[key] = {"id": result[key], "generation": generations[key]}
+                self._remember_locally(key, result[key])
+        if loaded:
+            cache.set_many(loaded, self.redis_ttl)
+
+        return result
+
+    def set_many(self, values: dict[str, int]) -> None:
+        """Store values in Redis only, where every process reads them. The
+        local tier is filled by each process's own lookups"""
+        generations = cache.get_many([self.generation_key(key) for key in values])
+        cache.set_many(
+            {
+                key: {"id": id, "generation": generations.get(self.generation_key(key))}
+                for key, id in values.items()
+            },
+            self.redis_ttl,
+        )
+
+    def invalidate(self, *keys: str) -> None:
+        """Drop entries now, and again on commit in case a concurrent read
+        re-cached the old value before the write became visible"""
+        self.delete(*keys)
+        transaction.on_commit(lambda: self.delete(*keys))
+
+    def delete(self, *keys: str) -> None:
+        for key in keys:
+            self.local.delete(key)
+        cache.set_many(
+            {self.generation_key(key): uuid4().hex for key in keys}, self.redis_ttl
+        )
+        cache.delete_many(list(keys))
+
+    def clear(self) -> None:
+        self.local.clear()
+
+    def _remember_locally(self, key: str, value: int | None) -> None:
+        if value is not None and not self.is_grant(key):
+            self.local.set(key, value)
+
+
+identity_cache = IdentityCache(
+    local_ttl=settings.IDENTITY_CACHE_LOCAL_TTL_SECONDS,
+    redis_ttl=settings.IDENTITY_CACHE_TTL_SECONDS,
+    max_size=settings.IDENTITY_CACHE_LOCAL_MAX_SIZE,
+)
+
+
+def invalidate_user_identity(*user_ids: int | None) -> None:
+    keys = []
+    for user_id in user_ids:
+        if user_id is not None:
+            keys += [
+                identity_cache.key("patient", user_id),
+                identity_cache.key("staff", user_id),
+            ]
+    if keys:
+        identity_cache.invalidate(*keys)
+
+
+def invalidate_org_identity(org_id: str | None) -> None:
+    if org_id:
+        identity_cache.invalidate(identity_cache.key("practice", org_id))
+
+
+def invalidate_practice_slug_identity(*slugs: str | None) -> None:
+    keys = [identity_cache.key("practice_slug", slug) for slug in slugs if slug]
+    if keys:
+        identity_cache.invalidate(*keys)
@@ -0,0 +1,90 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Any, Callable, Iterable, Iterator
+
+from opentelemetry import trace
+
+
+class IdentityMap:
+    """Unit of work cache of hydrated schemas, keyed by kind and primary key."""
+
+    def __init__(self):
+        self.entries: dict[str, dict[int, Any]] = defaultdict(dict)
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(
+        self,
+        kind: str,
+        ids: Iterable[int],
+        loader: Callable[[list[int]], dict[int, Any]],
+    ) -> dict[int, Any]:
+        entries = self.entries[kind]
+        wanted = set(ids)
+        missing = [id for id in wanted if id not in entries]
+        self.hits += len(wanted) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            entries.update(loader(missing))
+        return {id: entries[id] for id in wanted if id in entries}
+
+    def discard(self, kind: str, *ids: int | None) -> None:
+        for id in ids:
+            self.entries[kind].pop(id, None)
+
+
+_current_identity_map: ContextVar[IdentityMap | None] = ContextVar(
+    "identity_map", default=None
+)
+
+
+def get_identity_map() -> IdentityMap | None:
+    return _current_identity_map.get()
+
+
+def load_many(
+    kind: str, ids: Iterable[int], loader: Callable[[list[int]], dict[int, Any]]
+) -> dict[int, Any]:
+    identity_map = get_identity_map()
+    if identity_map is None:
+        unique_ids = list(set(ids))
+        return loader(unique_ids) if unique_ids else {}
+    return identity_map.get_many(kind, ids, loader)
+
+
+def forget(kind: str, *ids: int | None) -> None:
+    identity_map = get_identity_map()
+    if identity_map is not None:
+        identity_map.discard(kind, *ids)
+
+
+def begin_identity_map() -> Token:
+    return _current_identity_map.set(IdentityMap())
+
+
+def end_identity_map(token: Token) -> None:
+    identity_map = get_identity_map()
+    if identity_map is not None:
+        span = trace.get_current_span()
+        span.set_attribute("identity_map.hits", identity_map.hits)
+        span.set_attribute("identity_map.misses", identity_map.misses)
+    _current_identity_map.reset(token)
+
+
+@contextmanager
+def identity_map_scope() -> Iterator[IdentityMap]:
+    token = begin_identity_map()
+    try:
+        yield get_identity_map()
+    finally:
+        end_identity_map(token)
+
+
+class IdentityMapMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with identity_map_scope():
+            return self.get_response(request)
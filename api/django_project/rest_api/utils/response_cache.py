@@ -0,0 +1,102 @@
+import hashlib
+import time
+from typing import Any, Callable, Iterable
+
+from django.core.cache import cache
+from django.http import HttpRequest, HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+from rest_framework.renderers import JSONRenderer
+
+
+class RenderedResponseCache:
+    """
+    Final JSON bytes of public responses, keyed by lookup (slug, org id, page
+    url...) with a strong ETag taken from the content hash.
+
+    Every entry is tagged with what it was rendered from. Invalidating a tag
+    stamps it with a new version instead of finding and deleting entries, and
+    an entry is only served while the versions it was stored with are still
+    current. The ETag and tags are kept apart from the body, so a matching
+    If-None-Match is answered with a 304 without loading the payload.
+    """
+
+    renderer = JSONRenderer()
+
+    def __init__(self, name: str, ttl: int):
+        self.name = name
+        self.ttl = ttl
+
+    def meta_key(self, lookup: str) -> str:
+        return f"rendered_{self.name}_meta_{self.digest(lookup)}"
+
+    def body_key(self, lookup: str) -> str:
+        return f"rendered_{self.name}_body_{self.digest(lookup)}"
+
+    def version_key(self, tag: str) -> str:
+        return f"rendered_{self.name}_version_{tag}"
+
+    def versions(self, tags: Iterable[str]) -> dict[str, int]:
+        tags = list(tags)
+        stored = cache.get_many([self.version_key(tag) for tag in tags])
+        return {tag: stored.get(self.version_key(tag), 0) for tag in tags}
+
+    def respond(
+        self,
+        request: HttpRequest,
+        lookup: str,
+        prepare: Callable[[], tuple[list[str], Callable[[], Any]]],
+    ) -> HttpResponse:
+        """Serve the cached body for lookup, or call prepare(), which returns
+        the tags the response depends on and a function rendering its data,
+        and cache the result"""
+        meta = cache.get(self.meta_key(lookup))
+        if meta is not None and self.versions(meta["versions"]) == meta["versions"]:
+            if self.matches(request, meta["etag"]):
+                response = HttpResponseNotModified()
+                response["ETag"] = meta["etag"]
+                return response
+            body = cache.get(self.body_key(lookup))
+            if body is not None:
+                return self.response(body, meta["etag"])
+
+        tags, render = prepare()
+        # Read before rendering: a write during the render moves a version
+        # on, so the body is stored as already stale instead of as current
+        versions = self.versions(tags)
+        body = self.renderer.render(render())
+        etag = quote_etag(hashlib.sha1(body).hexdigest())
+        cache.set_many(
+            {
+                self.meta_key(lookup): {"etag": etag, "versions": versions},
+                self.body_key(lookup): body,
+            },
+            self.ttl,
+        )
+        if self.matches(request, etag):
+            response = HttpResponseNotModified()
+            response["ETag"] = etag
+            return response
+        return self.response(body, etag)
+
+    def invalidate(self, *tags: str) -> None:
+        version = time.time_ns()
+        cache.set_many({self.version_key(tag): version for tag in tags}, None)
+
+    @staticmethod
+    def digest(lookup: str) -> str:
+        # Lookups can be full urls, keep keys short and free of odd characters
+        return hashlib.sha1(lookup.encode()).hexdigest()
+
+    @staticmethod
+    def matches(request: HttpRequest, etag: str) -> bool:
+        if_none_match = request.headers.get("If-None-Match")
+        if not if_none_match:
+            return False
+        etags = [tag.removeprefix("W/") for tag in parse_etags(if_none_match)]
+        return "*" in etags or etag in etags
+
+    @staticmethod
+    def response(body: bytes, etag: str) -> HttpResponse:
+        response = HttpResponse(body, content_type="application/json")
+        response["ETag"] = etag
+        return response
@@ -0,0 +1,290 @@
+import hashlib
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from datetime import time as dt_time
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Callable, Generic, Iterable, TypeVar
+from uuid import UUID
+
+import msgpack
+from django.core.cache import cache
+from django.db import transaction
+from opentelemetry import metrics
+from pydantic import BaseModel
+
+from django_project import settings
+from rest_api.utils.identity_map import forget
+
+SchemaT = TypeVar("SchemaT", bound=BaseModel)
+
+meter = metrics.get_meter(__name__)
+hits_counter = meter.create_counter("schema_cache.hits")
+misses_counter = meter.create_counter("schema_cache.misses")
+load_latency = meter.create_histogram("schema_cache.load_latency", unit="ms")
+
+
+class LocalLRUCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[Any, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+def in_transaction() -> bool:
+    """Whether this runs inside a transaction the code opened, whose reads may
+    see rows that are rolled back. TestCase's own wrapping atomic blocks don't
+    count, as for durable atomic blocks."""
+    return any(
+        not getattr(block, "_from_testcase", False)
+        for block in transaction.get_connection().atomic_blocks
+    )
+
+
+def _encode_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date, dt_time)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Cannot encode {type(value)}")
+
+
+def encode(expires_at: float, delta: float, value: BaseModel) -> bytes:
+    return msgpack.packb(
+        [expires_at, delta, value.dict()], default=_encode_default, use_bin_type=True
+    )
+
+
+def decode(raw: bytes) -> tuple[float, float, dict]:
+    expires_at, delta, payload = msgpack.unpackb(raw, raw=False)
+    return expires_at, delta, payload
+
+
+class SchemaCache(Generic[SchemaT]):
+    """
+    Two-tier read-through cache of pydantic schemas keyed by id.
+
+    An in-process LRU with a short TTL sits in front of Redis. Keys include a
+    fingerprint of the schema so a deploy that changes its shape never reads
+    old entries. Misses are loaded in one batch behind a per-key Redis lock so
+    only one worker recomputes a hot entry, and entries are refreshed slightly
+    before they expire (XFetch) so they don't all expire at once.
+
+    Misses inside a transaction are loaded but not stored in either tier, as
+    the transaction's own uncommitted writes would otherwise be served to
+    other readers, and after a rollback. Both tiers hand out deep copies.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        schema: type[SchemaT],
+        ttl: int,
+        version: int = 1,
+        local_ttl: float | None = None,
+        local_max_size: int | None = None,
+        on_delete: Callable[[list[int]], None] | None = None,
+    ):
+        self.name = name
+        self.schema = schema
+        self.ttl = ttl
+        self.local = LocalLRUCache(
+            max_size=local_max_size or settings.SCHEMA_CACHE_LOCAL_MAX_SIZE,
+            ttl=local_ttl or settings.SCHEMA_CACHE_LOCAL_TTL_SECONDS,
+        )
+        fingerprint = hashlib.sha1(schema.schema_json().encode()).hexdigest()[:8]
+        self.prefix = f"{name}:v{version}:{fingerprint}"
+        self.attributes = {"cache": name}
+        self.on_delete = on_delete
+        schema_caches[name] = self
+
+    def key(self, id: int) -> str:
+        return f"{self.prefix}:{id}"
+
+    def lock_key(self, id: int) -> str:
+        return f"{self.key(id)}:lock"
+
+    def get_many(
+        self,
+        ids: Iterable[int],
+        loader: Callable[[list[int]], dict[int, SchemaT]],
+    ) -> dict[int, SchemaT]:
+        wanted = list(dict.fromkeys(ids))
+        result: dict[int, SchemaT] = {}
+        for id in wanted:
+            value = self.local.get(self.key(id))
+            if value is not None:
+                result[id] = value.copy(deep=True)
+        self._record(hits_counter, "local", len(result))
+
+        remote_ids = [id for id in wanted if id not in result]
+        stale: dict[int, SchemaT] = {}
+        if remote_ids:
+            cached = cache.get_many([self.key(id) for id in remote_ids])
+            now = time.time()
+            for id in remote_ids:
+                raw = cached.get(self.key(id))
+                if raw is None:
+                    continue
+                expires_at, delta, payload = decode(raw)
+                value = self.schema.parse_obj(payload)
+                if self.should_refresh(expires_at, delta, now):
+                    stale[id] = value
+                    continue
+                result[id] = value
+                self.local.set(self.key(id), value.copy(deep=True))
+            self._record(hits_counter, "redis", len(cached) - len(stale))
+
+        missing = [id for id in wanted if id not in result]
+        if missing:
+            self._record(misses_counter, "redis", len(missing))
+            if in_transaction():
+                result.update(loader(missing))
+            else:
+                result.update(self._load(missing, loader, stale))
+        return result
+
+    def get(
+        self, id: int, loader: Callable[[list[int]], dict[int, SchemaT]]
+    ) -> SchemaT | None:
+        return self.get_many([id], loader).get(id)
+
+    def set_many(self, values: dict[int, SchemaT], delta: float = 0.0) -> None:
+        if not values:
+            return
+        expires_at = time.time() + self.ttl
+        cache.set_many(
+            {self.key(id): encode(expires_at, delta, v) for id, v in values.items()},
+            self.ttl,
+        )
+        for id, value in values.items():
+            self.local.set(self.key(id), value.copy(deep=True))
+
+    def delete(self, *ids: int | None) -> None:
+        ids = [id for id in ids if id is not None]
+        keys = [self.key(id) for id in ids]
+        for key in keys:
+            self.local.delete(key)
+        if keys:
+            cache.delete_many(keys)
+            if self.on_delete is not None:
+                self.on_delete(ids)
+
+    def invalidate(self, *ids: int | None) -> None:
+        """Drop entries now, and again on commit in case a concurrent read
+        re-cached the old value before the write became visible"""
+        self.delete(*ids)
+        transaction.on_commit(lambda: self.delete(*ids))
+
+    def should_refresh(self, expires_at: float, delta: float, now: float) -> bool:
+        beta = settings.SCHEMA_CACHE_EARLY_EXPIRY_BETA
+        return now - delta * beta * math.log(1.0 - random.random()) >= expires_at
+
+    def _load(
+        self,
+        ids: list[int],
+        loader: Callable[[list[int]], dict[int, SchemaT]],
+        stale: dict[int, SchemaT],
+    ) -> dict[int, SchemaT]:
+        timeout = settings.SCHEMA_CACHE_LOCK_TIMEOUT_SECONDS
+        leaders = [id for id in ids if cache.add(self.lock_key(id), 1, timeout)]
+        result: dict[int, SchemaT] = {}
+        if leaders:
+            try:
+                result.update(self._load_and_store(leaders, loader))
+            finally:
+                cache.delete_many([self.lock_key(id) for id in leaders])
+
+        # Someone else is recomputing these: serve the early-expired copy if we
+        # have one, otherwise wait briefly for the leader to publish it
+        waiting = []
+        for id in ids:
+            if id in leaders:
+                continue
+            if id in stale:
+                result[id] = stale[id]
+            else:
+                waiting.append(id)
+        if waiting:
+            result.update(self._wait_for(waiting, loader))
+        return result
+
+    def _wait_for(
+        self, ids: list[int], loader: Callable[[list[int]], dict[int, SchemaT]]
+    ) -> dict[int, SchemaT]:
+        result: dict[int, SchemaT] = {}
+        deadline = time.monotonic() + settings.SCHEMA_CACHE_LOCK_WAIT_SECONDS
+        while ids and time.monotonic() < deadline:
+            time.sleep(0.02)
+            cached = cache.get_many([self.key(id) for id in ids])
+            for id in ids:
+                raw = cached.get(self.key(id))
+                if raw is not None:
+                    result[id] = self.schema.parse_obj(decode(raw)[2])
+            ids = [id for id in ids if id not in result]
+        if ids:
+            result.update(self._load_and_store(ids, loader))
+        return result
+
+    def _load_and_store(
+        self, ids: list[int], loader: Callable[[list[int]], dict[int, SchemaT]]
+    ) -> dict[int, SchemaT]:
+        started = time.perf_counter()
+        loaded = loader(ids)
+        delta = time.perf_counter() - started
+        load_latency.record(delta * 1000, self.attributes)
+        self.set_many(loaded, delta)
+        return loaded
+
+    def _record(self, counter, tier: str, count: int) -> None:
+        if count > 0:
+            counter.add(count, {**self.attributes, "tier": tier})
+
+
+schema_caches: dict[str, SchemaCache] = {}
+
+
+def evict(name: str, *ids: int | None) -> None:
+    """Forget ids from the request identity map and invalidate their cache entries"""
+    forget(name, *ids)
+    if name in schema_caches:
+        schema_caches[name].invalidate(*ids)
+
+
+def clear_local_caches() -> None:
+    for schema_cache in schema_caches.values():
+        schema_cache.local.clear()
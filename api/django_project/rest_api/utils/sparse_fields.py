@@ -0,0 +1,27 @@
+from pydantic import BaseModel
+
+
+def split_param(value: str | None) -> set[str] | None:
+    if value is None:
+        return None
+    return {x.strip() for x in value.split(",") if x.strip()}
+
+
+def get_sparse_fieldset(
+    query_params, schema: type[BaseModel], summary_schema: type[BaseModel]
+) -> tuple[set[str] | None, set[str] | None]:
+    """
+    Read ?fields= and ?expand= into the fields to render and the relations to
+    hydrate. Without either parameter the full schema is returned, otherwise rows
+    are cut down to the summary schema plus whatever was asked for.
+    """
+    fields = split_param(query_params.get("fields"))
+    expand = split_param(query_params.get("expand"))
+    if fields is None and expand is None:
+        return None, None
+
+    expandable = set(schema.__fields__) - set(summary_schema.__fields__)
+    expand = ((expand or set()) | (fields or set())) & expandable
+    if fields is None:
+        fields = set(summary_schema.__fields__) | expand
+    return fields, expand
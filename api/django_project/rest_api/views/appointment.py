@@ -5,6 +5,7 @@ from rest_framework.response import Response
 from rest_framework.schemas.openapi import AutoSchema
 from rest_framework.views import APIView
 
+from django_project import settings
 from django_project.auth_utils import requires_scopes
 from rest_api.analytics.appointment import AppointmentAnalytics
 from rest_api.analytics.schema import AppointmentAnalyticsSchema
@@ -12,17 +13,22 @@ from rest_api.factory.repo import GpBaseInjector
 from rest_api.models.appointment import AppointmentDocumentModel, AppointmentModel
 from rest_api.repositories.appointment import AppointmentRepo
 from rest_api.repositories.permissions import (
+    ObjectPermissionFilter,
     PatientPermissionReadWrite,
     StaffPermission,
 )
 from rest_api.repositories.utils import convert_practice_slug_to_id
-from rest_api.schemas.appointment import AppointmentSchema
+from rest_api.schemas.appointment import (
+    AppointmentSchema,
+    AppointmentSummarySchema,
+)
 from rest_api.serializers.appointment import (
     AppointmentAnalyticsSchemaSerializer,
     AppointmentSerializer,
 )
 from rest_api.serializers.common import StatesSerializer
 from rest_api.utils.request_handler import get_request_meta_data
+from rest_api.utils.sparse_fields import get_sparse_fieldset
 
 
 class AppointmentPagination(PageNumberPagination):
@@ -95,12 +101,14 @@ class GetAppointmentView(
 
 class ListAppointmentView(CommonAppointmentView, generics.ListAPIView):
     pagination_class = AppointmentPagination
-    filter_backends = [filters.OrderingFilter]
+    filter_backends = [ObjectPermissionFilter, filters.OrderingFilter]
     ordering_fields = ["-updated_at"]
 
     @requires_scopes(["get:appointment"])
     def list(self, request, *args, **kwargs):
         meta = get_request_meta_data(request)
+        # The caller's own list: a staff identity must not widen it to the
+        # practice, so the permission filter only narrows it further
         queryset = self.filter_queryset(
             self.get_queryset()
             .filter(patient_id=meta.patient_id)
@@ -108,13 +116,11 @@ class ListAppointmentView(CommonAppointmentView, generics.ListAPIView):
         )
         page = self.paginate_queryset(queryset)
         if page is not None:
-            q = list(
-                map(
-                    lambda x: self.repo.get(x.id),
-                    page,
-                )
+            fields, expand = get_sparse_fieldset(
+                request.query_params, AppointmentSchema, AppointmentSummarySchema
             )
-            serializer = self.get_serializer(q, many=True)
+            q = self.repo.get_many([x.id for x in page], expand=expand)
+            serializer = self.get_serializer(q, many=True, fields=fields)
             return self.get_paginated_response(serializer.data)
 
         serializer = self.get_serializer(queryset, many=True)
@@ -156,7 +162,7 @@ class GetAppointmentStateView(CommonAppointmentView, generics.RetrieveAPIView):
 
 class ListAppointmentByPracticeStateView(CommonAppointmentView, generics.ListAPIView):
     pagination_class = AppointmentPagination
-    filter_backends = [filters.OrderingFilter]
+    filter_backends = [ObjectPermissionFilter, filters.OrderingFilter]
     ordering_fields = ["-updated_at"]
     permission_classes = [StaffPermission]
     practice_id_arg = "pk"
@@ -182,13 +188,15 @@ class ListAppointmentByPracticeStateView(CommonAppointmentView, generics.ListAPI
         )
         page = self.paginate_queryset(queryset)
         if page is not None:
-            q = list(
-                map(
-                    lambda x: self.repo.get(x.id),
-                    page,
-                )
+            ids = [x.id for x in page]
+            fields, expand = get_sparse_fieldset(
+                request.query_params, AppointmentSchema, AppointmentSummarySchema
             )
-            serializer = self.get_serializer(q, many=True)
+            if settings.ELASTIC_READ_PATH_ENABLED:
+                q = self.repo.get_many_from_index(ids)
+            else:
+                q = self.repo.get_many(ids, expand=expand)
+            serializer = self.get_serializer(q, many=True, fields=fields)
             return self.get_paginated_response(serializer.data)
 
         serializer = self.get_serializer(queryset, many=True)
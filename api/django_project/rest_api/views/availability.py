@@ -102,12 +102,9 @@ class ListAvailabilityByTeamMemberView(
             .order_by("-updated_at")
         )
 
-        q = list(
-            map(
-                lambda x: self.repo.get(x.id),
-                queryset,
-            )
-        )
+        ids = [x.id for x in queryset]
+        availability = self.repo.get_many(ids)
+        q = [availability[id] for id in ids]
         serializer = self.get_serializer(q, many=True)
         return Response(
             data={
@@ -1,10 +1,14 @@
+from urllib.parse import urlencode
+
 from rest_framework import filters, generics, permissions, status
 from rest_framework.generics import GenericAPIView
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.schemas.openapi import AutoSchema
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
+from django_project import settings
 from django_project.auth_utils import requires_scopes
 from rest_api.factory.repo import GpBaseInjector
 from rest_api.models.practice import PracticeModel
@@ -22,11 +26,46 @@ class CommonPracticeView(APIView, AutoSchema):
     repo = GpBaseInjector.get(PracticeRepo)
     queryset = PracticeModel.objects.all()
 
+    def practice_page(self, id: int):
+        return [str(id)], lambda: self.serializer_class(self.repo.get(id)).data
+
+
+def list_ordering(request, queryset, view) -> list[str]:
+    # Later terms on a field already ordered by are no-ops, dropping them
+    # keeps the set of cached orderings finite
+    ordering = filters.OrderingFilter().get_ordering(request, queryset, view) or []
+    fields = {}
+    for term in ordering:
+        fields.setdefault(term.lstrip("-"), term)
+    return list(fields.values())
+
 
 class PracticePagination(PageNumberPagination):
     page_size = 50
     max_page_size = 50
 
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ordering = list_ordering(request, queryset, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_next_link(self):
+        if not self.page.has_next():
+            return None
+        return self.link(self.page.next_page_number())
+
+    def get_previous_link(self):
+        if not self.page.has_previous():
+            return None
+        return self.link(self.page.previous_page_number())
+
+    def link(self, page_number: int) -> str:
+        # Pages are cached for every caller, so links are built from the path
+        # and the params the page is cached by, not the Host header
+        params = {self.page_query_param: page_number}
+        if self.ordering:
+            params[api_settings.ORDERING_PARAM] = ",".join(self.ordering)
+        return f"{self.request.path}?{urlencode(params)}"
+
 
 class CreatePracticeView(
     CommonPracticeView,
@@ -78,20 +117,29 @@ class ListPracticeView(CommonPracticeView, generics.ListAPIView):
     permission_classes = [permissions.AllowAny]
 
     def list(self, request, *args, **kwargs):
+        # Keyed on the page and ordering only, so anonymous callers can't
+        # mint entries with made up query strings or Host headers
+        page = request.query_params.get(self.paginator.page_query_param, "1")
+        if not page.isdigit():
+            return Response(self.render_list())
+        ordering = list_ordering(request, self.queryset, self)
+        return self.repo.responses.respond(
+            request,
+            f"list_{int(page)}_{','.join(ordering)}",
+            lambda: ([self.repo.LIST_TAG], self.render_list),
+        )
+
+    def render_list(self):
         queryset = self.filter_queryset(self.get_queryset())
         page = self.paginate_queryset(queryset)
         if page is not None:
-            q = list(
-                map(
-                    lambda x: self.repo.get(x.id),
-                    page,
-                )
-            )
+            practices = self.repo.get_many([x.id for x in page])
+            q = [practices[x.id] for x in page]
             serializer = self.get_serializer(q, many=True)
-            return self.get_paginated_response(serializer.data)
-
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+            data = self.get_paginated_response(serializer.data).data
+        else:
+            data = self.get_serializer(queryset, many=True).data
+        return data
 
 
 class SearchPracticeView(CommonPracticeView, generics.ListAPIView):
@@ -101,18 +149,22 @@ class SearchPracticeView(CommonPracticeView, generics.ListAPIView):
         name = self.request.query_params.get("name")
         size = int(self.request.query_params.get("size", "10"))
         search_result = self.repo.search(name, size)
+        if settings.ELASTIC_READ_PATH_ENABLED:
+            return search_result
         return self.queryset.filter(id__in=[x.id for x in search_result])
 
     def list(self, request, *args, **kwargs):
+        if settings.ELASTIC_READ_PATH_ENABLED:
+            # Hits already carry the summary document, no DB round trip needed
+            page = self.paginate_queryset(self.get_queryset())
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
         queryset = self.filter_queryset(self.get_queryset())
         page = self.paginate_queryset(queryset)
         if page is not None:
-            q = list(
-                map(
-                    lambda x: self.repo.get(x.id),
-                    page,
-                )
-            )
+            practices = self.repo.get_many([x.id for x in page])
+            q = [practices[x.id] for x in page]
             serializer = self.get_serializer(q, many=True)
             return self.get_paginated_response(serializer.data)
 
@@ -166,10 +218,11 @@ class GetPracticeBySlugView(CommonPracticeView, generics.RetrieveAPIView):
     lookup_field = "slug"
 
     def get(self, request, *args, **kwargs):
-        instance = self.repo.get_model_by_slug(kwargs["slug"])
-        result = self.repo.get(instance.id)
-        return Response(
-            data=self.serializer_class(result).data, status=status.HTTP_200_OK
+        slug = kwargs["slug"]
+        return self.repo.responses.respond(
+            request,
+            f"slug_{slug}",
+            lambda: self.practice_page(self.repo.get_id_by_slug(slug)),
         )
 
 
@@ -178,10 +231,11 @@ class GetPracticeByOrgIDView(CommonPracticeView, generics.RetrieveAPIView):
     lookup_field = "org_id"
 
     def get(self, request, *args, **kwargs):
-        instance = self.repo.get_model_by_org_id(kwargs["org_id"])
-        result = self.repo.get(instance.id)
-        return Response(
-            data=self.serializer_class(result).data, status=status.HTTP_200_OK
+        org_id = kwargs["org_id"]
+        return self.repo.responses.respond(
+            request,
+            f"org_{org_id}",
+            lambda: self.practice_page(self.repo.get_id_by_org_id(org_id)),
         )
 
 
@@ -190,7 +244,11 @@ class FeatureFlagsView(CommonPracticeView, generics.RetrieveAPIView):
     serializer_class = AllFeatureFlagsSerializer
 
     def get(self, request, *args, **kwargs):
-        flags = self.repo.feature_flags
-        return Response(
-            data=self.serializer_class({"flags": flags}).data, status=status.HTTP_200_OK
+        return self.repo.responses.respond(
+            request,
+            f"feature_flags_v{self.repo.FEATURE_FLAGS_VERSION}",
+            lambda: (
+                [],
+                lambda: self.serializer_class({"flags": self.repo.feature_flags}).data,
+            ),
         )
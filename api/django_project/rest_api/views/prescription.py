@@ -11,18 +11,23 @@ from rest_api.analytics.schema import PrescriptionAnalyticsSchema
 from rest_api.factory.repo import GpBaseInjector
 from rest_api.models.prescription import PrescriptionModel
 from rest_api.repositories.permissions import (
+    ObjectPermissionFilter,
     PatientPermissionReadWrite,
     StaffPermission,
 )
 from rest_api.repositories.prescription import PrescriptionRepo
 from rest_api.repositories.utils import convert_practice_slug_to_id
-from rest_api.schemas.prescription import PrescriptionSchema
+from rest_api.schemas.prescription import (
+    PrescriptionSchema,
+    PrescriptionSummarySchema,
+)
 from rest_api.serializers.common import StatesSerializer
 from rest_api.serializers.prescription import (
     PrescriptionAnalyticsSchemaSerializer,
     PrescriptionSerializer,
 )
 from rest_api.utils.request_handler import get_request_meta_data
+from rest_api.utils.sparse_fields import get_sparse_fieldset
 
 
 class PrescriptionPagination(PageNumberPagination):
@@ -95,12 +100,14 @@ class GetPrescriptionView(
 
 class ListPrescriptionView(CommonPrescriptionView, generics.ListAPIView):
     pagination_class = PrescriptionPagination
-    filter_backends = [filters.OrderingFilter]
+    filter_backends = [ObjectPermissionFilter, filters.OrderingFilter]
     ordering_fields = ["-updated_at"]
 
     @requires_scopes(["get:prescription"])
     def list(self, request, *args, **kwargs):
         meta = get_request_meta_data(request)
+        # The caller's own list: a staff identity must not widen it to the
+        # practice, so the permission filter only narrows it further
         queryset = self.filter_queryset(
             self.get_queryset()
             .filter(patient_id=meta.patient_id)
@@ -108,13 +115,11 @@ class ListPrescriptionView(CommonPrescriptionView, generics.ListAPIView):
         )
         page = self.paginate_queryset(queryset)
         if page is not None:
-            q = list(
-                map(
-                    lambda x: self.repo.get(x.id),
-                    page,
-                )
+            fields, expand = get_sparse_fieldset(
+                request.query_params, PrescriptionSchema, PrescriptionSummarySchema
             )
-            serializer = self.get_serializer(q, many=True)
+            q = self.repo.get_many([x.id for x in page], expand=expand)
+            serializer = self.get_serializer(q, many=True, fields=fields)
             return self.get_paginated_response(serializer.data)
 
         serializer = self.get_serializer(queryset, many=True)
@@ -132,7 +137,7 @@ class GetPrescriptionStateView(CommonPrescriptionView, generics.RetrieveAPIView)
 
 class ListPrescriptionByPracticeStateView(CommonPrescriptionView, generics.ListAPIView):
     pagination_class = PrescriptionPagination
-    filter_backends = [filters.OrderingFilter]
+    filter_backends = [ObjectPermissionFilter, filters.OrderingFilter]
     ordering_fields = ["-updated_at"]
     permission_classes = [StaffPermission]
     practice_id_arg = "pk"
@@ -158,13 +163,11 @@ class ListPrescriptionByPracticeStateView(CommonPrescriptionView, generics.ListA
         )
         page = self.paginate_queryset(queryset)
         if page is not None:
-            q = list(
-                map(
-                    lambda x: self.repo.get(x.id),
-                    page,
-                )
+            fields, expand = get_sparse_fieldset(
+                request.query_params, PrescriptionSchema, PrescriptionSummarySchema
             )
-            serializer = self.get_serializer(q, many=True)
+            q = self.repo.get_many([x.id for x in page], expand=expand)
+            serializer = self.get_serializer(q, many=True, fields=fields)
             return self.get_paginated_response(serializer.data)
 
         serializer = self.get_serializer(queryset, many=True)